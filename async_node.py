@@ -0,0 +1,510 @@
+import asyncio
+import collections
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+import framing
+from connection_pool import AsyncConnectionPool
+from gossip_cache import gossip_batch
+from peer import PeerNode
+from scheduler import LoopScheduler
+from seed import SeedNode
+from udp_probe import ProbeChannel, process_group
+
+
+class ConnectionLimit:
+    # asyncio counterpart of the inbound WorkerPool: at most limit streams
+    # are served at once. Past that "reject" closes the new stream,
+    # "drop-oldest" closes the longest open one, and "delay" leaves the new
+    # one unread until another stream ends.
+    def __init__(self, limit=256, policy="reject"):
+        self.limit = limit
+        self.policy = policy
+        self.active = {}  # writer -> None, oldest first
+        self.waiters = collections.deque()  # futures of delayed streams
+        self.stats = {"accepted": 0, "rejected": 0, "dropped": 0, "delayed": 0, "peak": 0}
+
+    async def admit(self, writer):
+        # False when the stream was shed
+        if len(self.active) >= self.limit:
+            if self.policy == "reject":
+                self.stats["rejected"] += 1
+                writer.close()
+                return False
+            if self.policy == "drop-oldest":
+                self.stats["dropped"] += 1
+                oldest = next(iter(self.active))
+                self.active.pop(oldest)
+                oldest.close()
+            else:
+                self.stats["delayed"] += 1
+                while len(self.active) >= self.limit:
+                    waiter = asyncio.get_running_loop().create_future()
+                    self.waiters.append(waiter)
+                    await waiter
+        self.active[writer] = None
+        self.stats["accepted"] += 1
+        self.stats["peak"] = max(self.stats["peak"], len(self.active))
+        return True
+
+    def release(self, writer):
+        self.active.pop(writer, None)
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    def metrics(self):
+        return dict(self.stats, active=len(self.active), limit=self.limit)
+
+
+class ProbeProtocol(asyncio.DatagramProtocol):
+    # hands liveness datagrams to the node's probe channel, acks go back
+    # to where the ping came from
+    def __init__(self, node):
+        self.node = node
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            reply = self.node.probe_channel.received(data)
+        except ValueError:
+            self.node.log.echo("Dropped malformed liveness datagram from {}", addr)
+            return
+        if reply is not None:
+            self.transport.sendto(reply, addr)
+
+    def error_received(self, exc):
+        # e.g. an ICMP port unreachable, the liveness timeout handles it
+        pass
+
+
+class AsyncPeerNode(PeerNode):
+    # Same protocol and message handling as PeerNode, but every connection
+    # and outgoing message is a task on one event loop instead of a thread
+    def __init__(self, host, port):
+        super().__init__(host, port)
+        self.pool = AsyncConnectionPool()
+        self.tasks = set()
+        self.server = None
+        self.connection_limit = ConnectionLimit()
+        self.metrics.gauge("tasks", lambda: len(self.tasks))
+        self.metrics.gauge("inbound", lambda: self.connection_limit.metrics())
+
+    async def start(self):
+        self.scheduler = LoopScheduler(asyncio.get_running_loop())
+        # the inbound pool's size and policy bound the streams served at once
+        self.connection_limit = ConnectionLimit(self.inbound.max_workers, self.inbound.policy)
+        self.server = await asyncio.start_server(
+            self.handle_peer_connection,
+            self.host,
+            self.port,
+            backlog=self.backlog,
+            reuse_address=self.reuse_address,
+        )
+        self.log.echo("Peer_host listening on {}:{}", self.host, self.port)
+        self.listening_ready.set()
+        self.connect_to_seeds()
+        await self.start_probes()
+        self.liveness.start()
+        self.start_dissemination()
+        self.start_membership()
+        self.topology.start()
+        self.start_snapshots()
+
+    def stop(self):
+        self.stopped.set()
+        self.scheduler.stop()
+        if self.server is not None:
+            self.server.close()
+        for writer in list(self.connections):
+            writer.close()
+        for task in list(self.tasks):
+            task.cancel()
+        self.pool.close()
+        self.stop_probes()
+
+    async def start_probes(self):
+        if self.liveness_transport != "udp":
+            return
+        try:
+            self.probe_socket, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                lambda: ProbeProtocol(self), local_addr=(self.host, self.port)
+            )
+        except OSError:
+            self.log.echo("Failed to bind liveness port {}, probing over tcp", self.port)
+            return
+        self.probe_channel = ProbeChannel(self, process_group(self.host))
+        self.probe_channel.start()
+        self.metrics.gauge("probes", lambda: self.probe_channel.metrics())
+
+    def send_datagram(self, port, datagram):
+        # the datagram transport stands in for the probe socket
+        self.probe_socket.sendto(datagram, (self.host, port))
+
+    def run_task(self, target, *args, on_drop=None):
+        # tasks are never shed on the event loop, on_drop is not needed
+        result = target(*args)
+        if asyncio.iscoroutine(result):
+            task = asyncio.get_running_loop().create_task(result)
+            # keep a reference so the task is not garbage collected early
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def handle_peer_connection(self, reader, writer):
+        self.metrics.count("accepted")
+        if not await self.connection_limit.admit(writer):
+            return
+        self.connections[writer] = None
+        frames = framing.FrameReader()
+        try:
+            while True:
+                data = await asyncio.wait_for(reader.read(65536), self.inbound_idle_timeout)
+                if not data:
+                    break
+                frames.feed(data)
+                for message in frames.messages():
+                    self.handle_message(message)
+            message = frames.finish()
+            if message:
+                self.handle_message(message)
+        except (OSError, ValueError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.connections.pop(writer, None)
+            self.connection_limit.release(writer)
+            writer.close()
+
+    async def send_to_node(self, node_port, message, *extra):
+        if self.stopped.is_set():
+            raise ConnectionAbortedError("node is stopped")
+        if self.wire_format == "text":
+            for item in (message, *extra):
+                await self.send_legacy(node_port, item)
+            return
+        data = b"".join(framing.encode_message(item) for item in (message, *extra))
+        await self.pool.send(self.host, node_port, data)
+
+    async def send_legacy(self, node_port, message):
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, node_port), self.pool.connect_timeout
+        )
+        try:
+            writer.write(message.encode())
+            await asyncio.wait_for(writer.drain(), self.pool.send_timeout)
+        finally:
+            writer.close()
+        self.metrics.count("legacy_connections")
+
+    async def connect_to_seednode(self, node_port, attempt):
+        started = time.perf_counter()
+        try:
+            replies = await self.seed_request(node_port, self.register_message())
+        except (OSError, ValueError, asyncio.TimeoutError):
+            self.metrics.count("registration_failures")
+            self.log.echo("Failed to connect to seednode on port: {}", node_port)
+            self.bootstrap.failed(node_port, attempt)
+            return
+        self.metrics.timed("registration_seconds", started)
+        self.log.echo("Connected to seednode on port: {}", node_port)
+        for message in replies:
+            self.process_seed_message(message)
+        self.bootstrap.succeeded(node_port)
+
+    def start_gossip(self):
+        self.run_task(self.gossip_message_generation)
+
+    async def seed_request(self, node_port, message):
+        # the whole exchange runs against the bootstrap deadline
+        return await asyncio.wait_for(self.seed_exchange(node_port, message), self.bootstrap.timeout)
+
+    async def seed_exchange(self, node_port, message):
+        reader, writer = await asyncio.open_connection(self.host, node_port)
+        try:
+            writer.write(self.encode(message))
+            await writer.drain()
+            # the seed closes the connection after its reply
+            frames = framing.FrameReader()
+            frames.feed(await reader.read())
+            replies = frames.messages()
+            message = frames.finish()
+            if message:
+                replies.append(message)
+            return replies
+        finally:
+            writer.close()
+
+    async def request_more_peers(self, seed_port, cursor=0, count=32):
+        try:
+            replies = await self.seed_request(seed_port, f"GET PEERS {cursor} {count}")
+        except (OSError, ValueError, asyncio.TimeoutError):
+            self.log.echo("Failed to request peers from seednode on port: {}", seed_port)
+            return 0
+        return self.process_more_peers(replies)
+
+    async def connect_to_peernode(self, node_port):
+        if node_port == self.port:
+            return
+        try:
+            await self.send_to_node(node_port, f"Neighbour Request:{self.port}")
+        except OSError:
+            self.log.echo("Failed to connect to peernode on port: {}", node_port)
+            self.topology.connect_failed(node_port)
+            return
+        self.peer_connected(node_port)
+
+    async def gossip_message_generation(self):
+        if self.workload is not None:
+            self.start_workload()
+            return
+        for _ in range(self.gossip_count):
+            self.generate_gossip_message()
+            await asyncio.sleep(self.gossip_interval)
+
+    async def send_gossip_message(self, peer_port, message):
+        try:
+            await self.send_to_node(peer_port, message, *self.piggyback())
+            self.log.echo("Sent gossip message to peer on port {}: {}", peer_port, message)
+        except OSError:
+            self.metrics.count("send_failures")
+            self.log.echo("Failed to send message to peer on port: {}", peer_port)
+
+    async def send_gossip_batch(self, peer_port, messages):
+        message = messages[0] if len(messages) == 1 else gossip_batch(messages)
+        self.metrics.count("gossip_batches")
+        try:
+            await self.send_to_node(peer_port, message, *self.piggyback())
+            self.log.echo("Sent {} gossip messages to peer on port {}", len(messages), peer_port)
+        except OSError:
+            self.metrics.count("send_failures")
+            self.log.echo("Failed to send message to peer on port: {}", peer_port)
+
+    async def send_peer_message(self, peer_port, message):
+        try:
+            await self.send_to_node(peer_port, message, *self.piggyback())
+        except OSError:
+            self.metrics.count("send_failures")
+            self.log.echo("Failed to send message to peer on port: {}", peer_port)
+
+    async def send_liveness_batch(self, peer_ports):
+        if self.probe_channel is not None:
+            self.send_probes(peer_ports)
+            return
+        message = f"Liveness Request:{int(self.clock())}:{self.port}"
+        await asyncio.gather(
+            *(self.send_liveness_message(peer_port, message) for peer_port in peer_ports)
+        )
+
+    async def send_liveness_message(self, peer_port, message):
+        try:
+            await self.send_to_node(peer_port, message, *self.piggyback())
+            self.log.echo("Sent liveness request to peer on port {}: {}", peer_port, message)
+        except OSError:
+            self.log.echo("Failed to send liveness request to peer on port: {}", peer_port)
+            self.liveness.probe_failed(peer_port)
+            self.record_liveness_failure(peer_port)
+
+    async def send_liveness_message_reply(self, peer_port, message):
+        try:
+            await self.send_to_node(peer_port, message, *self.piggyback())
+            self.log.echo("Sent liveness reply to peer on port {}: {}", peer_port, message)
+        except OSError:
+            self.log.echo("Failed to send liveness reply to peer on port: {}", peer_port)
+
+    async def send_dead_node_report(self, seed_port, dead):
+        try:
+            await self.send_to_node(seed_port, self.dead_nodes_message(dead))
+            self.dead_nodes_reported(seed_port, dead)
+        except OSError:
+            self.log.echo("Failed to send dead node message to seed on port: {}", seed_port)
+
+
+class AsyncSeedNode(SeedNode):
+    def __init__(self, host, port):
+        super().__init__(host, port)
+        self.server = None
+        self.cross_shard_task = None
+        self.sync_task = None
+        self.connection_limit = ConnectionLimit()
+        self.metrics.gauge("inbound", lambda: self.connection_limit.metrics())
+
+    async def start(self):
+        self.connection_limit = ConnectionLimit(self.inbound.max_workers, self.inbound.policy)
+        self.registry.start()
+        self.server = await asyncio.start_server(
+            self.handle_peer_connection,
+            self.host,
+            self.port,
+            backlog=self.backlog,
+            reuse_address=self.reuse_address,
+        )
+        self.log.echo("Seed node listening on {}:{}", self.host, self.port)
+        if self.sharded:
+            self.start_cross_shard()
+        if self.replication:
+            self.restore_replica()
+            self.start_sync()
+
+    def stop(self):
+        self.stopped.set()
+        if self.server is not None:
+            self.server.close()
+        if self.cross_shard_task is not None:
+            self.cross_shard_task.cancel()
+        if self.sync_task is not None:
+            self.sync_task.cancel()
+        self.registry.stop()
+        self.save_replica()
+
+    def start_cross_shard(self):
+        self.cross_shard_task = asyncio.get_running_loop().create_task(self.cross_shard_loop())
+
+    async def cross_shard_loop(self):
+        while not self.stopped.is_set():
+            await self.refresh_remote_samples()
+            await asyncio.sleep(self.cross_shard_interval)
+
+    async def refresh_remote_samples(self):
+        try:
+            seed_ports = self.other_seeds()
+        except (OSError, ValueError):
+            return
+        for seed_port in seed_ports:
+            try:
+                self.remote_sample_received(seed_port, await self.shard_request(seed_port))
+            except (OSError, ValueError, asyncio.TimeoutError):
+                self.remote_samples.pop(seed_port, None)
+
+    async def shard_request(self, seed_port):
+        return await self.seed_request(seed_port, f"SAMPLE PEERS {self.sample_size}")
+
+    async def seed_request(self, seed_port, message):
+        # connect and reply both count against request_timeout
+        return await asyncio.wait_for(self.seed_exchange(seed_port, message), self.request_timeout)
+
+    async def seed_exchange(self, seed_port, message):
+        reader, writer = await asyncio.open_connection(self.host, seed_port)
+        try:
+            writer.write(framing.encode_message(message))
+            await writer.drain()
+            # the other seed closes the connection after its reply
+            frames = framing.FrameReader()
+            frames.feed(await reader.read())
+            replies = frames.messages()
+            rest = frames.finish()
+            if rest:
+                replies.append(rest)
+        finally:
+            writer.close()
+        if not replies:
+            raise ValueError(f"no reply to {' '.join(message.split()[:2])}")
+        return replies[0]
+
+    def start_sync(self):
+        self.sync_task = asyncio.get_running_loop().create_task(self.sync_loop())
+
+    async def sync_loop(self):
+        while not self.stopped.is_set():
+            await asyncio.sleep(self.sync_interval)
+            await self.sync_round()
+
+    async def sync_round(self):
+        try:
+            seed_ports = self.other_seeds()
+        except (OSError, ValueError):
+            return
+        self.replica.expire()
+        if seed_ports:
+            await self.sync_with(self.rng.choice(seed_ports))
+        if time.monotonic() - self.replica_saved_at >= self.replica_interval:
+            self.save_replica()
+
+    async def sync_with(self, seed_port):
+        message = self.sync_request()
+        try:
+            while message is not None:
+                reply = await self.seed_request(seed_port, message)
+                message = self.sync_reply_received(seed_port, reply)
+        except (OSError, ValueError, asyncio.TimeoutError):
+            self.metrics.count("sync_failures")
+
+    async def handle_peer_connection(self, reader, writer):
+        addr = writer.get_extra_info("peername")
+        self.metrics.count("accepted")
+        if not await self.connection_limit.admit(writer):
+            return
+        frames = framing.FrameReader()
+        try:
+            while True:
+                data = await asyncio.wait_for(reader.read(65536), self.inbound_idle_timeout)
+                if not data:
+                    break
+                frames.feed(data)
+                for message in frames.messages():
+                    if not await self.reply(writer, addr, message, frames.binary):
+                        return
+                # an unterminated REGISTER comes from a legacy one-shot sender
+                if frames.pending_text().startswith("REGISTER"):
+                    await self.reply(writer, addr, frames.finish(), False)
+                    return
+                # frees the connection slot, as the threaded seed frees its worker
+                if not frames.buffered():
+                    return
+            message = frames.finish()
+            if message:
+                await self.reply(writer, addr, message, False)
+        except (OSError, ValueError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.connection_limit.release(writer)
+            writer.close()
+
+    async def reply(self, writer, addr, message, binary):
+        started = time.perf_counter()
+        response, keep_open = self.handle_message(addr, message)
+        if response is not None:
+            writer.write(self.encode_reply(response, binary))
+            await writer.drain()
+        self.metrics.timed("reply_seconds", started)
+        return keep_open
+
+
+def raise_file_limit():
+    # every simulated peer holds a listening socket plus pooled streams
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def run_peers(host, ports, configure=None):
+    async def main():
+        raise_file_limit()
+        peers = [AsyncPeerNode(host, port) for port in ports]
+        for peer in peers:
+            if configure is not None:
+                configure(peer)
+            await peer.start()
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def run_seed(host, port, configure=None):
+    async def main():
+        seed = AsyncSeedNode(host, port)
+        if configure is not None:
+            configure(seed)
+        await seed.start()
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
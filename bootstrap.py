@@ -0,0 +1,124 @@
+import threading
+
+
+class SeedBootstrap:
+    # Registers a peer with its seeds. All seeds are asked at once and every
+    # PEERS reply is merged as it arrives. The peer counts as bootstrapped
+    # once a quorum of floor(n / 2) + 1 seeds answered, or once every seed
+    # answered or failed its first attempt, so one slow or black-holed seed
+    # cannot hold it back. An attempt fails when the request fails or no
+    # answer came within timeout seconds; failed seeds are retried in the
+    # background with exponential backoff, up to max_attempts times.
+    # With failover the seeds are an ordered list of equivalent replicas:
+    # only the first quorum of them are asked, each failure moves on to the
+    # next seed in the list, and retries stop once one seed answered.
+    def __init__(self, node, timeout=3.0, retry_delay=0.5, max_retry_delay=30.0, max_attempts=8):
+        self.node = node
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_attempts = max_attempts
+        self.seeds = []
+        self.quorum = 0
+        self.failover = False
+        self.attempts = {}  # seed port -> attempts made
+        self.in_flight = {}  # seed port -> number of the attempt waiting for an answer
+        self.answered = set()
+        self.settled = set()  # answered, or failed at least once
+        self.started_at = None
+        self.done = False
+        self.lock = threading.Lock()
+        self.stats = {"attempts": 0, "answers": 0, "failures": 0, "timeouts": 0, "retries": 0}
+
+    def start(self, seed_ports, quorum=None, failover=False):
+        self.seeds = list(seed_ports)
+        if quorum is None:
+            quorum = len(self.seeds) // 2 + 1
+        self.quorum = min(quorum, len(self.seeds))
+        self.failover = failover
+        self.started_at = self.node.scheduler.now()
+        if not self.seeds:
+            self.finish()
+            return
+        for seed_port in self.seeds[:self.quorum] if failover else self.seeds:
+            self.attempt(seed_port)
+
+    def attempt(self, seed_port):
+        with self.lock:
+            if seed_port in self.answered or (self.failover and self.answered):
+                return
+            number = self.attempts.get(seed_port, 0) + 1
+            self.attempts[seed_port] = number
+            self.in_flight[seed_port] = number
+            self.stats["attempts"] += 1
+        self.node.scheduler.call_later(self.timeout, self.expired, seed_port, number)
+        self.node.run_task(self.node.connect_to_seednode, seed_port, number)
+
+    def expired(self, seed_port, number):
+        with self.lock:
+            if self.in_flight.get(seed_port) != number:
+                return
+            self.stats["timeouts"] += 1
+        self.failed(seed_port, number)
+
+    def succeeded(self, seed_port):
+        # a PEERS reply from the seed, late answers still count
+        with self.lock:
+            if seed_port in self.answered:
+                return
+            self.answered.add(seed_port)
+            self.settled.add(seed_port)
+            self.in_flight.pop(seed_port, None)
+            self.stats["answers"] += 1
+            complete = self.complete()
+        if complete:
+            self.finish()
+
+    def failed(self, seed_port, number):
+        # only the attempt still in flight counts, a late failure of an
+        # earlier attempt that already timed out was retried already
+        with self.lock:
+            if seed_port in self.answered or self.in_flight.get(seed_port) != number:
+                return
+            del self.in_flight[seed_port]
+            self.settled.add(seed_port)
+            self.stats["failures"] += 1
+            attempts = self.attempts[seed_port]
+            retry = attempts < self.max_attempts
+            if retry:
+                self.stats["retries"] += 1
+            untried = [port for port in self.seeds if port not in self.attempts]
+            following = untried[0] if self.failover and untried else None
+            complete = self.complete()
+        if following is not None:
+            self.attempt(following)
+        if retry:
+            delay = min(self.retry_delay * 2 ** (attempts - 1), self.max_retry_delay)
+            delay *= self.node.rng.uniform(0.5, 1.0)
+            self.node.scheduler.call_later(delay, self.attempt, seed_port)
+        if complete:
+            self.finish()
+
+    def complete(self):
+        # called with the lock held, True once when the peer may proceed
+        if self.done:
+            return False
+        if len(self.answered) >= self.quorum or len(self.settled) == len(self.seeds):
+            self.done = True
+            return True
+        return False
+
+    def finish(self):
+        self.done = True
+        self.node.metrics.observe("bootstrap_seconds", self.node.scheduler.now() - self.started_at)
+        self.node.bootstrap_complete()
+
+    def metrics(self):
+        with self.lock:
+            return dict(
+                self.stats,
+                seeds=len(self.seeds),
+                answered=len(self.answered),
+                in_flight=len(self.in_flight),
+                done=self.done,
+            )
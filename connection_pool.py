@@ -0,0 +1,270 @@
+import asyncio
+import select
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+
+class PooledConnection:
+    def __init__(self, address):
+        self.address = address
+        self.sock = None
+        self.lock = threading.Lock()
+        # consecutive connect failures, drives the reconnect backoff
+        self.failures = 0
+        self.retry_at = 0.0
+        self.ever_connected = False
+        # set by discard(), a send still holding the stream gives up
+        self.discarded = False
+        # only used by AsyncConnectionPool
+        self.reader = None
+        self.async_lock = None
+
+
+class ConnectionPool:
+    # One long-lived stream per (host, port), shared by every message type
+    # sent to that neighbour. Streams are reconnected lazily with exponential
+    # backoff and the least recently used one is closed past max_size. A
+    # send to a peer that stopped reading fails after send_timeout seconds
+    # instead of holding the stream forever.
+    def __init__(self, max_size=1024, connect_timeout=3.0, send_timeout=5.0,
+                 backoff_base=0.5, backoff_max=30.0):
+        self.max_size = max_size
+        self.connect_timeout = connect_timeout
+        self.send_timeout = send_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.connections = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            "connects": 0,
+            "reconnects": 0,
+            "connect_failures": 0,
+            "backoff_rejections": 0,
+            "sends": 0,
+            "send_timeouts": 0,
+            "stale_streams": 0,
+            "evictions": 0,
+        }
+
+    def send(self, host, port, data):
+        conn = self.get_connection((host, int(port)))
+        with conn.lock:
+            if conn.discarded:
+                raise ConnectionAbortedError(f"Stream to {host}:{port} was discarded")
+            if conn.sock is not None and self.is_stale(conn):
+                self.bump("stale_streams")
+                self.close_connection(conn)
+            if conn.sock is None:
+                self.connect(conn)
+            try:
+                self.write(conn, data)
+            except socket.timeout:
+                raise
+            except OSError:
+                # the stream broke under us, retry once on a fresh one
+                self.bump("stale_streams")
+                if conn.discarded:
+                    raise
+                self.connect(conn)
+                self.write(conn, data)
+            self.bump("sends")
+
+    def write(self, conn, data):
+        # a failed or timed out write may have sent part of a frame, the
+        # stream is closed so the receiver never reads the rest as a frame
+        try:
+            conn.sock.sendall(data)
+        except socket.timeout:
+            self.bump("send_timeouts")
+            self.close_connection(conn)
+            raise
+        except OSError:
+            self.close_connection(conn)
+            raise
+
+    def bump(self, name):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def get_connection(self, address):
+        evicted = None
+        with self.lock:
+            conn = self.connections.get(address)
+            if conn is None:
+                conn = PooledConnection(address)
+                self.connections[address] = conn
+                if len(self.connections) > self.max_size:
+                    _, evicted = self.connections.popitem(last=False)
+                    self.bump("evictions")
+            else:
+                self.connections.move_to_end(address)
+        if evicted is not None:
+            self.abort(evicted)
+        return conn
+
+    def connect(self, conn):
+        self.check_backoff(conn)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self.connect_timeout)
+        try:
+            sock.connect(conn.address)
+        except OSError:
+            sock.close()
+            self.connect_failed(conn)
+            raise
+        sock.settimeout(self.send_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn.sock = sock
+        self.connect_succeeded(conn)
+
+    def check_backoff(self, conn):
+        if time.monotonic() < conn.retry_at:
+            self.bump("backoff_rejections")
+            raise ConnectionRefusedError(
+                f"Backing off from {conn.address[0]}:{conn.address[1]}"
+            )
+
+    def connect_failed(self, conn):
+        conn.failures += 1
+        delay = self.backoff_base * (2 ** (conn.failures - 1))
+        conn.retry_at = time.monotonic() + min(delay, self.backoff_max)
+        self.bump("connect_failures")
+
+    def connect_succeeded(self, conn):
+        if conn.ever_connected:
+            self.bump("reconnects")
+        conn.ever_connected = True
+        conn.failures = 0
+        conn.retry_at = 0.0
+        self.bump("connects")
+
+    def is_stale(self, conn):
+        # receivers never write back on pooled streams, so a readable socket
+        # means the remote end has closed or reset it. poll, unlike select,
+        # takes descriptors past FD_SETSIZE.
+        poller = select.poll()
+        poller.register(conn.sock, select.POLLIN)
+        return bool(poller.poll(0))
+
+    def close_connection(self, conn):
+        if conn.sock is not None:
+            try:
+                conn.sock.close()
+            except OSError:
+                pass
+            conn.sock = None
+
+    def discard(self, host, port):
+        with self.lock:
+            conn = self.connections.pop((host, int(port)), None)
+        if conn is not None:
+            self.abort(conn)
+
+    def close(self):
+        with self.lock:
+            connections = list(self.connections.values())
+            self.connections.clear()
+        for conn in connections:
+            self.abort(conn)
+
+    def abort(self, conn):
+        # Closes a stream without waiting for conn.lock, which a send blocked
+        # on a peer that stopped reading may hold. shutdown wakes that send
+        # up and it closes the socket itself.
+        conn.discarded = True
+        sock = conn.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if conn.lock.acquire(blocking=False):
+            try:
+                self.close_connection(conn)
+            finally:
+                conn.lock.release()
+
+    def metrics(self):
+        with self.lock:
+            connections = list(self.connections.values())
+        open_streams = sum(1 for conn in connections if conn.sock is not None)
+        backing_off = sum(1 for conn in connections if conn.retry_at > time.monotonic())
+        with self.stats_lock:
+            stats = dict(self.stats)
+        return dict(
+            stats,
+            pool_size=len(connections),
+            open_streams=open_streams,
+            backing_off=backing_off,
+        )
+
+
+class AsyncConnectionPool(ConnectionPool):
+    # asyncio flavour of the pool: conn.sock holds the StreamWriter and the
+    # per-stream lock is an asyncio.Lock, everything else is shared
+    async def send(self, host, port, data):
+        conn = self.get_connection((host, int(port)))
+        if conn.async_lock is None:
+            conn.async_lock = asyncio.Lock()
+        async with conn.async_lock:
+            if conn.discarded:
+                raise ConnectionAbortedError(f"Stream to {host}:{port} was discarded")
+            if conn.sock is not None and self.is_stale(conn):
+                self.bump("stale_streams")
+                self.close_connection(conn)
+            if conn.sock is None:
+                await self.connect(conn)
+            try:
+                await self.write(conn, data)
+            except asyncio.TimeoutError:
+                raise
+            except OSError:
+                self.bump("stale_streams")
+                if conn.discarded:
+                    raise
+                await self.connect(conn)
+                await self.write(conn, data)
+            self.bump("sends")
+
+    async def write(self, conn, data):
+        writer = conn.sock
+        try:
+            writer.write(data)
+            await asyncio.wait_for(writer.drain(), self.send_timeout)
+        except asyncio.TimeoutError:
+            self.bump("send_timeouts")
+            self.close_connection(conn)
+            raise
+        except OSError:
+            self.close_connection(conn)
+            raise
+
+    async def connect(self, conn):
+        self.check_backoff(conn)
+        try:
+            conn.reader, conn.sock = await asyncio.wait_for(
+                asyncio.open_connection(*conn.address), self.connect_timeout
+            )
+        except (OSError, asyncio.TimeoutError):
+            self.connect_failed(conn)
+            raise ConnectionRefusedError(
+                f"Could not connect to {conn.address[0]}:{conn.address[1]}"
+            )
+        self.connect_succeeded(conn)
+
+    def is_stale(self, conn):
+        return conn.sock.is_closing() or conn.reader.at_eof()
+
+    def abort(self, conn):
+        # a send waiting in drain() fails once its transport is closed
+        conn.discarded = True
+        self.close_connection(conn)
+
+    def close_connection(self, conn):
+        if conn.sock is not None:
+            conn.sock.close()
+            conn.sock = None
+            conn.reader = None
@@ -0,0 +1,53 @@
+import threading
+import time
+
+
+class DeadNodeVotes:
+    # Dead node reports a seed has received, per suspected peer. A peer is
+    # only declared dead once quorum distinct reporters named it within the
+    # last window seconds, so one flaky reporter cannot evict a live peer and
+    # duplicate reports from the same reporter count once.
+    def __init__(self, quorum=2, window=30.0, clock=time.monotonic):
+        self.quorum = quorum
+        self.window = window
+        self.clock = clock
+        self.votes = {}  # suspect -> {reporter: time of its latest report}
+        self.lock = threading.Lock()
+        self.last_sweep = clock()
+        self.stats = {"reports": 0, "duplicates": 0, "confirmed": 0, "expired": 0}
+
+    def report(self, suspect, reporter):
+        # True for the report that completes the quorum
+        now = self.clock()
+        with self.lock:
+            self.stats["reports"] += 1
+            if now - self.last_sweep > self.window:
+                self.sweep(now)
+            reporters = self.votes.setdefault(suspect, {})
+            if reporter in reporters:
+                self.stats["duplicates"] += 1
+            reporters[reporter] = now
+            for old in [key for key, seen in reporters.items() if now - seen > self.window]:
+                del reporters[old]
+            if len(reporters) < self.quorum:
+                return False
+            del self.votes[suspect]
+            self.stats["confirmed"] += 1
+            return True
+
+    def clear(self, suspect):
+        # the peer proved to be alive, e.g. it registered again
+        with self.lock:
+            self.votes.pop(suspect, None)
+
+    def sweep(self, now):
+        self.last_sweep = now
+        for suspect in list(self.votes):
+            reporters = self.votes[suspect]
+            if all(now - seen > self.window for seen in reporters.values()):
+                del self.votes[suspect]
+                self.stats["expired"] += 1
+
+    def metrics(self):
+        with self.lock:
+            return dict(self.stats, suspects=len(self.votes))
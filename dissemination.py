@@ -0,0 +1,107 @@
+import random
+import threading
+
+
+class DisseminationStrategy:
+    # Decides which neighbours a gossip message is pushed to and whether the
+    # node runs periodic pull (anti-entropy) rounds. hops=None keeps the old
+    # infect-and-die behaviour: a node forwards a message once, on first
+    # receipt, and the message carries no hop budget.
+    name = None
+    push = False
+    pull = False
+    tree = False
+
+    def __init__(self, fanout=3, hops=None, pull_interval=2.0, pull_digests=128,
+                 rng=None):
+        self.fanout = fanout
+        self.hops = hops
+        self.pull_interval = pull_interval
+        self.pull_digests = pull_digests
+        self.rng = rng or random.Random()
+
+    def push_targets(self, candidates, exclude=()):
+        candidates = [peer for peer in candidates if peer not in exclude]
+        if self.fanout <= 0 or self.fanout >= len(candidates):
+            return candidates
+        return self.rng.sample(candidates, self.fanout)
+
+    def pull_target(self, candidates):
+        return self.rng.choice(candidates) if candidates else None
+
+
+class FloodStrategy(DisseminationStrategy):
+    # the original behaviour, every known peer gets every message
+    name = "flood"
+    push = True
+
+    def push_targets(self, candidates, exclude=()):
+        return [peer for peer in candidates if peer not in exclude]
+
+
+class PushStrategy(DisseminationStrategy):
+    name = "push"
+    push = True
+
+
+class PullStrategy(DisseminationStrategy):
+    name = "pull"
+    pull = True
+
+
+class PushPullStrategy(DisseminationStrategy):
+    name = "push-pull"
+    push = True
+    pull = True
+
+
+class PlumtreeStrategy(DisseminationStrategy):
+    # bodies along an eager spanning tree, message ids on the other links,
+    # see BroadcastTree
+    name = "plumtree"
+    tree = True
+
+
+STRATEGIES = {
+    strategy.name: strategy
+    for strategy in (FloodStrategy, PushStrategy, PullStrategy, PushPullStrategy, PlumtreeStrategy)
+}
+
+
+def make_strategy(name, **options):
+    try:
+        return STRATEGIES[name](**options)
+    except KeyError:
+        raise ValueError(f"Unknown dissemination strategy: {name}") from None
+
+
+class DisseminationStats:
+    # Delivery counters. A redundant delivery is a copy of a message the node
+    # had already seen, so redundant / delivered is the extra bandwidth spent
+    # per useful message.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {
+            "originated": 0,
+            "delivered": 0,
+            "redundant": 0,
+            "forwarded": 0,
+            "hop_limited": 0,
+            "pull_requests": 0,
+            "pull_offers": 0,
+            "pull_wants": 0,
+            "pull_replies": 0,
+        }
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def metrics(self):
+        with self.lock:
+            counters = dict(self.counters)
+        delivered = counters["delivered"]
+        counters["redundant_per_message"] = (
+            counters["redundant"] / delivered if delivered else 0.0
+        )
+        return counters
@@ -0,0 +1,293 @@
+import socket
+import struct
+
+from gossip_cache import gossip_batch, split_batch
+
+# Binary frames are a fixed header followed by the body. The header starts
+# with MAGIC, which can never begin a legacy text message, so the first byte
+# of a connection tells the receiver which wire format the sender speaks.
+MAGIC = 0xB7
+HEADER = struct.Struct(">BBI")  # magic, message type, body length
+
+TEXT = 0
+REGISTER = 1
+PEERS = 2
+GOSSIP = 3
+LIVENESS_REQUEST = 4
+LIVENESS_REPLY = 5
+DEAD_NODE = 6
+GOSSIP_HOPS = 7
+MORE_PEERS = 8
+DEAD_NODES = 9
+MEMBERSHIP = 10
+GOSSIP_BATCH = 11  # body is the frames of the batched gossip messages
+
+PORT = struct.Struct(">H")
+COUNT = struct.Struct(">I")
+GOSSIP_BODY = struct.Struct(">I4sH")  # timestamp, ip, port
+GOSSIP_HOPS_BODY = struct.Struct(">I4sHB")  # timestamp, ip, port, hops; payload follows
+LIVENESS_BODY = struct.Struct(">IH")  # timestamp, port
+DEAD_NODE_BODY = struct.Struct(">4sHI4s")  # ip, port, timestamp, reporter ip
+DEAD_NODES_BODY = struct.Struct(">I4sHI")  # timestamp, reporter ip, port, count
+DEAD_ENTRY = struct.Struct(">4sH")  # ip, port of each dead peer
+MEMBER_ENTRY = struct.Struct(">HBI")  # port, status, incarnation
+MEMBER_STATUS = ["alive", "dead", "suspect"]
+
+
+def frame(message_type, body):
+    return HEADER.pack(MAGIC, message_type, len(body)) + body
+
+
+def encode_text(message):
+    # legacy colon delimited text, one message per line
+    return f"{message}\n".encode()
+
+
+def encode_message(message):
+    # Messages with a compact layout are packed field by field, anything else
+    # (or anything that would not survive the round trip) travels as TEXT
+    try:
+        encoded = encode_body(message)
+    except (ValueError, OSError, struct.error):
+        encoded = None
+    if encoded is not None and decode_body(*encoded) == message:
+        return frame(*encoded)
+    return frame(TEXT, message.encode())
+
+
+def encode_body(message):
+    if message.startswith("REGISTER "):
+        return REGISTER, PORT.pack(int(message.split()[1]))
+    if message.startswith("PEERS"):
+        ports = [int(port) for port in message.split()[1:]]
+        return PEERS, COUNT.pack(len(ports)) + struct.pack(f">{len(ports)}H", *ports)
+    if message.startswith("MORE PEERS "):
+        cursor, *ports = (int(field) for field in message.split()[2:])
+        body = COUNT.pack(cursor) + COUNT.pack(len(ports))
+        return MORE_PEERS, body + struct.pack(f">{len(ports)}H", *ports)
+    if message.startswith("Gossip Message:"):
+        _, timestamp, ip, port, *rest = message.split(":", 5)
+        if not rest:
+            return GOSSIP, GOSSIP_BODY.pack(int(timestamp), socket.inet_aton(ip), int(port))
+        body = GOSSIP_HOPS_BODY.pack(
+            int(timestamp), socket.inet_aton(ip), int(port), int(rest[0])
+        )
+        return GOSSIP_HOPS, body + (rest[1].encode() if len(rest) > 1 else b"")
+    if message.startswith("Gossip Batch:"):
+        return GOSSIP_BATCH, b"".join(encode_message(item) for item in split_batch(message))
+    if message.startswith("Liveness Request:"):
+        _, timestamp, port = message.split(":")
+        return LIVENESS_REQUEST, LIVENESS_BODY.pack(int(timestamp), int(port))
+    if message.startswith("Liveness Reply:"):
+        _, timestamp, port = message.split(":")
+        return LIVENESS_REPLY, LIVENESS_BODY.pack(int(timestamp), int(port))
+    if message.startswith("Dead Node:"):
+        _, ip, port, timestamp, sender_ip = message.split(":")
+        return DEAD_NODE, DEAD_NODE_BODY.pack(
+            socket.inet_aton(ip), int(port), int(timestamp), socket.inet_aton(sender_ip)
+        )
+    if message.startswith("Dead Nodes:"):
+        _, timestamp, sender_ip, sender_port, entries = message.split(":", 4)
+        dead = [entry.rsplit(":", 1) for entry in entries.split(",")]
+        body = DEAD_NODES_BODY.pack(
+            int(timestamp), socket.inet_aton(sender_ip), int(sender_port), len(dead)
+        )
+        return DEAD_NODES, body + b"".join(
+            DEAD_ENTRY.pack(socket.inet_aton(ip), int(port)) for ip, port in dead
+        )
+    if message.startswith("Membership:"):
+        entries = [entry.split(":") for entry in message[len("Membership:"):].split(",")]
+        return MEMBERSHIP, COUNT.pack(len(entries)) + b"".join(
+            MEMBER_ENTRY.pack(int(port), MEMBER_STATUS.index(status), int(incarnation))
+            for port, status, incarnation in entries
+        )
+    return None
+
+
+def decode_body(message_type, body):
+    # body may be a memoryview into the receive buffer; a truncated or
+    # malformed body raises ValueError like any other bad message
+    try:
+        return unpack_body(message_type, body)
+    except (struct.error, IndexError) as error:
+        raise ValueError(f"Malformed body for message type {message_type}") from error
+
+
+def entries_size(body, offset, count, entry):
+    # size of count entries after offset, checked against the body
+    size = count * entry.size
+    if len(body) < offset + size:
+        raise ValueError(f"Body holds fewer than {count} entries")
+    return size
+
+
+def unpack_body(message_type, body):
+    if message_type == TEXT:
+        return str(body, "utf-8")
+    if message_type == REGISTER:
+        (port,) = PORT.unpack_from(body)
+        return f"REGISTER {port}"
+    if message_type == PEERS:
+        (count,) = COUNT.unpack_from(body)
+        ports = struct.unpack_from(f">{count}H", body, COUNT.size)
+        return "PEERS " + " ".join(str(port) for port in ports)
+    if message_type == MORE_PEERS:
+        (cursor,) = COUNT.unpack_from(body)
+        (count,) = COUNT.unpack_from(body, COUNT.size)
+        ports = struct.unpack_from(f">{count}H", body, 2 * COUNT.size)
+        return f"MORE PEERS {cursor} " + " ".join(str(port) for port in ports)
+    if message_type == GOSSIP:
+        timestamp, ip, port = GOSSIP_BODY.unpack_from(body)
+        return f"Gossip Message:{timestamp}:{socket.inet_ntoa(ip)}:{port}"
+    if message_type == GOSSIP_HOPS:
+        timestamp, ip, port, hops = GOSSIP_HOPS_BODY.unpack_from(body)
+        message = f"Gossip Message:{timestamp}:{socket.inet_ntoa(ip)}:{port}:{hops}"
+        payload = body[GOSSIP_HOPS_BODY.size:]
+        return f"{message}:{str(payload, 'utf-8')}" if len(payload) else message
+    if message_type == GOSSIP_BATCH:
+        return gossip_batch(decode_frames(body))
+    if message_type == LIVENESS_REQUEST:
+        timestamp, port = LIVENESS_BODY.unpack_from(body)
+        return f"Liveness Request:{timestamp}:{port}"
+    if message_type == LIVENESS_REPLY:
+        timestamp, port = LIVENESS_BODY.unpack_from(body)
+        return f"Liveness Reply:{timestamp}:{port}"
+    if message_type == DEAD_NODE:
+        ip, port, timestamp, sender_ip = DEAD_NODE_BODY.unpack_from(body)
+        return (
+            f"Dead Node:{socket.inet_ntoa(ip)}:{port}:{timestamp}:"
+            f"{socket.inet_ntoa(sender_ip)}"
+        )
+    if message_type == DEAD_NODES:
+        timestamp, sender_ip, sender_port, count = DEAD_NODES_BODY.unpack_from(body)
+        size = entries_size(body, DEAD_NODES_BODY.size, count, DEAD_ENTRY)
+        entries = ",".join(
+            f"{socket.inet_ntoa(ip)}:{port}"
+            for ip, port in DEAD_ENTRY.iter_unpack(body[DEAD_NODES_BODY.size:DEAD_NODES_BODY.size + size])
+        )
+        return f"Dead Nodes:{timestamp}:{socket.inet_ntoa(sender_ip)}:{sender_port}:{entries}"
+    if message_type == MEMBERSHIP:
+        (count,) = COUNT.unpack_from(body)
+        size = entries_size(body, COUNT.size, count, MEMBER_ENTRY)
+        entries = ",".join(
+            f"{port}:{MEMBER_STATUS[status]}:{incarnation}"
+            for port, status, incarnation in MEMBER_ENTRY.iter_unpack(body[COUNT.size:COUNT.size + size])
+        )
+        return f"Membership:{entries}"
+    # unknown types come from newer nodes, skip them
+    return None
+
+
+def decode_frames(body):
+    # the complete frames packed into one body
+    messages = []
+    offset = 0
+    while offset < len(body):
+        magic, message_type, length = HEADER.unpack_from(body, offset)
+        if magic != MAGIC:
+            raise ValueError("Corrupt frame header")
+        start = offset + HEADER.size
+        message = decode_body(message_type, body[start:start + length])
+        if message is not None:
+            messages.append(message)
+        offset = start + length
+    return messages
+
+
+class FrameReader:
+    # Receive buffer for one connection. recv_into() fills a preallocated
+    # bytearray and messages() parses every complete frame (or text line) it
+    # holds, reading the bodies through a memoryview instead of copying them.
+    # The buffer starts at size bytes and doubles for larger frames; once
+    # drained it shrinks back, so idle streams hold only a small buffer.
+    def __init__(self, size=4096):
+        self.size = size
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+        # bytes the next incomplete frame needs in total
+        self.wanted = 0
+        # None until the first byte arrives, then True for binary frames
+        self.binary = None
+
+    def recv_into(self, sock):
+        self.make_room()
+        received = sock.recv_into(self.view[self.end:])
+        self.end += received
+        return received
+
+    def feed(self, data):
+        self.make_room(len(data))
+        self.view[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+    def make_room(self, needed=4096):
+        pending = self.end - self.start
+        needed = max(needed, self.wanted - pending)
+        if len(self.buffer) - self.end >= needed:
+            return
+        size = len(self.buffer)
+        while size - pending < needed:
+            size *= 2
+        if size == len(self.buffer):
+            # slide the unread bytes to the front
+            self.buffer[:pending] = self.buffer[self.start:self.end]
+        else:
+            buffer = bytearray(size)
+            buffer[:pending] = self.view[self.start:self.end]
+            self.buffer = buffer
+            self.view = memoryview(buffer)
+        self.start = 0
+        self.end = pending
+
+    def messages(self):
+        messages = []
+        self.wanted = 0
+        while self.start < self.end:
+            if self.binary is None:
+                self.binary = self.buffer[self.start] == MAGIC
+            if self.binary:
+                if self.end - self.start < HEADER.size:
+                    break
+                magic, message_type, length = HEADER.unpack_from(self.buffer, self.start)
+                if magic != MAGIC:
+                    raise ValueError("Corrupt frame header")
+                body_start = self.start + HEADER.size
+                if body_start + length > self.end:
+                    self.wanted = HEADER.size + length
+                    break
+                message = decode_body(message_type, self.view[body_start:body_start + length])
+                self.start = body_start + length
+                if message is not None:
+                    messages.append(message)
+            else:
+                newline = self.buffer.find(b"\n", self.start, self.end)
+                if newline < 0:
+                    break
+                messages.append(str(self.view[self.start:newline], "utf-8"))
+                self.start = newline + 1
+        if self.start == self.end:
+            self.reset()
+        return messages
+
+    def reset(self):
+        self.start = self.end = 0
+        if len(self.buffer) > self.size:
+            self.buffer = bytearray(self.size)
+            self.view = memoryview(self.buffer)
+
+    def buffered(self):
+        # bytes of an incomplete frame or line waiting for the rest
+        return self.end - self.start
+
+    def pending_text(self):
+        # an unterminated text message, legacy senders close right after it
+        if self.binary or self.start == self.end:
+            return ""
+        return str(self.view[self.start:self.end], "utf-8")
+
+    def finish(self):
+        message = self.pending_text()
+        self.reset()
+        return message
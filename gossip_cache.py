@@ -0,0 +1,141 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def gossip_fields(message):
+    # "Gossip Message:<timestamp>:<ip>:<port>[:<hops>[:<payload>]]", hops is
+    # the remaining hop budget and is rewritten by every forwarder
+    _, timestamp, ip, port, *rest = message.split(":", 5)
+    hops = int(rest[0]) if rest and rest[0] else None
+    payload = rest[1] if len(rest) > 1 else ""
+    return timestamp, ip, port, hops, payload
+
+
+def with_hops(message, hops):
+    timestamp, ip, port, _, payload = gossip_fields(message)
+    message = f"Gossip Message:{timestamp}:{ip}:{port}:{hops}"
+    return f"{message}:{payload}" if payload else message
+
+
+BATCH_SEPARATOR = "\x1e"  # ASCII record separator, never part of a message
+
+
+def gossip_batch(messages):
+    # several gossip messages for one neighbour, sent as one frame
+    return "Gossip Batch:" + BATCH_SEPARATOR.join(messages)
+
+
+def split_batch(message):
+    return message[len("Gossip Batch:"):].split(BATCH_SEPARATOR)
+
+
+def message_digest(message):
+    # identity of a gossip message: origin address, timestamp and payload
+    timestamp, ip, port, _, payload = gossip_fields(message)
+    payload_hash = hashlib.blake2b(payload.encode(), digest_size=16).digest()
+    origin = f"{ip}:{port}:{timestamp}:".encode()
+    return hashlib.blake2b(origin + payload_hash, digest_size=16).digest()
+
+
+class SeenCache:
+    # Bounded LRU of message digests with a time to live. Entries are kept
+    # in last-touched order, so expired ones are always at the front and both
+    # lookups and evictions are O(1).
+    def __init__(self, capacity=65536, ttl=600.0, clock=time.monotonic):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def check_and_add(self, key, value=True):
+        # Returns True the first time a key is seen
+        now = self.clock()
+        with self.lock:
+            self.expire(now)
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self.entries[key] = (now + self.ttl, entry[1])
+                self.entries.move_to_end(key)
+                return False
+            self.misses += 1
+            self.entries[key] = (now + self.ttl, value)
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None or entry[0] <= self.clock():
+            return default
+        return entry[1]
+
+    def recent(self, limit):
+        # newest (key, value) pairs that carry a stored value
+        now = self.clock()
+        items = []
+        with self.lock:
+            for key in reversed(self.entries):
+                expires_at, value = self.entries[key]
+                if expires_at <= now or len(items) >= limit:
+                    break
+                if value is not True:
+                    items.append((key, value))
+        return items
+
+    def digests(self, limit):
+        # newest keys with the seconds each has left to live, oldest first
+        now = self.clock()
+        items = []
+        with self.lock:
+            for key in reversed(self.entries):
+                expires_at, _ = self.entries[key]
+                if expires_at <= now or len(items) >= limit:
+                    break
+                items.append((key, expires_at - now))
+        items.reverse()
+        return items
+
+    def restore(self, digests):
+        # keys saved by digests(), without the messages stored with them
+        now = self.clock()
+        with self.lock:
+            for key, remaining in digests:
+                if remaining > 0 and key not in self.entries:
+                    self.entries[key] = (now + min(remaining, self.ttl), True)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def expire(self, now):
+        while self.entries:
+            key, (expires_at, _) = next(iter(self.entries.items()))
+            if expires_at > now:
+                break
+            del self.entries[key]
+            self.expirations += 1
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
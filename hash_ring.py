@@ -0,0 +1,52 @@
+import bisect
+import hashlib
+import math
+
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(), "big")
+
+
+def quorum_size(nodes):
+    # ceil(n / 2) + 1 seeds hold each peer, every seed on small rings
+    return min(nodes, math.ceil(nodes / 2) + 1)
+
+
+class HashRing:
+    # Consistent hash ring of seed ports. Each seed owns vnodes points on the
+    # ring, which keeps the shards even, and adding or removing a seed only
+    # moves the keys next to its points.
+    def __init__(self, nodes=(), vnodes=64):
+        self.vnodes = vnodes
+        self.points = []  # sorted (hash, node)
+        self.nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.vnodes):
+            bisect.insort(self.points, (ring_hash(f"{node}#{i}"), node))
+
+    def remove(self, node):
+        if node in self.nodes:
+            self.nodes.discard(node)
+            self.points = [point for point in self.points if point[1] != node]
+
+    def responsible(self, key, count):
+        # the first count distinct nodes clockwise from the key's hash
+        count = min(count, len(self.nodes))
+        owners = []
+        start = bisect.bisect_left(self.points, (ring_hash(key),))
+        for i in range(len(self.points)):
+            node = self.points[(start + i) % len(self.points)][1]
+            if node not in owners:
+                owners.append(node)
+                if len(owners) == count:
+                    break
+        return owners
+
+    def __len__(self):
+        return len(self.nodes)
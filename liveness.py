@@ -0,0 +1,161 @@
+import heapq
+import random
+import threading
+from functools import partial
+
+
+class PeerLiveness:
+    __slots__ = ("port", "srtt", "rttvar", "probe_sent_at", "due_at")
+
+    def __init__(self, port):
+        self.port = port
+        # smoothed round trip time and its variation, None until a reply
+        self.srtt = None
+        self.rttvar = None
+        self.probe_sent_at = None
+        # the due heap entry that counts, earlier ones were rescheduled
+        self.due_at = None
+
+
+class LivenessMonitor:
+    # Probes every tracked peer roughly once per interval from a single
+    # scheduler. Each peer has its own jittered deadline in a heap, so
+    # probes spread out instead of arriving in bursts, and the peers that
+    # come due together are sent as one batch. A probe fails when sending
+    # fails, or when no reply arrives within an RTT based timeout
+    # (srtt + 4 * rttvar, as TCP computes its RTO). The timeout also catches
+    # peers that accept connections but hang.
+    def __init__(self, node, interval=15.0, jitter=0.2, tick=0.5, batch_size=64,
+                 initial_timeout=2.0, min_timeout=0.2, max_timeout=None, rng=None):
+        self.node = node
+        self.interval = interval
+        self.jitter = jitter
+        self.tick_interval = tick
+        self.batch_size = batch_size
+        self.initial_timeout = initial_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout or interval / 2
+        self.rng = rng or random.Random()
+        self.peers = {}
+        self.due = []  # (due time, port)
+        self.timeouts = []  # (deadline, port, sent at)
+        self.lock = threading.Lock()
+        self.stats = {"probes": 0, "replies": 0, "timeouts": 0, "send_failures": 0, "shed": 0}
+
+    def start(self):
+        self.node.scheduler.call_later(self.tick_interval, self.tick)
+
+    def track(self, port):
+        port = str(port)
+        now = self.node.scheduler.now()
+        with self.lock:
+            if port in self.peers:
+                return
+            state = self.peers[port] = PeerLiveness(port)
+            # first probe somewhere within the first interval
+            state.due_at = now + self.rng.uniform(0.5, 1.0) * self.interval
+            heapq.heappush(self.due, (state.due_at, port))
+
+    def probe_soon(self, port):
+        # an extra probe on the next tick, e.g. for a suspected peer
+        now = self.node.scheduler.now()
+        with self.lock:
+            state = self.peers.get(str(port))
+            if state is None:
+                return
+            state.due_at = now
+            heapq.heappush(self.due, (now, state.port))
+
+    def untrack(self, port):
+        # stale heap entries are skipped when they come up
+        with self.lock:
+            self.peers.pop(str(port), None)
+
+    def timeout(self, state):
+        if state.srtt is None:
+            return self.initial_timeout
+        timeout = state.srtt + 4 * state.rttvar
+        return min(max(timeout, self.min_timeout), self.max_timeout)
+
+    def next_due(self, now):
+        spread = self.rng.uniform(-self.jitter, self.jitter)
+        return now + self.interval * (1 + spread)
+
+    def tick(self):
+        now = self.node.scheduler.now()
+        batch = []
+        expired = []
+        with self.lock:
+            while self.due and self.due[0][0] <= now:
+                due_at, port = heapq.heappop(self.due)
+                state = self.peers.get(port)
+                if state is None or due_at != state.due_at:
+                    continue
+                state.due_at = self.next_due(now)
+                heapq.heappush(self.due, (state.due_at, port))
+                if state.probe_sent_at is not None:
+                    # previous probe still waiting for its timeout
+                    continue
+                state.probe_sent_at = now
+                heapq.heappush(self.timeouts, (now + self.timeout(state), port, now))
+                batch.append(port)
+            while self.timeouts and self.timeouts[0][0] <= now:
+                _, port, sent_at = heapq.heappop(self.timeouts)
+                state = self.peers.get(port)
+                if state is not None and state.probe_sent_at == sent_at:
+                    state.probe_sent_at = None
+                    expired.append(port)
+            self.stats["probes"] += len(batch)
+            self.stats["timeouts"] += len(expired)
+        for start in range(0, len(batch), self.batch_size):
+            ports = batch[start:start + self.batch_size]
+            self.node.run_task(self.node.send_liveness_batch, ports, on_drop=partial(self.shed, ports))
+        for port in expired:
+            self.node.log.echo("Liveness request to peer on port {} timed out", port)
+            self.node.record_liveness_failure(port)
+        self.node.scheduler.call_later(self.tick_interval, self.tick)
+
+    def reply_received(self, port):
+        now = self.node.scheduler.now()
+        with self.lock:
+            state = self.peers.get(str(port))
+            if state is None or state.probe_sent_at is None:
+                return False
+            rtt = now - state.probe_sent_at
+            state.probe_sent_at = None
+            if state.srtt is None:
+                state.srtt = rtt
+                state.rttvar = rtt / 2
+            else:
+                state.rttvar = 0.75 * state.rttvar + 0.25 * abs(state.srtt - rtt)
+                state.srtt = 0.875 * state.srtt + 0.125 * rtt
+            self.stats["replies"] += 1
+        self.node.metrics.observe("liveness_rtt_seconds", rtt)
+        return True
+
+    def shed(self, ports):
+        # an overloaded node dropped the batch before sending it, which says
+        # nothing about the peers: they are probed again when next due
+        with self.lock:
+            for port in ports:
+                state = self.peers.get(port)
+                if state is not None:
+                    state.probe_sent_at = None
+            self.stats["probes"] -= len(ports)
+            self.stats["shed"] += len(ports)
+
+    def probe_failed(self, port):
+        with self.lock:
+            state = self.peers.get(str(port))
+            if state is not None:
+                state.probe_sent_at = None
+            self.stats["send_failures"] += 1
+
+    def metrics(self):
+        with self.lock:
+            rtts = [state.srtt for state in self.peers.values() if state.srtt is not None]
+            return dict(
+                self.stats,
+                tracked=len(self.peers),
+                mean_rtt=sum(rtts) / len(rtts) if rtts else None,
+            )
@@ -0,0 +1,123 @@
+import itertools
+import math
+import threading
+
+ALIVE = "alive"
+SUSPECT = "suspect"
+DEAD = "dead"
+# at equal incarnations suspect beats alive and dead beats both
+RANK = {ALIVE: 0, SUSPECT: 1, DEAD: 2}
+
+
+def membership_message(updates):
+    # Membership:<port>:<alive|suspect|dead>:<incarnation>,...
+    return "Membership:" + ",".join(
+        f"{port}:{status}:{incarnation}" for port, status, incarnation in updates
+    )
+
+
+def parse_membership(message):
+    updates = []
+    for entry in message.split(":", 1)[1].split(","):
+        port, status, incarnation = entry.split(":")
+        if status not in RANK:
+            raise ValueError(f"unknown membership status {status!r}")
+        updates.append((port, status, int(incarnation)))
+    return updates
+
+
+class MembershipUpdates:
+    # SWIM style membership dissemination. Every peer keeps the latest
+    # (status, incarnation) it heard for each port and piggybacks recent
+    # changes on the traffic it sends anyway. Each change is retransmitted
+    # retransmit_factor * log2(members) times, which is enough for it to
+    # reach the whole overlay with high probability in O(log N) rounds.
+    #
+    # A peer that stops answering probes is suspected first and declared
+    # dead only if it does not refute the suspicion in time. Suspect beats
+    # alive at the same incarnation and dead beats both, alive needs a
+    # higher one. A peer that hears it is suspected or dead refutes it by
+    # bumping its own incarnation; a restarted peer starts from the current
+    # time, so its first alive update overrides its old death.
+    def __init__(self, port, incarnation=0, retransmit_factor=3, max_piggyback=8):
+        self.port = str(port)
+        self.incarnation = incarnation
+        self.retransmit_factor = retransmit_factor
+        self.max_piggyback = max_piggyback
+        self.states = {}  # port -> (status, incarnation)
+        # port -> [sends left, status, incarnation], newest last
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.stats = {"received": 0, "applied": 0, "refuted": 0, "piggybacked": 0}
+
+    def retransmit_limit(self, members):
+        return self.retransmit_factor * max(1, math.ceil(math.log2(members + 1)))
+
+    def announce(self, members):
+        # tell the overlay we are alive, on joining and to refute a death
+        with self.lock:
+            self.pending.pop(self.port, None)
+            self.pending[self.port] = [self.retransmit_limit(members), ALIVE, self.incarnation]
+
+    def incarnation_of(self, port):
+        state = self.states.get(str(port))
+        return state[1] if state else 0
+
+    def state_of(self, port):
+        # (status, incarnation), or None for a port we heard nothing about
+        return self.states.get(str(port))
+
+    def alive_peers(self):
+        with self.lock:
+            return [port for port, (status, _) in self.states.items() if status == ALIVE]
+
+    def record(self, port, status, incarnation, members):
+        # True when the update is news, it is then passed on to others
+        port = str(port)
+        with self.lock:
+            current = self.states.get(port)
+            if current is not None:
+                current_status, current_incarnation = current
+                if (incarnation, RANK[status]) <= (current_incarnation, RANK[current_status]):
+                    return False
+            self.states[port] = (status, incarnation)
+            self.pending.pop(port, None)
+            self.pending[port] = [self.retransmit_limit(members), status, incarnation]
+            return True
+
+    def received(self, updates, members):
+        # Applies the updates of one Membership message and returns the
+        # ones that changed what we know about other peers
+        changed = []
+        for port, status, incarnation in updates:
+            self.stats["received"] += 1
+            if port == self.port:
+                if status != ALIVE and incarnation >= self.incarnation:
+                    self.incarnation = incarnation + 1
+                    self.stats["refuted"] += 1
+                    self.announce(members)
+                continue
+            if self.record(port, status, incarnation, members):
+                self.stats["applied"] += 1
+                changed.append((port, status, incarnation))
+        return changed
+
+    def piggyback(self):
+        # The updates sent least often so far, or None when there are none.
+        # Chosen updates are counted down together, so those are the newest.
+        with self.lock:
+            if not self.pending:
+                return None
+            chosen = list(itertools.islice(reversed(self.pending.items()), self.max_piggyback))
+            updates = []
+            for port, entry in chosen:
+                entry[0] -= 1
+                if entry[0] <= 0:
+                    del self.pending[port]
+                updates.append((port, entry[1], entry[2]))
+            self.stats["piggybacked"] += 1
+        return membership_message(updates)
+
+    def metrics(self):
+        with self.lock:
+            return dict(self.stats, incarnation=self.incarnation, pending=len(self.pending))
@@ -0,0 +1,242 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket i counts durations below 2**i microseconds, the last
+# bucket everything from about 16 seconds up
+BUCKETS = 25
+BOUNDS = [2 ** i / 1e6 for i in range(BUCKETS - 1)] + [float("inf")]
+
+
+def bucket_index(seconds):
+    return min(int(seconds * 1e6).bit_length(), BUCKETS - 1) if seconds > 0 else 0
+
+
+def new_shard():
+    return {}, {}  # counters, name -> bucket counts + [count, sum]
+
+
+def merge_shard(target, shard):
+    counters, histograms = target
+    for name, value in list(shard[0].items()):
+        counters[name] = counters.get(name, 0) + value
+    for name, values in list(shard[1].items()):
+        values = list(values)
+        merged = histograms.get(name)
+        if merged is None:
+            histograms[name] = values
+        else:
+            for i, value in enumerate(values):
+                merged[i] += value
+
+
+def quantile(values, q):
+    # upper bound of the bucket holding the q-th quantile
+    total = values[BUCKETS]
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for i in range(BUCKETS):
+        seen += values[i]
+        if seen >= rank:
+            return BOUNDS[i]
+    return BOUNDS[-1]
+
+
+class Metrics:
+    # Counters and latency histograms of one node. Every thread records into
+    # its own shard without taking a lock, snapshot() adds the shards up.
+    # Shards of threads that have finished are folded into one retired shard,
+    # so the thread per task runtime does not keep one per task. Gauges are
+    # read at snapshot time; a gauge returning a dict (such as the metrics()
+    # of the liveness monitor or the connection pool) adds one value per key.
+    def __init__(self):
+        self.local = threading.local()
+        self.shards = []  # (thread, shard)
+        self.retired = new_shard()
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    def shard(self):
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = self.local.shard = new_shard()
+            with self.lock:
+                self.shards.append((threading.current_thread(), shard))
+                if len(self.shards) % 256 == 0:
+                    self.retire()
+            return shard
+
+    def retire(self):
+        # called with the lock held
+        live = []
+        for thread, shard in self.shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                merge_shard(self.retired, shard)
+        self.shards = live
+
+    def count(self, name, amount=1):
+        counters = self.shard()[0]
+        counters[name] = counters.get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        histograms = self.shard()[1]
+        values = histograms.get(name)
+        if values is None:
+            values = histograms[name] = [0] * BUCKETS + [0, 0.0]
+        values[bucket_index(seconds)] += 1
+        values[BUCKETS] += 1
+        values[BUCKETS + 1] += seconds
+
+    def timed(self, name, started):
+        # records the time since started, a time.perf_counter() value
+        self.observe(name, time.perf_counter() - started)
+
+    def gauge(self, name, read):
+        self.gauges[name] = read
+
+    def totals(self):
+        # counters and raw histograms added up over all shards
+        with self.lock:
+            self.retire()
+            total = new_shard()
+            merge_shard(total, self.retired)
+            for _, shard in self.shards:
+                merge_shard(total, shard)
+        return total
+
+    def snapshot(self):
+        counters, histograms = self.totals()
+        gauges = {}
+        for name, read in list(self.gauges.items()):
+            value = read()
+            if isinstance(value, dict):
+                for key, item in value.items():
+                    gauges[f"{name}_{key}"] = item
+            else:
+                gauges[name] = value
+        return {
+            "counters": counters,
+            "histograms": {name: summarize(values) for name, values in histograms.items()},
+            "gauges": gauges,
+        }
+
+
+def summarize(values):
+    return {
+        "count": values[BUCKETS],
+        "sum": values[BUCKETS + 1],
+        "p50": quantile(values, 0.5),
+        "p99": quantile(values, 0.99),
+        "buckets": values[:BUCKETS],
+    }
+
+
+def combined(metrics_list):
+    # counters and histograms of several nodes together, quantiles are
+    # taken over the merged buckets
+    total = new_shard()
+    for metrics in metrics_list:
+        merge_shard(total, metrics.totals())
+    counters, histograms = total
+    return {
+        "counters": counters,
+        "histograms": {name: summarize(values) for name, values in histograms.items()},
+    }
+
+
+def render_text(snapshots):
+    # Prometheus text exposition, one series per node
+    lines = []
+    for node, snapshot in sorted(snapshots.items()):
+        label = f'node="{node}"'
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"{name}_total{{{label}}} {value}")
+        for name, histogram in sorted(snapshot["histograms"].items()):
+            cumulative = 0
+            for bound, value in zip(BOUNDS, histogram["buckets"]):
+                cumulative += value
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{name}_bucket{{{label},le="{le}"}} {cumulative}')
+            lines.append(f"{name}_count{{{label}}} {histogram['count']}")
+            lines.append(f"{name}_sum{{{label}}} {histogram['sum']}")
+        for name, value in sorted(snapshot["gauges"].items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"{name}{{{label}}} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    # Publishes the metrics of every node in the process, over HTTP
+    # (GET /metrics as text, /metrics.json as JSON) and/or as a JSON
+    # snapshot file rewritten every interval seconds
+    def __init__(self):
+        self.nodes = {}  # node name -> Metrics
+        self.server = None
+        self.stopped = threading.Event()
+
+    def register(self, name, metrics):
+        self.nodes[name] = metrics
+
+    def snapshots(self):
+        return {name: metrics.snapshot() for name, metrics in list(self.nodes.items())}
+
+    def serve(self, port, host="127.0.0.1"):
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics.json":
+                    body = json.dumps(exporter.snapshots()).encode()
+                    content_type = "application/json"
+                else:
+                    body = render_text(exporter.snapshots()).encode()
+                    content_type = "text/plain; version=0.0.4"
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def write_snapshots(self, path, interval):
+        threading.Thread(target=self.snapshot_loop, args=(path, interval), daemon=True).start()
+
+    def snapshot_loop(self, path, interval):
+        while not self.stopped.wait(interval):
+            self.write_snapshot(path)
+
+    def write_snapshot(self, path):
+        # swap in a complete file, readers never see a partial snapshot
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump({"time": time.time(), "nodes": self.snapshots()}, file)
+        os.replace(temp_path, path)
+
+    def stop(self):
+        self.stopped.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+default_exporter = MetricsExporter()
+
+
+def start_exporter(port=None, path=None, interval=5.0):
+    if port is not None:
+        default_exporter.serve(port)
+    if path is not None:
+        default_exporter.write_snapshots(path, interval)
@@ -0,0 +1,123 @@
+import atexit
+import queue
+import struct
+import threading
+import time
+
+# binary records: wall clock time, message length, utf-8 message
+BINARY_RECORD = struct.Struct(">dI")
+
+
+class LogWriter:
+    # One background thread per process drains the records of every
+    # OutputLog. Callers only append to a SimpleQueue; the writer collects up
+    # to flush_size records or flush_interval seconds worth, then does one
+    # open/write/close per output file for the whole batch.
+    def __init__(self, flush_interval=0.5, flush_size=1024):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.records = 0
+
+    def submit(self, record):
+        if self.thread is None:
+            self.start()
+        self.queue.put(record)
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.flush_size and not isinstance(batch[-1], threading.Event):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.write_batch(batch)
+
+    def write_batch(self, batch):
+        files = {}
+        flushed = []
+        for record in batch:
+            if isinstance(record, threading.Event):
+                flushed.append(record)
+                continue
+            log, timestamp, message = record
+            files.setdefault(log.path, []).append(log.encode(timestamp, message))
+        for path, chunks in files.items():
+            with open(path, "ab") as file:
+                file.write(b"".join(chunks))
+        self.batches += 1
+        self.records += len(batch) - len(flushed)
+        for event in flushed:
+            event.set()
+
+    def flush(self, timeout=5.0):
+        # wait until everything submitted so far is on disk
+        if self.thread is None:
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait(timeout)
+
+
+default_writer = LogWriter()
+
+
+def configure_writer(flush_interval=None, flush_size=None):
+    if flush_interval is not None:
+        default_writer.flush_interval = flush_interval
+    if flush_size is not None:
+        default_writer.flush_size = flush_size
+
+
+class OutputLog:
+    # Per node event log. write() records an event in the node's output
+    # file, echo() is the console output and formats its arguments only
+    # when the node is not quiet.
+    def __init__(self, path, fmt="line", quiet=False, writer=None):
+        self.path = path
+        self.fmt = fmt
+        self.quiet = quiet
+        self.writer = writer or default_writer
+
+    def write(self, message):
+        self.writer.submit((self, time.time(), message))
+
+    def echo(self, template, *args):
+        if not self.quiet:
+            print(template.format(*args) if args else template)
+
+    def encode(self, timestamp, message):
+        if self.fmt == "binary":
+            data = message.encode()
+            return BINARY_RECORD.pack(timestamp, len(data)) + data
+        return f"{message}\n".encode()
+
+    def flush(self):
+        self.writer.flush()
+
+
+def read_binary_log(path):
+    # yields (timestamp, message) from a binary output file
+    with open(path, "rb") as file:
+        data = file.read()
+    offset = 0
+    while offset + BINARY_RECORD.size <= len(data):
+        timestamp, length = BINARY_RECORD.unpack_from(data, offset)
+        offset += BINARY_RECORD.size
+        yield timestamp, data[offset:offset + length].decode()
+        offset += length
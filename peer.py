@@ -1,9 +1,30 @@
+import argparse
+import atexit
 import socket
 import threading
 import random
-import sys
 import time
 
+import framing
+from bootstrap import SeedBootstrap
+from connection_pool import ConnectionPool
+from dissemination import STRATEGIES, DisseminationStats, PushPullStrategy, make_strategy
+from gossip_cache import SeenCache, gossip_batch, gossip_fields, message_digest, split_batch, with_hops
+from hash_ring import HashRing, quorum_size
+from liveness import LivenessMonitor
+from membership import ALIVE, DEAD, SUSPECT, MembershipUpdates, parse_membership
+from metrics import Metrics, default_exporter, start_exporter
+from node_log import OutputLog, configure_writer
+from peer_state import PeerStateTable
+from plumtree import BroadcastTree
+from profiling import start_profiling
+from scheduler import TimerScheduler
+from snapshot import PeerSnapshot, load_snapshot
+from topology import TopologyManager
+from udp_probe import ProbeChannel, process_group
+from worker_pool import POLICIES, TASK_POLICIES, WorkerPool, open_listener
+from workload import ARRIVALS, GossipWorkload
+
 
 class PeerNode:
     def __init__(self, host, port):
@@ -12,51 +33,406 @@ class PeerNode:
         self.seeds_file = "config.txt"
         # self.peers_file = "peers.txt"
         self.listening_ready = threading.Event()
-        self.peers_list = []
+        # known peers, neighbours (peers we actually connected to, gossip is
+        # pushed to these), dead peers and consecutive failure counters
+        self.peer_table = PeerStateTable()
         self.seeds_list = []
-        self.message_list = {}
-        self.liveness_timer = None
-        self.liveness_requests_sent = 0
+        # with sharded seeds a peer registers only with the seeds its port
+        # hashes to on the ring, and reports dead peers to theirs
+        self.sharded = False
+        # replicating seeds share their registries, a peer registers with
+        # the seed its port hashes to, or the next one on the ring when that
+        # one fails, and reports dead peers to the first two
+        self.replicated_seeds = False
+        self.seed_ring = None
+        # registration races the seeds with deadlines and lets the peer
+        # start gossiping once a quorum answered, time to first gossip is
+        # measured from started_at
+        self.bootstrap = SeedBootstrap(self)
+        self.bootstrapped = threading.Event()
+        self.started_at = None
+        self.first_gossip_at = None
+        # dead peers are collected for report_interval seconds and then
+        # reported to each seed in one batch: seed port -> [(ip, port, time)]
+        self.report_interval = 1.0
+        self.dead_reports = {}
+        self.report_lock = threading.Lock()
+        self.report_pending = False
+        # digests of gossip already received, bounded in size and age
+        self.seen_messages = SeenCache()
+        # one timer thread drives liveness probes and periodic rounds
+        self.scheduler = TimerScheduler(on_error=self.timer_failed)
+        self.liveness = LivenessMonitor(self)
+        # liveness probes over pooled "tcp" streams or sequence numbered
+        # "udp" datagrams, one round trip each
+        self.liveness_transport = "tcp"
+        self.probe_channel = None
+        self.probe_socket = None
         self.output_file = f"output_{self.port}.txt"
-        self.dead_nodes = []
-        # count consecutive failures of every peer with a separate counter
-        self.consecutive_failures = {}
+        self.log = OutputLog(self.output_file)
+        # long-lived streams to neighbours, shared by all outgoing traffic
+        self.pool = ConnectionPool()
+        # "binary" length prefixed frames on pooled streams, or "text" for
+        # peers from before the frames: one message per connection, as they
+        # send and read them
+        self.wire_format = "binary"
+        # push to a few neighbours, pull rounds repair what the pushes missed
+        self.strategy = PushPullStrategy()
+        # peers to ask the seeds for, None leaves it to the seed
+        self.peer_sample_size = None
+        self.dissemination_stats = DisseminationStats()
+        # how many gossip messages this node originates, and how far apart
+        self.gossip_count = 10
+        self.gossip_interval = 5.0
+        # a GossipWorkload replaces the fixed schedule above when set
+        self.workload = None
+        # Forwarded gossip is collected per neighbour for up to
+        # gossip_batch_delay seconds and sent as one Gossip Batch of at most
+        # gossip_batch_size messages; a size of 1 sends every message alone
+        self.gossip_batch_size = 1
+        self.gossip_batch_delay = 0.005
+        self.outbox = {}  # neighbour port -> messages waiting
+        self.outbox_lock = threading.Lock()
+        # With a snapshot_path the peer saves its peer table and recent
+        # gossip digests every snapshot_interval seconds. A restart from a
+        # snapshot younger than snapshot_max_age resumes gossip with the old
+        # neighbours right away and registers with the seeds after a random
+        # delay of up to register_delay seconds, so a rolling restart does
+        # not hit the seeds all at once.
+        self.snapshot_path = None
+        self.snapshot_interval = 10.0
+        self.snapshot_max_age = 300.0
+        self.snapshot_digests = 4096
+        self.register_delay = 5.0
+        self.warm_started = False
+        # wall clock for message timestamps and the random source for peer
+        # choices, both replaceable so a simulation can be reproduced
+        self.clock = time.time
+        self.rng = random.Random()
+        self.stopped = threading.Event()
+        self.server_socket = None
+        self.connections = {}  # accepted sockets, oldest first, closed by stop()
+        self.backlog = 128
+        self.reuse_address = True
+        # Inbound streams and fan-out tasks run on bounded worker pools that
+        # shed load when full, instead of one new thread each. Idle inbound
+        # streams are closed after inbound_idle_timeout to free their worker,
+        # the sender's pool reconnects when it needs the stream again.
+        self.inbound = WorkerPool(256, 1024, name="inbound", on_error=self.task_failed)
+        self.task_pool = WorkerPool(64, 4096, name="tasks", on_error=self.task_failed)
+        self.inbound_idle_timeout = 60.0
+        # alive/dead updates with incarnation numbers, piggybacked on peer
+        # traffic so deaths and rejoins spread without the seeds
+        self.membership = MembershipUpdates(self.port)
+        # a peer that fails its liveness probes is suspected and declared
+        # dead only when it neither refuted nor answered a probe within
+        # suspect_timeout seconds: peer port -> incarnation suspected at
+        self.suspect_timeout = 3.0
+        self.suspicions = {}
+        self.suspect_lock = threading.Lock()
+        # bounded, self repairing neighbour set
+        self.topology = TopologyManager(self)
+        # eager/lazy broadcast tree of the plumtree strategy
+        self.broadcast_tree = BroadcastTree(self)
+        # hot path counters and latency histograms, the gauges read the
+        # state the other components already keep
+        self.metrics = Metrics()
+        self.metrics.gauge("threads", threading.active_count)
+        self.metrics.gauge("known_peers", lambda: len(self.peer_table.known_peers()))
+        self.metrics.gauge("neighbours", lambda: len(self.peer_table.neighbours()))
+        self.metrics.gauge("seen_cache", lambda: self.seen_messages.metrics())
+        self.metrics.gauge("dissemination", lambda: self.dissemination_stats.metrics())
+        self.metrics.gauge("liveness", lambda: self.liveness.metrics())
+        self.metrics.gauge("pool", lambda: self.pool.metrics())
+        self.metrics.gauge("membership", lambda: self.membership.metrics())
+        self.metrics.gauge("topology", lambda: self.topology.metrics())
+        self.metrics.gauge("broadcast_tree", lambda: self.broadcast_tree.metrics())
+        self.metrics.gauge("inbound", lambda: self.inbound.metrics())
+        self.metrics.gauge("task_pool", lambda: self.task_pool.metrics())
+        self.metrics.gauge("bootstrap", lambda: self.bootstrap.metrics())
 
     def start(self):
         threading.Thread(target=self.listen_for_connections).start()
         threading.Thread(target=self.update_peers_file).start()
-        threading.Thread(target=self.gossip_message_generation).start()
-        threading.Thread(target=self.check_liveness).start()
+        self.scheduler.start()
+        self.start_probes()
+        self.liveness.start()
+        self.start_dissemination()
+        self.start_membership()
+        self.topology.start()
+        self.start_snapshots()
+
+    def timer_failed(self, callback, error):
+        self.metrics.count("timer_failures")
+        self.log.echo("Timer callback {} failed: {!r}", callback, error)
+
+    def task_failed(self, target, error):
+        self.metrics.count("task_failures")
+        self.log.echo("Task {} failed: {!r}", target, error)
+
+    def start_membership(self):
+        # a restarted peer must outrank the death recorded for its last run
+        self.membership.incarnation = int(self.clock())
+        self.membership.announce(self.members())
+
+    def stop(self):
+        # Stop listening, drop inbound streams, pending timers and pooled
+        # connections; to the rest of the network this looks like a crash
+        self.stopped.set()
+        self.scheduler.stop()
+        self.inbound.stop()
+        self.task_pool.stop()
+        sockets = list(self.connections)
+        if self.server_socket is not None:
+            sockets.append(self.server_socket)
+        for open_socket in sockets:
+            try:
+                # shutdown wakes up a thread blocked in accept or recv
+                open_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            open_socket.close()
+        self.pool.close()
+        self.stop_probes()
+
+    def start_probes(self):
+        if self.liveness_transport != "udp":
+            return
+        probe_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            probe_socket.bind((self.host, self.port))
+        except OSError:
+            probe_socket.close()
+            self.log.echo("Failed to bind liveness port {}, probing over tcp", self.port)
+            return
+        # wakes up now and then to notice stop()
+        probe_socket.settimeout(0.5)
+        self.probe_socket = probe_socket
+        self.probe_channel = ProbeChannel(self, process_group(self.host))
+        self.probe_channel.start()
+        self.metrics.gauge("probes", lambda: self.probe_channel.metrics())
+        threading.Thread(target=self.receive_probes, daemon=True).start()
+
+    def stop_probes(self):
+        if self.probe_channel is not None:
+            self.probe_channel.stop()
+        if self.probe_socket is not None:
+            self.probe_socket.close()
+
+    def receive_probes(self):
+        while not self.stopped.is_set():
+            try:
+                data, addr = self.probe_socket.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            try:
+                reply = self.probe_channel.received(data)
+            except ValueError:
+                # one bad datagram must not stop the acks to every later ping
+                self.log.echo("Dropped malformed liveness datagram from {}", addr)
+                continue
+            if reply is not None:
+                try:
+                    self.probe_socket.sendto(reply, addr)
+                except OSError:
+                    pass
+
+    def send_probes(self, peer_ports):
+        # pings carry a membership update like the tcp probes do
+        extra = self.membership.piggyback() or ""
+        for endpoint, datagram in self.probe_channel.pings(peer_ports, extra):
+            self.send_datagram(endpoint, datagram)
+
+    def send_datagram(self, port, datagram):
+        # a lost datagram shows up as a liveness timeout
+        try:
+            self.probe_socket.sendto(datagram, (self.host, port))
+        except OSError:
+            pass
+
+    def probe_acknowledged(self, peer_port):
+        if self.liveness.reply_received(peer_port):
+            self.peer_table.reset_failures(peer_port)
+
+    def start_snapshots(self):
+        if self.snapshot_path is not None:
+            # file writes stay off the scheduler thread
+            self.run_periodic(self.snapshot_interval, lambda: self.run_task(self.save_snapshot))
+
+    def save_snapshot(self):
+        table = self.peer_table
+        snapshot = PeerSnapshot(
+            self.port,
+            self.clock(),
+            table.known_peers(),
+            table.neighbours(),
+            table.failure_counts(),
+            self.seen_messages.digests(self.snapshot_digests),
+        )
+        try:
+            snapshot.save(self.snapshot_path)
+        except OSError:
+            self.log.echo("Failed to write snapshot {}", self.snapshot_path)
+
+    def restore_snapshot(self):
+        # True when the peer resumed from a fresh snapshot of its last run
+        if self.snapshot_path is None:
+            return False
+        snapshot = load_snapshot(self.snapshot_path)
+        if snapshot is None or snapshot.port != self.port:
+            return False
+        if self.clock() - snapshot.written_at > self.snapshot_max_age:
+            return False
+        self.topology.admit(snapshot.known)
+        for peer_port, count in snapshot.failures:
+            self.peer_table.set_failures(peer_port, count)
+        self.seen_messages.restore(snapshot.digests)
+        self.topology.rejoin(snapshot.neighbours)
+        self.warm_started = True
+        self.metrics.count("warm_starts")
+        self.log.echo(
+            "Resumed from snapshot with {} known peers and {} neighbours",
+            len(snapshot.known),
+            len(snapshot.neighbours),
+        )
+        return True
+
+    def start_dissemination(self):
+        if self.strategy.pull:
+            self.run_periodic(self.strategy.pull_interval, self.pull_round)
+
+    def run_task(self, target, *args, on_drop=None):
+        # Every fan-out goes through here so other runtimes can schedule it;
+        # on_drop is called instead when the task pool sheds the task
+        self.task_pool.submit(target, *args, on_drop=on_drop)
+
+    def run_periodic(self, interval, target):
+        def tick():
+            target()
+            self.scheduler.call_later(interval, tick)
+
+        self.scheduler.call_later(interval, tick)
 
     def listen_for_connections(self):
-        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_socket.bind((self.host, self.port))
-        server_socket.listen()
+        server_socket = open_listener(self.host, self.port, self.backlog, self.reuse_address)
+        self.server_socket = server_socket
 
-        print(f"Peer_host listening on {self.host}:{self.port}")
+        self.log.echo("Peer_host listening on {}:{}", self.host, self.port)
 
         # Signal that listening is ready
         self.listening_ready.set()
 
-        while True:
-            client_socket, addr = server_socket.accept()
-            threading.Thread(
-                target=self.handle_peer_connection, args=(client_socket,)
-            ).start()
-
-    def handle_peer_connection(self, client_socket):
-        while True:
-            message = client_socket.recv(1024).decode()
-            if not message:
+        while not self.stopped.is_set():
+            try:
+                client_socket, addr = server_socket.accept()
+            except OSError:
                 break
-            elif message.startswith("Gossip Message"):
-                self.process_gossip_message(message)
-            elif message.startswith("Liveness Request"):
-                self.process_liveness_reply(message)
-            elif message.startswith("Liveness Reply"):
-                continue
+            self.connections[client_socket] = None
+            self.metrics.count("accepted")
+            self.inbound.submit(
+                self.handle_peer_connection,
+                client_socket,
+                on_drop=lambda client_socket=client_socket: self.drop_connection(client_socket),
+            )
+
+    def drop_connection(self, client_socket):
+        # shed under overload, the sender sees the close and backs off
+        self.connections.pop(client_socket, None)
         client_socket.close()
 
+    def handle_peer_connection(self, client_socket):
+        # Pooled streams carry many frames, a legacy sender that closes after
+        # one unterminated text message is still understood
+        reader = framing.FrameReader()
+        try:
+            client_socket.settimeout(self.inbound_idle_timeout)
+            while reader.recv_into(client_socket):
+                for message in reader.messages():
+                    self.handle_message(message)
+            message = reader.finish()
+            if message:
+                self.handle_message(message)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.connections.pop(client_socket, None)
+            client_socket.close()
+
+    def handle_message(self, message):
+        started = time.perf_counter()
+        if message.startswith("Gossip Message"):
+            self.process_gossip_message(message)
+        elif message.startswith("Gossip Batch"):
+            for item in split_batch(message):
+                if item.startswith("Tree Gossip"):
+                    self.broadcast_tree.gossip_received(item)
+                else:
+                    self.process_gossip_message(item)
+        elif message.startswith("Tree Gossip"):
+            self.broadcast_tree.gossip_received(message)
+        elif message.startswith("Gossip IHave"):
+            self.broadcast_tree.ihave_received(message)
+        elif message.startswith("Gossip IWant"):
+            self.broadcast_tree.iwant_received(message)
+        elif message.startswith("Gossip Prune"):
+            self.broadcast_tree.prune_received(message)
+        elif message.startswith("Liveness Request"):
+            self.process_liveness_reply(message)
+        elif message.startswith("Liveness Reply"):
+            self.process_liveness_ack(message)
+        elif message.startswith("Gossip Pull"):
+            self.process_pull_request(message)
+        elif message.startswith("Gossip Offer"):
+            self.process_pull_offer(message)
+        elif message.startswith("Gossip Want"):
+            self.process_pull_want(message)
+        elif message.startswith("Membership"):
+            self.process_membership(message)
+        elif message.startswith("Neighbour Request"):
+            self.topology.request_received(message.split(":")[1])
+        elif message.startswith("Neighbour Reject"):
+            self.topology.rejected(message.split(":")[1])
+        elif message.startswith("Shuffle"):
+            self.topology.shuffle_received(message)
+        self.metrics.timed("handle_message_seconds", started)
+
+    def encode(self, message):
+        if self.wire_format == "text":
+            return framing.encode_text(message)
+        return framing.encode_message(message)
+
+    def send_to_node(self, node_port, message, *extra):
+        # extra messages go out in the same write
+        if self.stopped.is_set():
+            raise ConnectionAbortedError("node is stopped")
+        if self.wire_format == "text":
+            for item in (message, *extra):
+                self.send_legacy(node_port, item)
+            return
+        data = b"".join(framing.encode_message(item) for item in (message, *extra))
+        self.pool.send(self.host, node_port, data)
+
+    def send_legacy(self, node_port, message):
+        # Legacy peers take whatever one recv returns as one message, so a
+        # pooled stream would hand them several at once. Each text message
+        # gets a connection of its own and no terminator, as they send it.
+        address = (self.host, int(node_port))
+        with socket.create_connection(address, timeout=self.pool.connect_timeout) as sock:
+            sock.settimeout(self.pool.send_timeout)
+            sock.sendall(message.encode())
+        self.metrics.count("legacy_connections")
+
+    def piggyback(self):
+        # membership updates to send along with a message to a peer, in
+        # text mode each goes on a connection of its own
+        update = self.membership.piggyback()
+        return (update,) if update else ()
+
+    def members(self):
+        return len(self.peer_table.known_peers()) + 1
+
     def update_peers_file(self):
         # Wait for listening to be ready before updating peers file
         self.listening_ready.wait()
@@ -71,191 +447,897 @@ class PeerNode:
     def connect_to_seeds(self):
         with open(self.seeds_file, "r") as seeds_file:
             seed_ports = [int(line.strip()) for line in seeds_file]
-            self.seeds_list = seed_ports
+        self.use_seeds(seed_ports)
+        self.register_with_seeds()
+
+    def register_with_seeds(self):
+        self.started_at = self.scheduler.now()
+        if self.restore_snapshot():
+            # the neighbours from the snapshot are enough to start gossiping
+            self.bootstrap_complete()
+            self.scheduler.call_later(self.rng.uniform(0, self.register_delay), self.register)
+        else:
+            self.register()
+
+    def register(self):
+        if self.replicated_seeds:
+            # any seed holds a full replica, the next one takes over when
+            # the first fails
+            self.bootstrap.start(self.seeds_for(self.port), quorum=1, failover=True)
+        else:
+            self.bootstrap.start(self.seeds_for(self.port))
+
+    def bootstrap_complete(self):
+        if self.bootstrapped.is_set():
+            return
+        self.bootstrapped.set()
+        self.start_gossip()
+
+    def start_gossip(self):
+        threading.Thread(target=self.gossip_message_generation).start()
+
+    def use_seeds(self, seed_ports):
+        self.seeds_list = seed_ports
+        if self.sharded or self.replicated_seeds:
+            self.seed_ring = HashRing(seed_ports)
 
-        for seed_port in seed_ports:
-            threading.Thread(target=self.connect_to_seednode, args=(seed_port,)).start()
+    def seeds_for(self, peer_port):
+        # the seeds holding the registration of peer_port; replicated seeds
+        # all hold it, in the order of the ring from peer_port's hash on
+        if self.seed_ring is None:
+            return self.seeds_list
+        key = f"{self.host}:{peer_port}"
+        if self.replicated_seeds:
+            return self.seed_ring.responsible(key, len(self.seed_ring))
+        return self.seed_ring.responsible(key, quorum_size(len(self.seed_ring)))
 
-    def connect_to_seednode(self, node_port):
+    def report_seeds(self, peer_port):
+        # seeds a dead peer is reported to, with replicated seeds the first
+        # two on the ring so one seed being down loses no votes
+        if self.replicated_seeds:
+            return self.seeds_for(peer_port)[:2]
+        return self.seeds_for(peer_port)
+
+    def connect_to_seednode(self, node_port, attempt):
+        started = time.perf_counter()
+        try:
+            replies = self.seed_request(node_port, self.register_message())
+        except (OSError, ValueError):
+            self.metrics.count("registration_failures")
+            self.log.echo("Failed to connect to seednode on port: {}", node_port)
+            self.bootstrap.failed(node_port, attempt)
+            return
+        self.metrics.timed("registration_seconds", started)
+        self.log.echo("Connected to seednode on port: {}", node_port)
+        for message in replies:
+            self.process_seed_message(message)
+        self.bootstrap.succeeded(node_port)
+
+    def register_message(self):
+        # optionally ask the seed for a sample of a given size
+        if self.peer_sample_size is None:
+            return f"REGISTER {self.port}"
+        return f"REGISTER {self.port} {self.peer_sample_size}"
+
+    def seed_request(self, node_port, message):
+        # one request, then every reply until the seed closes the connection,
+        # all within the bootstrap timeout so a hung seed cannot pin a thread
+        deadline = time.monotonic() + self.bootstrap.timeout
         node_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
+            node_socket.settimeout(self.bootstrap.timeout)
             node_socket.connect((self.host, node_port))
-            print(f"Connected to seednode on port: {node_port}")
-            # Send register message to seed
-            message = f"REGISTER {self.port}"
-            node_socket.send(message.encode())
+            node_socket.sendall(self.encode(message))
+            reader = framing.FrameReader()
+            replies = []
             while True:
-                message = node_socket.recv(1024).decode()
-                if not message:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout(f"no reply from seed {node_port} in time")
+                node_socket.settimeout(remaining)
+                if not reader.recv_into(node_socket):
                     break
-                # Process the message
-                print(f"Received message: {message}")
-                if message.startswith("PEERS"):
-                    # write the message to the output file
-                    with open(self.output_file, "a") as file:
-                        file.write(f"{message}\n")
-                    peer_list = message.split()[1:]
-                    self.peers_list.extend(peer_list)
-                    # Remove duplicates from peer list
-                    self.peers_list = list(set(self.peers_list))
-                    # Connect to random 4 peers
-                    random.shuffle(self.peers_list)
-                    # self.peers_list = int(self.peers_list)
-                    num_to_connect = min(len(self.peers_list), 4)
-                    for peer_port in self.peers_list[:num_to_connect]:
-                        threading.Thread(
-                            target=self.connect_to_peernode, args=(int(peer_port),)
-                        ).start()
-        except ConnectionRefusedError:
-            print(f"Failed to connect to seednode on port: {node_port}")
+                replies.extend(reader.messages())
+            message = reader.finish()
+            if message:
+                replies.append(message)
+            return replies
         finally:
             node_socket.close()
 
+    def request_more_peers(self, seed_port, cursor=0, count=32):
+        # page through the seed's registry, returns the cursor of the next
+        # page or 0 once everything has been seen
+        try:
+            replies = self.seed_request(seed_port, f"GET PEERS {cursor} {count}")
+        except (OSError, ValueError):
+            self.log.echo("Failed to request peers from seednode on port: {}", seed_port)
+            return 0
+        return self.process_more_peers(replies)
+
+    def process_more_peers(self, replies):
+        next_cursor = 0
+        for message in replies:
+            if message.startswith("MORE PEERS"):
+                _, _, cursor, *peer_list = message.split()
+                next_cursor = int(cursor)
+                self.add_peers(peer_list)
+        self.topology.seed_cursor = next_cursor
+        return next_cursor
+
+    def process_seed_message(self, message):
+        # Process the message
+        self.log.echo("Received message: {}", message)
+        if message.startswith("PEERS"):
+            # write the message to the output file
+            self.log.write(message)
+            self.add_peers(message.split()[1:])
+
+    def add_peers(self, peer_list):
+        self.topology.admit(peer_list)
+        # connect to random peers until we have enough neighbours
+        self.topology.fill()
+
     def connect_to_peernode(self, node_port):
-        node_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # the request opens the pooled stream the link keeps using
+        if node_port == self.port:
+            return
         try:
-            if node_port == self.port:
-                return
-            node_socket.connect((self.host, node_port))
-            # initiate the consecutive failures counter for the peer
-            self.consecutive_failures[str(node_port)] = 0
-            print(f"Connected to peernode on port: {node_port}")
-        except ConnectionRefusedError:
-            print(f"Failed to connect to peernode on port: {node_port}")
-        finally:
-            node_socket.close()
+            self.send_to_node(node_port, f"Neighbour Request:{self.port}")
+        except OSError:
+            self.log.echo("Failed to connect to peernode on port: {}", node_port)
+            self.topology.connect_failed(node_port)
+            return
+        self.peer_connected(node_port)
+
+    def peer_connected(self, node_port):
+        # initiate the consecutive failures counter for the peer
+        self.peer_table.reset_failures(node_port)
+        self.peer_table.add_neighbour(node_port)
+        self.topology.connected(node_port)
+        self.log.echo("Connected to peernode on port: {}", node_port)
 
     def gossip_message_generation(self):
-        for _ in range(10):  # Generate 10 messages
-            timestamp = int(time.time())
-            message = f"Gossip Message:{timestamp}:{self.host}:{self.port}"
-            print(f"Generated message: {message}")
-            # Broadcast message to all connected peers
-            for peer_port in self.peers_list:
-                threading.Thread(
-                    target=self.send_gossip_message, args=(peer_port, message)
-                ).start()
-            time.sleep(5)  # Sleep for 5 seconds between messages
+        if self.workload is not None:
+            self.start_workload()
+            return
+        for _ in range(self.gossip_count):
+            self.generate_gossip_message()
+            if self.stopped.wait(self.gossip_interval):
+                break
+
+    def start_workload(self):
+        self.workload.start(self.scheduler.now)
+        self.scheduler.call_later(0, self.workload_step)
+
+    def workload_step(self):
+        if self.stopped.is_set():
+            return
+        count = self.workload.next_burst(self.scheduler.now())
+        if not count:
+            return
+        for _ in range(count):
+            self.generate_gossip_message(self.workload.payload())
+        # the token bucket holds the next burst back when the last ones came
+        # too fast
+        delay = max(self.workload.next_gap(), self.workload.bucket.take(count))
+        self.scheduler.call_later(delay, self.workload_step)
+
+    def generate_gossip_message(self, payload=""):
+        timestamp = int(self.clock())
+        message = f"Gossip Message:{timestamp}:{self.host}:{self.port}"
+        if payload:
+            message = f"{message}::{payload}"
+        if self.strategy.hops is not None:
+            message = with_hops(message, self.strategy.hops)
+        self.log.echo("Generated message: {}", message)
+        # our own message coming back is a duplicate
+        self.seen_messages.check_and_add(message_digest(message), message)
+        self.dissemination_stats.count("originated")
+        if self.strategy.tree:
+            self.tree_broadcast(message)
+        elif self.strategy.push:
+            self.forward_gossip(message)
+
+    def gossip_candidates(self):
+        # fall back to every known peer until we have connected to some
+        return self.peer_table.neighbours() or self.peer_table.known_peers()
+
+    def forward_gossip(self, message, exclude=()):
+        targets = self.strategy.push_targets(self.gossip_candidates(), exclude)
+        for peer_port in targets:
+            self.push_gossip(peer_port, message)
+        self.dissemination_stats.count("forwarded", len(targets))
+        self.metrics.count("gossip_forwarded", len(targets))
+
+    def tree_broadcast(self, message, exclude=()):
+        pushed = self.broadcast_tree.broadcast(message, exclude)
+        self.dissemination_stats.count("forwarded", pushed)
+        self.metrics.count("gossip_forwarded", pushed)
+
+    def push_gossip(self, peer_port, message):
+        if self.gossip_batch_size > 1:
+            self.queue_gossip(peer_port, message)
+        else:
+            self.run_task(self.send_gossip_message, peer_port, message)
 
     def send_gossip_message(self, peer_port, message):
-        node_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            node_socket.connect((self.host, int(peer_port)))
-            node_socket.send(message.encode())
-            print(f"Sent gossip message to peer on port {peer_port}: {message}")
-        except ConnectionRefusedError:
-            print(f"Failed to send message to peer on port: {peer_port}")
-        finally:
-            node_socket.close()
+            self.send_to_node(peer_port, message, *self.piggyback())
+            self.log.echo("Sent gossip message to peer on port {}: {}", peer_port, message)
+        except OSError:
+            self.metrics.count("send_failures")
+            self.log.echo("Failed to send message to peer on port: {}", peer_port)
 
-    def process_gossip_message(self, message):
-        _, timestamp, _, _ = message.split(":")
-        if timestamp not in self.message_list:
-            # Add message to message list and forward to other peers
-            self.message_list[timestamp] = True
-            print(f"Received new gossip message: {message}")
-            # write the message to the output file
-            with open(self.output_file, "a") as file:
-                file.write(f"{message}\n")
+    def queue_gossip(self, peer_port, message):
+        with self.outbox_lock:
+            batch = self.outbox.setdefault(peer_port, [])
+            batch.append(message)
+            first = len(batch) == 1
+            full = len(batch) >= self.gossip_batch_size
+            if full:
+                del self.outbox[peer_port]
+        if full:
+            self.run_task(self.send_gossip_batch, peer_port, batch)
+        elif first:
+            self.scheduler.call_later(self.gossip_batch_delay, self.flush_gossip, peer_port)
 
-            # write the message to the output file
-            for peer_port in self.peers_list:
-                threading.Thread(
-                    target=self.send_gossip_message, args=(peer_port, message)
-                ).start()
-
-    def check_liveness(self):
-        while True:
-            self.liveness_timer = threading.Timer(13.0, self.send_liveness_request)
-            self.liveness_timer.start()
-            time.sleep(15)  # Check liveness every 15 seconds
-
-    def send_liveness_request(self):
-        for peer_port in self.peers_list:
-            # if peer already dead, skip
-            if peer_port in self.dead_nodes:
-                continue
-            message = f"Liveness Request:{int(time.time())}:{self.port}"
-            threading.Thread(
-                target=self.send_liveness_message, args=(peer_port, message)
-            ).start()
+    def flush_gossip(self, peer_port):
+        with self.outbox_lock:
+            batch = self.outbox.pop(peer_port, None)
+        if batch:
+            self.run_task(self.send_gossip_batch, peer_port, batch)
+
+    def send_gossip_batch(self, peer_port, messages):
+        message = messages[0] if len(messages) == 1 else gossip_batch(messages)
+        self.metrics.count("gossip_batches")
+        try:
+            self.send_to_node(peer_port, message, *self.piggyback())
+            self.log.echo("Sent {} gossip messages to peer on port {}", len(messages), peer_port)
+        except OSError:
+            self.metrics.count("send_failures")
+            self.log.echo("Failed to send message to peer on port: {}", peer_port)
+
+    def process_gossip_message(self, message, sender=None):
+        # sender is the neighbour a broadcast tree message came from
+        started = time.perf_counter()
+        self.metrics.count("gossip_received")
+        if not self.seen_messages.check_and_add(message_digest(message), message):
+            self.dissemination_stats.count("redundant")
+            self.metrics.count("gossip_duplicate")
+            if self.strategy.tree and sender is not None:
+                self.broadcast_tree.duplicate(sender)
+            self.metrics.timed("gossip_duplicate_seconds", started)
+            return
+        # New message, remember it and forward to other peers
+        self.dissemination_stats.count("delivered")
+        if self.strategy.tree:
+            self.broadcast_tree.delivered(message, sender)
+        if self.first_gossip_at is None and self.started_at is not None:
+            self.first_gossip_at = self.scheduler.now()
+            self.metrics.observe("time_to_first_gossip_seconds", self.first_gossip_at - self.started_at)
+        self.log.echo("Received new gossip message: {}", message)
+        # write the message to the output file
+        self.log.write(message)
+
+        _, _, origin_port, hops, _ = gossip_fields(message)
+        if hops is not None:
+            if hops <= 1:
+                self.dissemination_stats.count("hop_limited")
+                self.metrics.timed("gossip_new_seconds", started)
+                return
+            message = with_hops(message, hops - 1)
+        if self.strategy.tree:
+            self.tree_broadcast(message, exclude=(origin_port, sender))
+        elif self.strategy.push:
+            self.forward_gossip(message, exclude=(origin_port,))
+        self.metrics.timed("gossip_new_seconds", started)
+
+    def pull_round(self):
+        # Anti-entropy: tell one neighbour what we saw lately, it offers the
+        # ids of the messages it has besides those, and we ask only for the
+        # ones our whole cache lacks. Bodies travel only for real misses.
+        peer_port = self.strategy.pull_target(self.gossip_candidates())
+        if peer_port is None:
+            return
+        recent = self.seen_messages.recent(self.strategy.pull_digests)
+        digests = ",".join(key.hex() for key, _ in recent)
+        self.dissemination_stats.count("pull_requests")
+        self.run_task(self.send_peer_message, peer_port, f"Gossip Pull:{self.port}:{digests}")
+
+    def process_pull_request(self, message):
+        # Gossip Pull:<port>:<message ids>
+        _, peer_port, digests = message.split(":", 2)
+        known = set(digests.split(",")) if digests else set()
+        offered = [
+            key.hex() for key, _ in self.seen_messages.recent(self.strategy.pull_digests)
+            if key.hex() not in known
+        ]
+        if offered:
+            self.dissemination_stats.count("pull_offers")
+            self.run_task(self.send_peer_message, peer_port, f"Gossip Offer:{self.port}:{','.join(offered)}")
+
+    def process_pull_offer(self, message):
+        # Gossip Offer:<port>:<message ids>
+        _, peer_port, ids = message.split(":", 2)
+        wanted = [
+            message_id for message_id in ids.split(",")
+            if message_id and bytes.fromhex(message_id) not in self.seen_messages
+        ]
+        if wanted:
+            self.dissemination_stats.count("pull_wants")
+            self.run_task(self.send_peer_message, peer_port, f"Gossip Want:{self.port}:{','.join(wanted)}")
+
+    def process_pull_want(self, message):
+        # Gossip Want:<port>:<message ids>
+        _, peer_port, ids = message.split(":", 2)
+        for message_id in ids.split(","):
+            stored = self.seen_messages.get(bytes.fromhex(message_id))
+            if isinstance(stored, str):
+                self.dissemination_stats.count("pull_replies")
+                self.run_task(self.send_gossip_message, peer_port, stored)
+
+    def send_peer_message(self, peer_port, message):
+        try:
+            self.send_to_node(peer_port, message, *self.piggyback())
+        except OSError:
+            self.metrics.count("send_failures")
+            self.log.echo("Failed to send message to peer on port: {}", peer_port)
+
+    def send_liveness_batch(self, peer_ports):
+        # one task probes every peer that came due in the same tick
+        if self.probe_channel is not None:
+            self.send_probes(peer_ports)
+            return
+        message = f"Liveness Request:{int(self.clock())}:{self.port}"
+        for peer_port in peer_ports:
+            self.send_liveness_message(peer_port, message)
 
     def send_liveness_message(self, peer_port, message):
-        node_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            node_socket.connect((self.host, int(peer_port)))
-            node_socket.send(message.encode())
-            print(f"Sent liveness request to peer on port {peer_port}: {message}")
-        except ConnectionRefusedError:
-            print(f"Failed to send liveness request to peer on port: {peer_port}")
-            self.consecutive_failures[str(peer_port)] += 1
-            if self.consecutive_failures[str(peer_port)] >= 3:
-                self.notify_seed_dead_node(peer_port)
-                # close the connection with the dead peer
-                node_socket.close()
-        finally:
-            node_socket.close()
+            self.send_to_node(peer_port, message, *self.piggyback())
+            self.log.echo("Sent liveness request to peer on port {}: {}", peer_port, message)
+        except OSError:
+            self.log.echo("Failed to send liveness request to peer on port: {}", peer_port)
+            self.liveness.probe_failed(peer_port)
+            self.record_liveness_failure(peer_port)
+
+    def process_liveness_ack(self, reply):
+        _, _, peer_port = reply.split(":")
+        self.probe_acknowledged(peer_port)
+
+    def record_liveness_failure(self, peer_port):
+        self.metrics.count("liveness_failures")
+        if self.probe_channel is not None:
+            self.probe_channel.unreachable(peer_port)
+        if self.peer_table.increment_failures(peer_port) >= 3:
+            self.suspect_peer(peer_port)
+
+    def suspect_peer(self, peer_port):
+        # the suspicion spreads with the membership updates, so the peer
+        # learns about it and can refute it with a newer incarnation
+        peer_port = str(peer_port)
+        incarnation = self.membership.incarnation_of(peer_port)
+        with self.suspect_lock:
+            if peer_port in self.suspicions:
+                return
+            self.suspicions[peer_port] = incarnation
+        self.metrics.count("suspected")
+        self.membership.record(peer_port, SUSPECT, incarnation, self.members())
+        # one more probe before the verdict, the last may have been lost
+        self.liveness.probe_soon(peer_port)
+        self.scheduler.call_later(self.suspect_timeout, self.suspect_expired, peer_port)
+
+    def suspect_expired(self, peer_port):
+        with self.suspect_lock:
+            incarnation = self.suspicions.pop(peer_port, None)
+        state = self.membership.state_of(peer_port)
+        refuted = state is not None and state[0] == ALIVE and state[1] > incarnation
+        if refuted or self.peer_table.failure_count(peer_port) == 0:
+            # a newer alive update or a probe answer cleared the suspicion
+            self.metrics.count("suspicions_refuted")
+            return
+        self.notify_seed_dead_node(peer_port)
+
+    def peer_died(self, peer_port):
+        # True only for the caller that actually declared the peer dead
+        was_neighbour = str(peer_port) in self.peer_table.neighbours()
+        if not self.peer_table.mark_dead(peer_port):
+            return False
+        self.liveness.untrack(peer_port)
+        # close the stream to the dead peer
+        self.pool.discard(self.host, peer_port)
+        if was_neighbour:
+            self.topology.fill()
+        return True
+
+    def process_membership(self, message):
+        try:
+            updates = parse_membership(message)
+        except ValueError:
+            return
+        for port, status, incarnation in self.membership.received(updates, self.members()):
+            if status == DEAD:
+                # A peer that saw the dead peer fail itself corroborates the
+                # report towards the seeds' quorum, others stay quiet
+                corroborated = self.peer_table.failure_count(port) > 0
+                if self.peer_died(port) and corroborated:
+                    self.queue_dead_report(port)
+            elif status == ALIVE and self.peer_table.is_dead(port):
+                # the peer rejoined with a newer incarnation
+                self.peer_table.revive(port)
+                self.peer_table.reset_failures(port)
+                self.topology.admit([port])
 
     def send_liveness_message_reply(self, peer_port, message):
-        node_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            node_socket.connect((self.host, int(peer_port)))
-            node_socket.send(message.encode())
-            print(f"Sent liveness reply to peer on port {peer_port}: {message}")
-        except ConnectionRefusedError:
-            print(f"Failed to send liveness reply to peer on port: {peer_port}")
-        finally:
-            node_socket.close()
+            self.send_to_node(peer_port, message, *self.piggyback())
+            self.log.echo("Sent liveness reply to peer on port {}: {}", peer_port, message)
+        except OSError:
+            self.log.echo("Failed to send liveness reply to peer on port: {}", peer_port)
 
     def process_liveness_reply(self, request):
-        print(f"Received liveness request: {request}")
+        self.log.echo("Received liveness request: {}", request)
         _, sender_timestamp, sender_port = request.split(":")
         # send a reply to the sender that the peer is alive
-        reply = f"Liveness Reply:{int(time.time())}:{self.port}"
-        threading.Thread(
-            target=self.send_liveness_message_reply, args=(int(sender_port), reply)
-        ).start()
+        reply = f"Liveness Reply:{int(self.clock())}:{self.port}"
+        # a shed reply would get us declared dead, so it is sent right here
+        self.run_task(
+            self.send_liveness_message_reply,
+            int(sender_port),
+            reply,
+            on_drop=lambda: self.send_liveness_message_reply(int(sender_port), reply),
+        )
 
     def notify_seed_dead_node(self, peer_port):
-        if peer_port not in self.dead_nodes:
-            self.dead_nodes.append(peer_port)
-            for seed_port in self.seeds_list:
-                message = (
-                    f"Dead Node:{self.host}:{peer_port}:{int(time.time())}:{self.host}"
-                )
-                threading.Thread(
-                    target=self.send_dead_node_message, args=(seed_port, message)
-                ).start()
-
-        else:
+        # only the first caller to declare the peer dead reports it
+        if not self.peer_died(peer_port):
             return
+        # incarnations start at the peer's start time, so declaring it dead
+        # as of now outranks every alive update it sent before
+        incarnation = max(self.membership.incarnation_of(peer_port), int(self.clock()))
+        self.membership.record(peer_port, DEAD, incarnation, self.members())
+        self.queue_dead_report(peer_port)
 
-    def send_dead_node_message(self, seed_port, message):
-        node_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    def queue_dead_report(self, peer_port):
+        report = (self.host, int(peer_port), int(self.clock()))
+        with self.report_lock:
+            for seed_port in self.report_seeds(peer_port):
+                self.dead_reports.setdefault(seed_port, []).append(report)
+            if self.report_pending:
+                return
+            self.report_pending = True
+        self.scheduler.call_later(self.report_interval, self.flush_dead_reports)
+
+    def flush_dead_reports(self):
+        with self.report_lock:
+            reports, self.dead_reports = self.dead_reports, {}
+            self.report_pending = False
+        for seed_port, dead in reports.items():
+            self.run_task(self.send_dead_node_report, seed_port, dead)
+
+    def dead_nodes_message(self, dead):
+        entries = ",".join(f"{ip}:{port}" for ip, port, _ in dead)
+        return f"Dead Nodes:{int(self.clock())}:{self.host}:{self.port}:{entries}"
+
+    def send_dead_node_report(self, seed_port, dead):
         try:
-            node_socket.connect((self.host, int(seed_port)))
-            node_socket.send(message.encode())
-            # write the message to the output file
-            with open(self.output_file, "a") as file:
-                file.write(f"{message}\n")
+            self.send_to_node(seed_port, self.dead_nodes_message(dead))
+            self.dead_nodes_reported(seed_port, dead)
+        except OSError:
+            self.log.echo("Failed to send dead node message to seed on port: {}", seed_port)
 
-            print(f"Sent dead node message to seed on port {seed_port}: {message}")
-        except ConnectionRefusedError:
-            print(f"Failed to send dead node message to seed on port: {seed_port}")
-        finally:
-            node_socket.close()
+    def dead_nodes_reported(self, seed_port, dead):
+        # the output file keeps one Dead Node line per reported peer
+        for ip, port, timestamp in dead:
+            self.dead_node_reported(seed_port, f"Dead Node:{ip}:{port}:{timestamp}:{self.host}")
+
+    def dead_node_reported(self, seed_port, message):
+        # write the message to the output file
+        self.log.write(message)
+
+        self.log.echo("Sent dead node message to seed on port {}: {}", seed_port, message)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python PeerNode.py <random_port>")
-        sys.exit(1)
-
-    try:
-        random_port = int(sys.argv[1])
-    except ValueError:
-        print("Invalid port number. Please provide a valid integer.")
-        sys.exit(1)
-
-    peer = PeerNode("127.0.0.1", random_port)
-    threading.Thread(target=peer.start).start()
+    parser = argparse.ArgumentParser(description="Run a gossip peer node.")
+    parser.add_argument("port", type=int, help="port to listen on")
+    parser.add_argument(
+        "--runtime",
+        choices=["threads", "asyncio"],
+        default="threads",
+        help="thread per connection or a single asyncio event loop",
+    )
+    parser.add_argument(
+        "--count",
+        type=int,
+        default=1,
+        help="number of peers to run on consecutive ports",
+    )
+    parser.add_argument(
+        "--wire",
+        choices=["binary", "text"],
+        default="binary",
+        help="length prefixed binary frames, or legacy text with one message per connection",
+    )
+    parser.add_argument(
+        "--cache-capacity",
+        type=int,
+        default=65536,
+        help="number of gossip digests remembered for deduplication",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=600.0,
+        help="seconds a gossip digest is remembered after it was last seen",
+    )
+    parser.add_argument(
+        "--strategy",
+        choices=sorted(STRATEGIES),
+        default="push-pull",
+        help="how gossip is disseminated to neighbours",
+    )
+    parser.add_argument(
+        "--fanout",
+        type=int,
+        default=3,
+        help="neighbours each message is pushed to, 0 for all of them",
+    )
+    parser.add_argument(
+        "--hops",
+        type=int,
+        default=None,
+        help="hop budget of generated messages, unlimited when omitted",
+    )
+    parser.add_argument(
+        "--ihave-timeout",
+        type=float,
+        default=0.5,
+        help="plumtree: seconds to wait for a message announced by IHave before asking for it",
+    )
+    parser.add_argument(
+        "--pull-interval",
+        type=float,
+        default=2.0,
+        help="seconds between anti-entropy pull rounds",
+    )
+    parser.add_argument(
+        "--sample-size",
+        type=int,
+        default=None,
+        help="number of peers to request from each seed on registration",
+    )
+    parser.add_argument(
+        "--sharded",
+        action="store_true",
+        help="seeds are shards of a hash ring, register only with ours",
+    )
+    parser.add_argument(
+        "--seed-timeout",
+        type=float,
+        default=3.0,
+        help="seconds a seed has to answer a registration before it is retried",
+    )
+    parser.add_argument(
+        "--seed-attempts",
+        type=int,
+        default=8,
+        help="registration attempts per seed, retried with exponential backoff",
+    )
+    parser.add_argument(
+        "--replicated-seeds",
+        action="store_true",
+        help="seeds replicate their registries, register with one seed and fail over to the next",
+    )
+    parser.add_argument(
+        "--degree",
+        type=int,
+        default=4,
+        help="neighbours each peer keeps",
+    )
+    parser.add_argument(
+        "--max-degree",
+        type=int,
+        default=8,
+        help="most neighbours a peer accepts, further requests are rejected",
+    )
+    parser.add_argument(
+        "--shuffle-interval",
+        type=float,
+        default=5.0,
+        help="seconds between shuffles of the known peers cache, 0 disables",
+    )
+    parser.add_argument(
+        "--report-interval",
+        type=float,
+        default=1.0,
+        help="seconds dead peers are collected before one batched report",
+    )
+    parser.add_argument(
+        "--suspect-timeout",
+        type=float,
+        default=3.0,
+        help="seconds a peer that failed its probes has to refute before it is declared dead",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=256,
+        help="most inbound connections served at once",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=1024,
+        help="accepted connections waiting for a worker before load is shed",
+    )
+    parser.add_argument(
+        "--overload-policy",
+        choices=POLICIES,
+        default="reject",
+        help="on a full queue close the new connection, the oldest waiting one, or stop accepting",
+    )
+    parser.add_argument(
+        "--backlog",
+        type=int,
+        default=128,
+        help="listen backlog of the server socket",
+    )
+    parser.add_argument(
+        "--reuse-addr",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="set SO_REUSEADDR on the server socket",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=60.0,
+        help="seconds an idle inbound stream holds its worker before it is closed",
+    )
+    parser.add_argument(
+        "--task-workers",
+        type=int,
+        default=64,
+        help="most outgoing sends and seed requests running at once",
+    )
+    parser.add_argument(
+        "--task-queue-size",
+        type=int,
+        default=4096,
+        help="tasks waiting for a worker before load is shed",
+    )
+    parser.add_argument(
+        "--task-overload-policy",
+        choices=TASK_POLICIES,
+        default="reject",
+        help="on a full task queue drop the new task or the oldest waiting one",
+    )
+    parser.add_argument(
+        "--gossip-rate",
+        type=float,
+        default=None,
+        help="gossip messages per second, replaces the fixed schedule",
+    )
+    parser.add_argument(
+        "--gossip-burst",
+        type=int,
+        default=1,
+        help="messages originated together, also the token bucket depth",
+    )
+    parser.add_argument(
+        "--gossip-arrivals",
+        choices=ARRIVALS,
+        default="fixed",
+        help="evenly spaced or Poisson distributed bursts",
+    )
+    parser.add_argument(
+        "--gossip-max-rate",
+        type=float,
+        default=None,
+        help="token bucket rate limit in messages per second, the gossip rate by default",
+    )
+    parser.add_argument(
+        "--payload-size",
+        default="0",
+        help="payload bytes: N, LOW-HIGH for uniform sizes or exp:MEAN",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="most forwarded gossip messages sent to a neighbour in one frame",
+    )
+    parser.add_argument(
+        "--batch-delay",
+        type=float,
+        default=0.005,
+        help="seconds forwarded gossip waits for more messages to the same neighbour",
+    )
+    parser.add_argument(
+        "--gossip-duration",
+        type=float,
+        default=None,
+        help="seconds the gossip workload runs, until stopped when omitted",
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="skip console output, events still go to the output file",
+    )
+    parser.add_argument(
+        "--log-format",
+        choices=["line", "binary"],
+        default="line",
+        help="text lines or compact binary records in the output file",
+    )
+    parser.add_argument(
+        "--log-flush-interval",
+        type=float,
+        default=0.5,
+        help="longest a logged event waits before it is written",
+    )
+    parser.add_argument(
+        "--log-flush-size",
+        type=int,
+        default=1024,
+        help="events written together in one batch",
+    )
+    parser.add_argument(
+        "--liveness-interval",
+        type=float,
+        default=15.0,
+        help="seconds between liveness probes of the same peer",
+    )
+    parser.add_argument(
+        "--liveness-transport",
+        choices=["tcp", "udp"],
+        default="tcp",
+        help="probe peers over the pooled tcp streams or with udp ping/ack datagrams",
+    )
+    parser.add_argument(
+        "--liveness-jitter",
+        type=float,
+        default=0.2,
+        help="fraction of the interval each probe deadline is randomly moved by",
+    )
+    parser.add_argument(
+        "--liveness-batch",
+        type=int,
+        default=64,
+        help="most probes sent by one task",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="serve the metrics of every peer in this process over HTTP",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        default=None,
+        help="file a JSON snapshot of the metrics is written to",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=5.0,
+        help="seconds between metrics snapshots written to the file",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="profile every thread, dumps profile_<port>[.<component>].pstats",
+    )
+    parser.add_argument(
+        "--trace-alloc",
+        action="store_true",
+        help="trace allocations, dumps alloc_<port>.snapshot and alloc_<port>.txt",
+    )
+    parser.add_argument(
+        "--profile-interval",
+        type=float,
+        default=30.0,
+        help="seconds between profile dumps, SIGUSR1 dumps at once",
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="save peer state to snapshot_<port>.bin and resume from it on restart",
+    )
+    parser.add_argument(
+        "--snapshot-interval",
+        type=float,
+        default=10.0,
+        help="seconds between snapshots",
+    )
+    parser.add_argument(
+        "--snapshot-max-age",
+        type=float,
+        default=300.0,
+        help="older snapshots are ignored and the peer starts cold",
+    )
+    parser.add_argument(
+        "--register-delay",
+        type=float,
+        default=5.0,
+        help="longest random delay before a warm started peer registers with the seeds",
+    )
+    args = parser.parse_args()
+    # before any thread starts, so each one gets its own profiler
+    start_profiling(args.port, args.profile_interval, args.profile, args.trace_alloc)
+    configure_writer(args.log_flush_interval, args.log_flush_size)
+    start_exporter(args.metrics_port, args.metrics_file, args.metrics_interval)
+
+    def configure(peer):
+        if args.log_format == "binary":
+            peer.output_file = f"output_{peer.port}.bin"
+        peer.log = OutputLog(peer.output_file, args.log_format, args.quiet)
+        peer.liveness = LivenessMonitor(
+            peer,
+            interval=args.liveness_interval,
+            jitter=args.liveness_jitter,
+            batch_size=args.liveness_batch,
+        )
+        peer.wire_format = args.wire
+        peer.liveness_transport = args.liveness_transport
+        peer.peer_sample_size = args.sample_size
+        peer.sharded = args.sharded
+        peer.replicated_seeds = args.replicated_seeds
+        peer.bootstrap = SeedBootstrap(peer, timeout=args.seed_timeout, max_attempts=args.seed_attempts)
+        peer.report_interval = args.report_interval
+        peer.suspect_timeout = args.suspect_timeout
+        peer.backlog = args.backlog
+        peer.reuse_address = args.reuse_addr
+        peer.inbound_idle_timeout = args.idle_timeout
+        peer.inbound = WorkerPool(
+            args.workers, args.queue_size, args.overload_policy, name="inbound", on_error=peer.task_failed
+        )
+        peer.task_pool = WorkerPool(
+            args.task_workers, args.task_queue_size, args.task_overload_policy, name="tasks",
+            on_error=peer.task_failed,
+        )
+        peer.topology = TopologyManager(
+            peer,
+            target_degree=args.degree,
+            max_degree=args.max_degree,
+            shuffle_interval=args.shuffle_interval,
+        )
+        peer.seen_messages = SeenCache(args.cache_capacity, args.cache_ttl)
+        if args.gossip_rate:
+            peer.workload = GossipWorkload(
+                args.gossip_rate,
+                burst=args.gossip_burst,
+                arrivals=args.gossip_arrivals,
+                payload=args.payload_size,
+                max_rate=args.gossip_max_rate,
+                duration=args.gossip_duration,
+            )
+        peer.gossip_batch_size = args.batch_size
+        peer.gossip_batch_delay = args.batch_delay
+        if args.snapshot:
+            peer.snapshot_path = f"snapshot_{peer.port}.bin"
+            peer.snapshot_interval = args.snapshot_interval
+            peer.snapshot_max_age = args.snapshot_max_age
+            peer.register_delay = args.register_delay
+            # a clean shutdown leaves the freshest snapshot behind
+            atexit.register(peer.save_snapshot)
+        peer.strategy = make_strategy(
+            args.strategy,
+            fanout=args.fanout,
+            hops=args.hops,
+            pull_interval=args.pull_interval,
+        )
+        peer.broadcast_tree = BroadcastTree(peer, ihave_timeout=args.ihave_timeout)
+        default_exporter.register(f"peer-{peer.port}", peer.metrics)
+
+    if args.runtime == "asyncio":
+        from async_node import run_peers
+
+        run_peers("127.0.0.1", range(args.port, args.port + args.count), configure)
+    else:
+        for port in range(args.port, args.port + args.count):
+            peer = PeerNode("127.0.0.1", port)
+            configure(peer)
+            threading.Thread(target=peer.start).start()
@@ -0,0 +1,124 @@
+import threading
+
+
+class PeerStateTable:
+    # Known peers, neighbours, dead peers and consecutive failure counters of
+    # one PeerNode. Membership changes serialize on one lock and publish a
+    # fresh tuple (copy on write), so gossip fan-out and liveness sweeps
+    # iterate a consistent snapshot without taking any lock. Failure counters
+    # are spread over striped locks, so counting a failure only contends with
+    # peers that hash to the same stripe.
+    def __init__(self, stripes=16):
+        self.lock = threading.Lock()
+        self.known = {}  # insertion ordered set of peer ports
+        self.known_snapshot = ()
+        self.neighbour_set = {}
+        self.neighbour_snapshot = ()
+        self.dead = set()
+        self.stripes = [threading.Lock() for _ in range(stripes)]
+        self.failures = {}
+
+    def add_known(self, ports):
+        # returns the ports that were not known yet, dead peers are ignored
+        added = []
+        with self.lock:
+            for port in ports:
+                port = str(port)
+                if port not in self.known and port not in self.dead:
+                    self.known[port] = None
+                    added.append(port)
+            if added:
+                self.known_snapshot = tuple(self.known)
+        return added
+
+    def remove_known(self, ports):
+        # returns the ports that were known, neighbours stay neighbours
+        removed = []
+        with self.lock:
+            for port in ports:
+                port = str(port)
+                if port in self.known:
+                    del self.known[port]
+                    removed.append(port)
+            if removed:
+                self.known_snapshot = tuple(self.known)
+        return removed
+
+    def known_peers(self):
+        return self.known_snapshot
+
+    def is_known(self, port):
+        return str(port) in self.known
+
+    def add_neighbour(self, port):
+        port = str(port)
+        with self.lock:
+            if port in self.neighbour_set or port in self.dead:
+                return False
+            self.neighbour_set[port] = None
+            self.neighbour_snapshot = tuple(self.neighbour_set)
+            return True
+
+    def remove_neighbour(self, port):
+        port = str(port)
+        with self.lock:
+            if port not in self.neighbour_set:
+                return False
+            del self.neighbour_set[port]
+            self.neighbour_snapshot = tuple(self.neighbour_set)
+            return True
+
+    def neighbours(self):
+        return self.neighbour_snapshot
+
+    def mark_dead(self, port):
+        # True only for the caller that actually declared the peer dead
+        port = str(port)
+        with self.lock:
+            if port in self.dead:
+                return False
+            self.dead.add(port)
+            if port in self.known:
+                del self.known[port]
+                self.known_snapshot = tuple(self.known)
+            if port in self.neighbour_set:
+                del self.neighbour_set[port]
+                self.neighbour_snapshot = tuple(self.neighbour_set)
+            return True
+
+    def revive(self, port):
+        with self.lock:
+            self.dead.discard(str(port))
+
+    def is_dead(self, port):
+        return str(port) in self.dead
+
+    def dead_peers(self):
+        with self.lock:
+            return list(self.dead)
+
+    def stripe(self, port):
+        return self.stripes[hash(port) % len(self.stripes)]
+
+    def increment_failures(self, port):
+        port = str(port)
+        with self.stripe(port):
+            count = self.failures.get(port, 0) + 1
+            self.failures[port] = count
+            return count
+
+    def reset_failures(self, port):
+        port = str(port)
+        with self.stripe(port):
+            self.failures[port] = 0
+
+    def set_failures(self, port, count):
+        port = str(port)
+        with self.stripe(port):
+            self.failures[port] = count
+
+    def failure_counts(self):
+        return list(self.failures.items())
+
+    def failure_count(self, port):
+        return self.failures.get(str(port), 0)
@@ -0,0 +1,162 @@
+import threading
+
+from gossip_cache import message_digest
+
+
+class BroadcastTree:
+    # Plumtree broadcast over the neighbour set. Message bodies travel on
+    # eager links only, lazy links carry batched message ids (IHave). Every
+    # link starts eager; a node that receives a copy it already has prunes
+    # the link it came on, so the eager links settle into a spanning tree
+    # and each node gets one copy of each body. Neighbour sets need not be
+    # symmetric, so a link is pruned and grafted from its receiving end
+    # only: each node decides which senders keep pushing bodies to it. A
+    # node that hears of a message by IHave and has no copy ihave_timeout
+    # seconds later asks the announcer for it (IWant), which also grafts
+    # that link back into the tree; the next announcer is tried
+    # graft_timeout seconds later. Dead neighbours leave the tree with the
+    # neighbour set, so it repairs itself through those timeouts.
+    def __init__(self, node, ihave_delay=0.05, ihave_timeout=0.5, graft_timeout=0.25):
+        self.node = node
+        self.ihave_delay = ihave_delay
+        self.ihave_timeout = ihave_timeout
+        self.graft_timeout = graft_timeout
+        self.lazy = set()  # neighbour ports on lazy links, the rest are eager
+        self.pruned = set()  # senders asked to stop pushing bodies to us
+        self.announced = {}  # neighbour port -> message ids waiting for an IHave
+        self.missing = {}  # message id -> announcers not asked yet
+        self.lock = threading.Lock()
+        self.stats = {
+            "eager_pushes": 0, "ihave_sent": 0, "ihave_received": 0, "iwant_sent": 0,
+            "iwant_served": 0, "grafts": 0, "prunes_sent": 0, "prunes_received": 0,
+        }
+
+    def eager_peers(self):
+        return [port for port in self.node.gossip_candidates() if port not in self.lazy]
+
+    def lazy_peers(self):
+        return [port for port in self.node.gossip_candidates() if port in self.lazy]
+
+    def broadcast(self, message, exclude=()):
+        # bodies to the eager links, the message id to the lazy ones
+        candidates = self.node.gossip_candidates()
+        with self.lock:
+            # a neighbour that comes back after leaving starts eager again
+            self.lazy.intersection_update(candidates)
+            eager = [port for port in candidates if port not in self.lazy and port not in exclude]
+            lazy = [port for port in candidates if port in self.lazy and port not in exclude]
+        tree_message = f"Tree Gossip:{self.node.port}:{message}"
+        for peer_port in eager:
+            self.node.push_gossip(peer_port, tree_message)
+        with self.lock:
+            self.stats["eager_pushes"] += len(eager)
+        if lazy:
+            self.announce(lazy, message_digest(message).hex())
+        return len(eager)
+
+    def announce(self, peer_ports, message_id):
+        flush = []
+        with self.lock:
+            for peer_port in peer_ports:
+                ids = self.announced.setdefault(peer_port, [])
+                ids.append(message_id)
+                if len(ids) == 1:
+                    flush.append(peer_port)
+        for peer_port in flush:
+            self.node.scheduler.call_later(self.ihave_delay, self.flush_announcements, peer_port)
+
+    def flush_announcements(self, peer_port):
+        with self.lock:
+            ids = self.announced.pop(peer_port, None)
+            if ids:
+                self.stats["ihave_sent"] += 1
+        if ids:
+            message = f"Gossip IHave:{self.node.port}:{','.join(ids)}"
+            self.node.run_task(self.node.send_peer_message, peer_port, message)
+
+    def gossip_received(self, message):
+        # Tree Gossip:<sender port>:<gossip message>
+        _, sender, gossip = message.split(":", 2)
+        self.node.process_gossip_message(gossip, sender)
+
+    def delivered(self, message, sender):
+        # a body that was new to us, its link belongs to the tree
+        with self.lock:
+            self.missing.pop(message_digest(message).hex(), None)
+            self.pruned.discard(sender)
+
+    def duplicate(self, sender):
+        # a second copy, the link it came on leaves the tree
+        with self.lock:
+            if sender in self.pruned:
+                return
+            self.pruned.add(sender)
+            self.stats["prunes_sent"] += 1
+        self.node.run_task(self.node.send_peer_message, sender, f"Gossip Prune:{self.node.port}")
+
+    def prune_received(self, message):
+        _, sender = message.split(":", 1)
+        with self.lock:
+            self.lazy.add(sender)
+            self.stats["prunes_received"] += 1
+
+    def ihave_received(self, message):
+        # Gossip IHave:<sender port>:<message ids>
+        _, sender, ids = message.split(":", 2)
+        waiting = []
+        with self.lock:
+            self.stats["ihave_received"] += 1
+            for message_id in ids.split(","):
+                if not message_id or bytes.fromhex(message_id) in self.node.seen_messages:
+                    continue
+                announcers = self.missing.get(message_id)
+                if announcers is None:
+                    self.missing[message_id] = [sender]
+                    waiting.append(message_id)
+                elif sender not in announcers:
+                    announcers.append(sender)
+        for message_id in waiting:
+            self.node.scheduler.call_later(self.ihave_timeout, self.missing_timeout, message_id)
+
+    def missing_timeout(self, message_id):
+        # no eager copy arrived in time: graft the next announcer's link
+        # and ask it for the body
+        with self.lock:
+            announcers = self.missing.get(message_id)
+            if not announcers or bytes.fromhex(message_id) in self.node.seen_messages:
+                self.missing.pop(message_id, None)
+                return
+            sender = announcers.pop(0)
+            if not announcers:
+                del self.missing[message_id]
+            self.pruned.discard(sender)
+            self.stats["grafts"] += 1
+            self.stats["iwant_sent"] += 1
+        self.node.run_task(self.node.send_peer_message, sender, f"Gossip IWant:{self.node.port}:{message_id}")
+        if announcers:
+            self.node.scheduler.call_later(self.graft_timeout, self.missing_timeout, message_id)
+
+    def iwant_received(self, message):
+        # Gossip IWant:<sender port>:<message ids>, grafts the link and
+        # sends the bodies we still have
+        _, sender, ids = message.split(":", 2)
+        with self.lock:
+            self.lazy.discard(sender)
+        for message_id in ids.split(","):
+            stored = self.node.seen_messages.get(bytes.fromhex(message_id))
+            if isinstance(stored, str):
+                with self.lock:
+                    self.stats["iwant_served"] += 1
+                self.node.dissemination_stats.count("forwarded")
+                self.node.push_gossip(sender, f"Tree Gossip:{self.node.port}:{stored}")
+
+    def metrics(self):
+        candidates = self.node.gossip_candidates()
+        with self.lock:
+            lazy = sum(1 for port in candidates if port in self.lazy)
+            return dict(
+                self.stats,
+                eager=len(candidates) - lazy,
+                lazy=lazy,
+                missing=len(self.missing),
+            )
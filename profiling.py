@@ -0,0 +1,184 @@
+import atexit
+import cProfile
+import pstats
+import re
+import signal
+import sys
+import threading
+import tracemalloc
+
+
+class RawStats:
+    # hands a stats dict taken from a running profiler to pstats.Stats,
+    # which would otherwise disable the profiler to collect it
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def add_stats(stats, raw):
+    # pstats refuses empty profiles, threads that never ran Python code
+    if raw:
+        stats.add(RawStats(raw))
+
+
+def component_of(thread):
+    # "Thread-7 (handle_peer_connection)" -> "handle_peer_connection",
+    # pool workers "inbound-3" -> "inbound"
+    if thread is threading.main_thread():
+        return "main"
+    match = re.search(r"\((\w+)\)$", thread.name)
+    return match.group(1) if match else re.sub(r"-\d+$", "", thread.name)
+
+
+class ThreadProfiler:
+    # cProfile only sees the thread that enabled it, and the nodes do their
+    # work on threads started per connection and per task. Every thread
+    # started after start() enables its own profiler from the threading
+    # profile hook; the profiles are grouped by component, the function the
+    # thread runs. Each dump folds the profiles of finished threads into
+    # their component's totals so short lived threads do not pile up.
+    def __init__(self):
+        self.profiles = []  # (thread, component, profile)
+        self.retired = {}  # component -> pstats.Stats
+        self.lock = threading.Lock()
+
+    def start(self):
+        threading.setprofile(self.thread_started)
+        self.attach()
+
+    def stop(self):
+        threading.setprofile(None)
+
+    def thread_started(self, frame, event, arg):
+        # first profile event of a new thread, the thread's own profiler
+        # replaces this hook
+        sys.setprofile(None)
+        self.attach()
+
+    def attach(self):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active profiler, which already sees
+            # every thread
+            return
+        thread = threading.current_thread()
+        with self.lock:
+            self.profiles.append((thread, component_of(thread), profile))
+
+    def retire(self):
+        # called with the lock held
+        live = []
+        for thread, component, profile in self.profiles:
+            if thread.is_alive():
+                live.append((thread, component, profile))
+                continue
+            profile.snapshot_stats()
+            add_stats(self.retired.setdefault(component, pstats.Stats()), profile.stats)
+        self.profiles = live
+
+    def component_stats(self):
+        with self.lock:
+            self.retire()
+            components = {}
+            for component, retired in self.retired.items():
+                add_stats(components.setdefault(component, pstats.Stats()), dict(retired.stats))
+            for _, component, profile in self.profiles:
+                profile.snapshot_stats()
+                add_stats(components.setdefault(component, pstats.Stats()), profile.stats)
+        return components
+
+    def dump(self, prefix):
+        # <prefix>.pstats for the whole process, <prefix>.<component>.pstats
+        # per component, load them with pstats or snakeviz
+        merged = pstats.Stats()
+        for component, stats in self.component_stats().items():
+            stats.dump_stats(f"{prefix}.{component}.pstats")
+            merged.add(stats)
+        merged.dump_stats(f"{prefix}.pstats")
+
+
+class AllocationTracer:
+    # tracemalloc snapshots, each summary lists the lines holding the most
+    # memory and the lines that allocated the most since the last dump
+    def __init__(self, frames=1, top=25):
+        self.frames = frames
+        self.top = top
+        self.previous = None
+
+    def start(self):
+        tracemalloc.start(self.frames)
+
+    def stop(self):
+        tracemalloc.stop()
+
+    def dump(self, prefix):
+        # leave out the profilers' own bookkeeping
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, path)
+            for path in (tracemalloc.__file__, cProfile.__file__, pstats.__file__, __file__,
+                         "<frozen importlib._bootstrap>")
+        ])
+        snapshot.dump(f"{prefix}.snapshot")
+        lines = ["Top allocations by line:"]
+        lines.extend(str(stat) for stat in snapshot.statistics("lineno")[:self.top])
+        lines.append("")
+        lines.append("Top allocations by file:")
+        lines.extend(str(stat) for stat in snapshot.statistics("filename")[:self.top])
+        if self.previous is not None:
+            lines.append("")
+            lines.append("Growth since the last snapshot:")
+            lines.extend(str(stat) for stat in snapshot.compare_to(self.previous, "lineno")[:self.top])
+        self.previous = snapshot
+        with open(f"{prefix}.txt", "w") as file:
+            file.write("\n".join(lines) + "\n")
+
+
+class ProfileDumper:
+    # Writes the profiles every interval seconds, on SIGUSR1 and at exit.
+    # The signal handler only wakes the dumper thread up.
+    def __init__(self, prefix, interval=30.0, profiler=None, tracer=None):
+        self.prefix = prefix
+        self.interval = interval
+        self.profiler = profiler
+        self.tracer = tracer
+        self.wake = threading.Event()
+        self.dump_lock = threading.Lock()
+
+    def start(self):
+        if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.wake.set())
+        threading.Thread(target=self.dump_loop, daemon=True).start()
+        atexit.register(self.dump)
+
+    def dump_loop(self):
+        while True:
+            self.wake.wait(self.interval or None)
+            self.wake.clear()
+            self.dump()
+
+    def dump(self):
+        with self.dump_lock:
+            if self.profiler is not None:
+                self.profiler.dump(f"profile_{self.prefix}")
+            if self.tracer is not None:
+                self.tracer.dump(f"alloc_{self.prefix}")
+
+
+def start_profiling(prefix, interval, profile=False, trace_alloc=False):
+    # call before the nodes start their threads
+    if not profile and not trace_alloc:
+        return None
+    profiler = ThreadProfiler() if profile else None
+    tracer = AllocationTracer() if trace_alloc else None
+    if profiler is not None:
+        profiler.start()
+    if tracer is not None:
+        tracer.start()
+    dumper = ProfileDumper(prefix, interval, profiler, tracer)
+    dumper.start()
+    return dumper
@@ -0,0 +1,192 @@
+import bisect
+import os
+import random
+import threading
+
+
+class PeerRegistry:
+    # In-memory set of registered peers indexed by (ip, port). Readers get
+    # snapshot lists or bounded samples, so PEERS replies never touch the
+    # disk. A single flusher thread persists the registry to path at most
+    # once per flush_interval, and only when it changed.
+    #
+    # peers is a dense array for O(1) random picks (removal swaps the last
+    # entry into the hole), order_seqs/order_keys is the registration log
+    # used as a stable cursor for paging, and urn holds every peer once per unit of degree
+    # so preferential picks are O(1) too. Stale order and urn entries are
+    # skipped when read and compacted once they dominate.
+    def __init__(self, path, flush_interval=1.0, rng=None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.rng = rng or random.Random()
+        self.peers = []
+        self.index = {}  # (ip, port) -> position in peers
+        self.seqs = {}  # (ip, port) -> registration sequence number
+        self.order_seqs = []
+        self.order_keys = []
+        self.next_seq = 1
+        # times a peer was handed out in a sample, a proxy for its in-degree
+        self.degrees = {}
+        self.urn = []
+        self.urn_weight = 0
+        self.lock = threading.Lock()
+        self.version = 0
+        self.persisted_version = -1
+        self.flusher = None
+        self.stopped = threading.Event()
+
+    def add(self, ip, port):
+        key = (ip, port)
+        with self.lock:
+            if key in self.index:
+                return False
+            self.index[key] = len(self.peers)
+            self.peers.append(key)
+            self.seqs[key] = self.next_seq
+            self.order_seqs.append(self.next_seq)
+            self.order_keys.append(key)
+            self.next_seq += 1
+            self.degrees[key] = 0
+            self.urn.append(key)
+            self.urn_weight += 1
+            self.version += 1
+            return True
+
+    def remove(self, ip, port):
+        return bool(self.remove_many([(ip, port)]))
+
+    def remove_many(self, keys):
+        # one version bump (and so at most one snapshot) per batch
+        removed = []
+        with self.lock:
+            for key in keys:
+                position = self.index.pop(key, None)
+                if position is None:
+                    continue
+                last = self.peers.pop()
+                if last != key:
+                    self.peers[position] = last
+                    self.index[last] = position
+                del self.seqs[key]
+                self.urn_weight -= self.degrees.pop(key) + 1
+                removed.append(key)
+            if removed:
+                self.version += 1
+                self.compact()
+        return removed
+
+    def live_order(self):
+        # (seq, key) of current peers in registration order
+        return [
+            (seq, key)
+            for seq, key in zip(self.order_seqs, self.order_keys)
+            if self.seqs.get(key) == seq
+        ]
+
+    def compact(self):
+        if len(self.order_keys) > 2 * len(self.peers) + 64:
+            live = self.live_order()
+            self.order_seqs = [seq for seq, _ in live]
+            self.order_keys = [key for _, key in live]
+        if len(self.urn) > 2 * self.urn_weight + 64:
+            self.urn = [
+                key for key in self.peers for _ in range(self.degrees[key] + 1)
+            ]
+
+    def sample(self, count, exclude=(), mode="uniform"):
+        # at most count peers, O(count) expected work whatever the size
+        with self.lock:
+            if mode == "preferential":
+                chosen = self.preferential_sample(count, exclude)
+            else:
+                chosen = self.uniform_sample(count, exclude)
+            for key in chosen:
+                self.degrees[key] += 1
+                self.urn.append(key)
+                self.urn_weight += 1
+            return chosen
+
+    def uniform_sample(self, count, exclude):
+        picks = min(len(self.peers), count + len(exclude))
+        chosen = []
+        for position in self.rng.sample(range(len(self.peers)), picks):
+            key = self.peers[position]
+            if key not in exclude:
+                chosen.append(key)
+        return chosen[:count]
+
+    def preferential_sample(self, count, exclude):
+        # draw from the urn, so well connected peers are picked more often
+        # and degrees follow a power law as the overlay grows
+        excluded = sum(1 for key in exclude if key in self.index)
+        wanted = min(count, len(self.peers) - excluded)
+        chosen = set()
+        attempts = 0
+        while len(chosen) < wanted and attempts < 8 * count + 16:
+            attempts += 1
+            key = self.urn[self.rng.randrange(len(self.urn))]
+            if key in self.index and key not in exclude:
+                chosen.add(key)
+        if len(chosen) < wanted:
+            extra = self.uniform_sample(count, set(exclude) | chosen)
+            chosen.update(extra[:wanted - len(chosen)])
+        return list(chosen)
+
+    def page(self, cursor, count):
+        # peers registered after cursor, plus the cursor to continue from
+        # (0 once the end of the registry is reached)
+        with self.lock:
+            start = bisect.bisect_right(self.order_seqs, cursor)
+            page = []
+            for position in range(start, len(self.order_seqs)):
+                seq = self.order_seqs[position]
+                key = self.order_keys[position]
+                if self.seqs.get(key) != seq:
+                    continue
+                if len(page) == count:
+                    return [key for _, key in page], page[-1][0]
+                page.append((seq, key))
+            return [key for _, key in page], 0
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.peers)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.peers)
+
+    def start(self):
+        # start from an empty file, as the seed always has
+        self.persisted_version = -1
+        self.flush()
+        self.flusher = threading.Thread(target=self.flush_loop, daemon=True)
+        self.flusher.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.flusher is not None:
+            self.flusher.join()
+        self.flush()
+
+    def flush_loop(self):
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self.version == self.persisted_version:
+                return
+            version = self.version
+            peers = [key for _, key in self.live_order()]
+        # write a complete snapshot next to the file and swap it in, so a
+        # crash never leaves a half written peers list behind
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as file:
+            file.write("".join(f"{port}\n" for _, port in peers))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+        self.persisted_version = version
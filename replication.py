@@ -0,0 +1,197 @@
+import hashlib
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+
+from hash_ring import ring_hash
+
+SNAPSHOT_MAGIC = b"RREP"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct(">4sBdI")  # magic, version, time written, entries
+SNAPSHOT_ENTRY = struct.Struct(">4sHQ?")  # ip, port, version, registered
+
+
+def entry_text(key, version, alive):
+    ip, port = key
+    return f"{ip}:{port}:{version}:{'+' if alive else '-'}"
+
+
+def parse_entries(fields):
+    # <ip>:<port>:<version>:+ for a registered peer, - for a removed one
+    entries = []
+    for field in fields:
+        ip, port, version, state = field.rsplit(":", 3)
+        entries.append(((ip, int(port)), int(version), state == "+"))
+    return entries
+
+
+class RegistryReplica:
+    # Versioned copy of a seed's registry that seeds reconcile with each
+    # other. Every (ip, port) carries a version, a millisecond clock that
+    # only moves forward, and is either registered or a tombstone; the higher
+    # version wins, so a removal and a later registration settle the same way
+    # on every seed. Entries hash into buckets, each leaf is the XOR of its
+    # entries' hashes so updates are O(1), and the root hashes the leaves: a
+    # two level Merkle tree. Seeds compare roots, then leaves, and ship only
+    # the buckets that differ. Tombstones are dropped tombstone_ttl seconds
+    # after the removal, which is the same moment on every seed.
+    def __init__(self, leaves=256, tombstone_ttl=60.0, clock=time.time):
+        self.buckets = [{} for _ in range(leaves)]  # (ip, port) -> (version, alive)
+        self.leaves = [0] * leaves
+        self.tombstones = {}  # (ip, port) -> version
+        self.tombstone_ttl = tombstone_ttl
+        self.clock = clock
+        self.last_version = 0
+        self.size = 0
+        self.lock = threading.Lock()
+        self.stats = {
+            "rounds": 0, "in_sync": 0, "buckets_compared": 0, "entries_sent": 0,
+            "entries_received": 0, "applied": 0, "expired": 0,
+        }
+
+    def bucket(self, key):
+        return ring_hash(f"{key[0]}:{key[1]}") % len(self.buckets)
+
+    def put(self, key, version, alive):
+        # called with the lock held, version None drops the entry
+        index = self.bucket(key)
+        bucket = self.buckets[index]
+        old = bucket.get(key)
+        if old is not None:
+            self.leaves[index] ^= ring_hash(entry_text(key, *old))
+            self.size -= 1
+        self.tombstones.pop(key, None)
+        if version is None:
+            bucket.pop(key, None)
+            return
+        bucket[key] = (version, alive)
+        self.leaves[index] ^= ring_hash(entry_text(key, version, alive))
+        self.size += 1
+        if not alive:
+            self.tombstones[key] = version
+
+    def horizon(self):
+        # tombstones older than this version have expired
+        return int((self.clock() - self.tombstone_ttl) * 1000)
+
+    def record(self, key, alive):
+        # a registration or removal on this seed
+        with self.lock:
+            self.last_version = max(self.last_version + 1, int(self.clock() * 1000))
+            self.put(key, self.last_version, alive)
+
+    def merge(self, entries):
+        # entries from another seed, returns (key, alive) for every peer
+        # whose registration changed here
+        changed = []
+        horizon = self.horizon()
+        with self.lock:
+            self.stats["entries_received"] += len(entries)
+            for key, version, alive in entries:
+                self.last_version = max(self.last_version, version)
+                old = self.buckets[self.bucket(key)].get(key)
+                # on equal versions a registration beats a removal
+                if old is not None and old >= (version, alive):
+                    continue
+                if not alive and version < horizon:
+                    continue
+                self.put(key, version, alive)
+                if alive != (old is not None and old[1]):
+                    changed.append((key, alive))
+            self.stats["applied"] += len(changed)
+        return changed
+
+    def expire(self):
+        horizon = self.horizon()
+        with self.lock:
+            expired = [key for key, version in self.tombstones.items() if version < horizon]
+            for key in expired:
+                self.put(key, None, False)
+            self.stats["expired"] += len(expired)
+
+    def root(self):
+        with self.lock:
+            data = b"".join(leaf.to_bytes(8, "big") for leaf in self.leaves)
+        return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+    def leaf_digest(self):
+        with self.lock:
+            return " ".join(f"{leaf:x}" for leaf in self.leaves)
+
+    def differing(self, leaves):
+        # buckets whose leaf differs from the other seed's
+        remote = [int(leaf, 16) for leaf in leaves]
+        if len(remote) != len(self.leaves):
+            raise ValueError(f"expected {len(self.leaves)} leaves, got {len(remote)}")
+        with self.lock:
+            buckets = [index for index, leaf in enumerate(self.leaves) if leaf != remote[index]]
+            self.stats["buckets_compared"] += len(buckets)
+        return buckets
+
+    def entries(self, buckets, newer_than=()):
+        # entries in the buckets, only those newer than the other seed's
+        # copies (newer_than, as parsed entries) when given
+        known = {key: (version, alive) for key, version, alive in newer_than}
+        with self.lock:
+            entries = [
+                entry_text(key, *value)
+                for index in buckets
+                for key, value in self.buckets[index].items()
+                if known.get(key, (-1, False)) < value
+            ]
+            self.stats["entries_sent"] += len(entries)
+        return entries
+
+    def save(self, path):
+        # every entry and tombstone, swapped in whole like a peer snapshot
+        with self.lock:
+            entries = [
+                SNAPSHOT_ENTRY.pack(socket.inet_aton(ip), port, version, alive)
+                for bucket in self.buckets
+                for (ip, port), (version, alive) in bucket.items()
+            ]
+        header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, self.clock(), len(entries))
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(header + b"".join(entries))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+
+    def load(self, path):
+        # Resumes from a saved replica, so a restarted seed only has to catch
+        # up on what changed while it was down and its first rounds send
+        # just those buckets. Returns the registered keys, or None when the
+        # file is missing, damaged, or older than half the tombstone ttl:
+        # the other seeds may have forgotten removals by then, and the old
+        # registrations would come back.
+        try:
+            with open(path, "rb") as file:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    magic, version, written_at, count = SNAPSHOT_HEADER.unpack_from(data)
+                    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                        return None
+                    if self.clock() - written_at > self.tombstone_ttl / 2:
+                        return None
+                    entries = [
+                        SNAPSHOT_ENTRY.unpack_from(data, SNAPSHOT_HEADER.size + i * SNAPSHOT_ENTRY.size)
+                        for i in range(count)
+                    ]
+        except (OSError, ValueError, struct.error):
+            return None
+        registered = []
+        with self.lock:
+            for ip, port, version, alive in entries:
+                key = (socket.inet_ntoa(ip), port)
+                self.last_version = max(self.last_version, version)
+                self.put(key, version, alive)
+                if alive:
+                    registered.append(key)
+        return registered
+
+    def metrics(self):
+        with self.lock:
+            return dict(self.stats, entries=self.size, tombstones=len(self.tombstones))
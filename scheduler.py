@@ -0,0 +1,154 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class Timer:
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerScheduler:
+    # A heap of timers served by one thread. Callbacks run on that thread,
+    # so they must hand blocking work to the node (run_task) instead of
+    # doing it inline. A callback that raises is counted in failures and
+    # reported to on_error(callback, error), the node's log, and the
+    # thread carries on.
+    def __init__(self, clock=time.monotonic, on_error=None):
+        self.clock = clock
+        self.on_error = on_error
+        self.failures = 0
+        self.timers = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopped = False
+
+    def now(self):
+        return self.clock()
+
+    def call_later(self, delay, callback, *args):
+        timer = Timer(self.clock() + delay, callback, args)
+        with self.condition:
+            heapq.heappush(self.timers, (timer.deadline, next(self.sequence), timer))
+            self.condition.notify()
+        return timer
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.stopped:
+                    if self.timers:
+                        delay = self.timers[0][0] - self.clock()
+                        if delay <= 0:
+                            break
+                        self.condition.wait(delay)
+                    else:
+                        self.condition.wait()
+                if self.stopped:
+                    return
+                _, _, timer = heapq.heappop(self.timers)
+            if not timer.cancelled:
+                try:
+                    timer.callback(*timer.args)
+                except Exception as error:
+                    self.failures += 1
+                    if self.on_error is not None:
+                        self.on_error(timer.callback, error)
+
+
+class LoopScheduler:
+    # same interface on top of an asyncio event loop
+    def __init__(self, loop):
+        self.loop = loop
+        self.stopped = False
+
+    def now(self):
+        return self.loop.time()
+
+    def call_later(self, delay, callback, *args):
+        return self.loop.call_later(delay, self.run, callback, args)
+
+    def run(self, callback, args):
+        if not self.stopped:
+            callback(*args)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        self.stopped = True
+
+
+class VirtualScheduler:
+    # Discrete event scheduler for simulations: nothing runs on its own,
+    # run_until() executes timers in deadline order and jumps the virtual
+    # clock straight to each one, so idle time costs nothing
+    def __init__(self, start=0.0):
+        self.time = start
+        self.timers = []
+        self.sequence = itertools.count()
+        self.events = 0
+
+    def now(self):
+        return self.time
+
+    def call_later(self, delay, callback, *args):
+        timer = Timer(self.time + max(delay, 0.0), callback, args)
+        heapq.heappush(self.timers, (timer.deadline, next(self.sequence), timer))
+        return timer
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def run_until(self, deadline):
+        while self.timers and self.timers[0][0] <= deadline:
+            _, _, timer = heapq.heappop(self.timers)
+            self.time = timer.deadline
+            if not timer.cancelled:
+                self.events += 1
+                timer.callback(*timer.args)
+        self.time = max(self.time, deadline)
+
+
+class ScopedScheduler:
+    # One node's view of a scheduler shared by many nodes; stop() only
+    # silences the timers this node scheduled
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.stopped = False
+
+    def now(self):
+        return self.scheduler.now()
+
+    def call_later(self, delay, callback, *args):
+        return self.scheduler.call_later(delay, self.run, callback, args)
+
+    def run(self, callback, args):
+        if not self.stopped:
+            callback(*args)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        self.stopped = True
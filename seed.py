@@ -1,98 +1,650 @@
+import argparse
+import atexit
+import multiprocessing
 import socket
 import threading
 import random
-import sys
+import time
+
+import framing
+from dead_reports import DeadNodeVotes
+from metrics import Metrics, default_exporter, start_exporter
+from node_log import OutputLog, configure_writer
+from profiling import start_profiling
+from registry import PeerRegistry
+from replication import RegistryReplica, parse_entries
+from worker_pool import POLICIES, WorkerPool, open_listener
 
 
 class SeedNode:
     def __init__(self, host, port):
         self.host = host
         self.port = port
-        self.peers = set()
         self.peers_file = f"peerslist_{self.port}.txt"
         self.output_file = f"output_{self.port}.txt"
+        self.log = OutputLog(self.output_file)
+        # registered peers live in memory, the peers file is a snapshot
+        self.registry = PeerRegistry(self.peers_file)
+        # upper bound on the peers handed out per REGISTER or GET PEERS
+        self.sample_size = 32
+        # "uniform" or degree aware "preferential" sampling
+        self.sampling = "uniform"
+        self.server_socket = None
+        self.stopped = threading.Event()
+        # A sharded seed holds only the peers that hash to it, so REGISTER
+        # replies mix in samples fetched from the other shards in the
+        # background: seed port -> (shard size, ports)
+        self.sharded = False
+        self.seeds_file = "config.txt"
+        self.cross_shard_interval = 2.0
+        self.remote_samples = {}
+        # seconds a request to another seed may take, a seed that accepts
+        # but never answers must not stall the cross-shard and sync loops
+        self.request_timeout = 3.0
+        self.rng = random.Random()
+        # a peer is removed once enough distinct peers reported it dead
+        self.dead_votes = DeadNodeVotes()
+        # Replicating seeds keep full copies of the registry: every
+        # sync_interval seconds one other seed is picked and the two
+        # reconcile their replicas, so a peer needs to register only once
+        self.replication = False
+        self.sync_interval = 1.0
+        self.replica = RegistryReplica()
+        # With a replica_path the replica is saved every replica_interval
+        # seconds and on stop, and a restarted seed resumes from it
+        self.replica_path = None
+        self.replica_interval = 10.0
+        self.replica_saved_at = 0.0
+        # connections are served by a bounded worker pool that sheds load
+        # when full, idle streams are closed after inbound_idle_timeout
+        self.backlog = 128
+        self.reuse_address = True
+        self.inbound = WorkerPool(256, 1024, name="inbound", on_error=self.task_failed)
+        self.inbound_idle_timeout = 60.0
+        self.metrics = Metrics()
+        self.metrics.gauge("threads", threading.active_count)
+        self.metrics.gauge("registered_peers", lambda: len(self.registry))
+        self.metrics.gauge("remote_samples", lambda: len(self.remote_samples))
+        self.metrics.gauge("dead_votes", lambda: self.dead_votes.metrics())
+        self.metrics.gauge("inbound", lambda: self.inbound.metrics())
+        self.metrics.gauge("replication", lambda: self.replica.metrics())
 
     def start(self):
-        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_socket.bind((self.host, self.port))
-        server_socket.listen()
-        # make a txt file to store the peers
-        with open(self.peers_file, "w") as file:
-            pass
+        server_socket = open_listener(self.host, self.port, self.backlog, self.reuse_address)
+        self.server_socket = server_socket
+        self.registry.start()
+        if self.sharded:
+            self.start_cross_shard()
+        if self.replication:
+            self.restore_replica()
+            self.start_sync()
+
+        self.log.echo("Seed node listening on {}:{}", self.host, self.port)
+
+        while True:
+            try:
+                client_socket, addr = server_socket.accept()
+            except OSError:
+                break
+            self.metrics.count("accepted")
+            self.inbound.submit(
+                self.handle_peer_connection, client_socket, addr, on_drop=client_socket.close
+            )
+
+    def stop(self):
+        self.stopped.set()
+        if self.server_socket is not None:
+            try:
+                # wakes up the accept loop
+                self.server_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.server_socket.close()
+        self.inbound.stop()
+        self.registry.stop()
+        self.save_replica()
+
+    def task_failed(self, target, error):
+        self.metrics.count("task_failures")
+        self.log.echo("Task {} failed: {!r}", target, error)
 
-        print(f"Seed node listening on {self.host}:{self.port}")
+    def start_cross_shard(self):
+        threading.Thread(target=self.cross_shard_loop, daemon=True).start()
 
+    def cross_shard_loop(self):
         while True:
-            client_socket, addr = server_socket.accept()
-            threading.Thread(
-                target=self.handle_peer_connection, args=(client_socket, addr)
-            ).start()
+            self.refresh_remote_samples()
+            if self.stopped.wait(self.cross_shard_interval):
+                return
+
+    def other_seeds(self):
+        with open(self.seeds_file, "r") as seeds_file:
+            ports = [int(line.strip()) for line in seeds_file if line.strip()]
+        return [port for port in ports if port != self.port]
+
+    def refresh_remote_samples(self):
+        try:
+            seed_ports = self.other_seeds()
+        except (OSError, ValueError):
+            return
+        for seed_port in seed_ports:
+            try:
+                self.remote_sample_received(seed_port, self.shard_request(seed_port))
+            except (OSError, ValueError):
+                self.remote_samples.pop(seed_port, None)
+
+    def shard_request(self, seed_port):
+        return self.seed_request(seed_port, f"SAMPLE PEERS {self.sample_size}")
+
+    def seed_request(self, seed_port, message):
+        with socket.create_connection((self.host, seed_port), timeout=self.request_timeout) as seed_socket:
+            seed_socket.sendall(framing.encode_message(message))
+            # the other seed closes the connection after its reply
+            reader = framing.FrameReader()
+            while reader.recv_into(seed_socket):
+                pass
+            replies = reader.messages()
+            rest = reader.finish()
+            if rest:
+                replies.append(rest)
+        if not replies:
+            raise ValueError(f"no reply to {' '.join(message.split()[:2])}")
+        return replies[0]
+
+    def remote_sample_received(self, seed_port, message):
+        # SHARD SAMPLE <shard size> <ports>
+        fields = message.split()
+        if fields[:2] != ["SHARD", "SAMPLE"]:
+            raise ValueError(f"unexpected reply {message!r}")
+        self.remote_samples[seed_port] = (int(fields[2]), fields[3:])
+
+    def start_sync(self):
+        threading.Thread(target=self.sync_loop, daemon=True).start()
+
+    def sync_loop(self):
+        while not self.stopped.wait(self.sync_interval):
+            self.sync_round()
+
+    def sync_round(self):
+        # anti-entropy with one other seed, picked at random each round
+        try:
+            seed_ports = self.other_seeds()
+        except (OSError, ValueError):
+            return
+        self.replica.expire()
+        if seed_ports:
+            self.sync_with(self.rng.choice(seed_ports))
+        if time.monotonic() - self.replica_saved_at >= self.replica_interval:
+            self.save_replica()
+
+    def save_replica(self):
+        if self.replica_path is None or not self.replication:
+            return
+        self.replica_saved_at = time.monotonic()
+        try:
+            self.replica.save(self.replica_path)
+        except OSError:
+            self.log.echo("Failed to write replica {}", self.replica_path)
+
+    def restore_replica(self):
+        if self.replica_path is None:
+            return
+        registered = self.replica.load(self.replica_path)
+        if registered is None:
+            return
+        for key in registered:
+            self.registry.add(*key)
+        self.metrics.count("replica_restores")
+        self.log.echo("Resumed replica with {} registered peers", len(registered))
+
+    def sync_with(self, seed_port):
+        # SYNC ROOT, then SYNC ENTRIES for the buckets that differ
+        message = self.sync_request()
+        try:
+            while message is not None:
+                message = self.sync_reply_received(seed_port, self.seed_request(seed_port, message))
+        except (OSError, ValueError):
+            self.metrics.count("sync_failures")
+
+    def sync_request(self):
+        self.replica.stats["rounds"] += 1
+        return f"SYNC ROOT {self.replica.root()}"
+
+    def sync_reply_received(self, seed_port, message):
+        # returns the next request to send, None once the round is over
+        fields = message.split()
+        if fields[:2] == ["SYNC", "OK"]:
+            self.replica.stats["in_sync"] += 1
+            return None
+        if fields[:2] == ["SYNC", "LEAVES"]:
+            # SYNC LEAVES <leaf hashes>, send our entries of the buckets
+            # that differ, the other seed answers with what we lack
+            buckets = self.replica.differing(fields[2:])
+            if not buckets:
+                return None
+            entries = self.replica.entries(buckets)
+            return f"SYNC ENTRIES {','.join(map(str, buckets))} " + " ".join(entries)
+        if fields[:2] == ["SYNC", "DELTA"]:
+            self.replicated(seed_port, self.replica.merge(parse_entries(fields[2:])))
+            return None
+        raise ValueError(f"unexpected reply {message!r}")
+
+    def replicated(self, source, changed):
+        # apply registrations and removals learned from another seed
+        added = [key for key, alive in changed if alive]
+        for key in added:
+            self.registry.add(*key)
+            self.dead_votes.clear(key)
+        removed = self.registry.remove_many([key for key, alive in changed if not alive])
+        self.metrics.count("replicated_registrations", len(added))
+        self.metrics.count("replicated_removals", len(removed))
+        timestamp = int(time.time())
+        for dead_ip, dead_port in removed:
+            self.log.echo("Removed dead peer port {}, replicated from seed {}", dead_port, source)
+            self.log.write(f"Dead Node:{dead_ip}:{dead_port}:{timestamp}:{self.host}")
+
+    def peer_sample(self, count, peer):
+        # Ports handed to a registering peer. A sharded seed takes from its
+        # own shard and from the remote samples in proportion to the shard
+        # sizes, so peers learn about peers outside the shards they use.
+        local = [str(port) for _, port in self.registry.sample(count, exclude={peer}, mode=self.sampling)]
+        samples = list(self.remote_samples.values())
+        if not self.sharded or not samples:
+            return local
+        total = len(self.registry) + sum(size for size, _ in samples)
+        if total == 0:
+            return local
+        ports = local[:round(count * len(self.registry) / total)]
+        remote = {port for _, sample in samples for port in sample}
+        remote -= set(ports)
+        remote.discard(str(peer[1]))
+        ports += self.rng.sample(sorted(remote), min(count - len(ports), len(remote)))
+        # top up from the own shard when the other shards are small
+        for port in local:
+            if len(ports) >= count:
+                break
+            if port not in ports:
+                ports.append(port)
+        return ports
+
+    def dead_nodes_reported(self, reporter, suspects, timestamp, sender_ip):
+        # every peer that reached its quorum leaves the registry in one update
+        self.metrics.count("dead_reports", len(suspects))
+        confirmed = [
+            suspect
+            for suspect in suspects
+            if suspect in self.registry and self.dead_votes.report(suspect, reporter)
+        ]
+        for dead_ip, dead_port in self.registry.remove_many(confirmed):
+            if self.replication:
+                self.replica.record((dead_ip, dead_port), False)
+            self.log.echo("Removed dead peer port {} from peers list", dead_port)
+            self.log.write(f"Dead Node:{dead_ip}:{dead_port}:{timestamp}:{sender_ip}")
 
     def handle_peer_connection(self, client_socket, addr):
-        # Receive message from peer
-        message = client_socket.recv(1024).decode()
-        print(f"Received message from peer {addr}: {message}")
-        # write the message to output file
+        # A REGISTER connection ends after the PEERS reply. Dead node reports
+        # come on pooled streams, which are closed once the reports at hand
+        # are handled instead of holding the worker until the idle timeout;
+        # the peer's pool notices and reconnects for its next report.
+        reader = framing.FrameReader()
+        try:
+            client_socket.settimeout(self.inbound_idle_timeout)
+            while reader.recv_into(client_socket):
+                for message in reader.messages():
+                    if not self.reply(client_socket, addr, message, reader.binary):
+                        return
+                # an unterminated REGISTER comes from a legacy one-shot sender
+                if reader.pending_text().startswith("REGISTER"):
+                    self.reply(client_socket, addr, reader.finish(), False)
+                    return
+                if not reader.buffered():
+                    return
+            message = reader.finish()
+            if message:
+                self.reply(client_socket, addr, message, False)
+        except (OSError, ValueError):
+            pass
+        finally:
+            client_socket.close()
+
+    def bounded_count(self, requested):
+        if requested is None:
+            return self.sample_size
+        return max(1, min(int(requested), self.sample_size))
+
+    def reply(self, client_socket, addr, message, binary):
+        started = time.perf_counter()
+        response, keep_open = self.handle_message(addr, message)
+        if response is not None:
+            client_socket.sendall(self.encode_reply(response, binary))
+        self.metrics.timed("reply_seconds", started)
+        return keep_open
+
+    def encode_reply(self, response, binary):
+        # answer in the wire format the peer used, legacy peers read the
+        # unterminated text until the connection closes
+        if binary:
+            return framing.encode_message(response)
+        return response.encode()
+
+    def handle_message(self, addr, message):
+        # Returns the reply to send (or None) and whether the connection
+        # should stay open for further messages
+        if not message.startswith("SYNC"):
+            # digests and deltas from other seeds are too long to echo
+            self.log.echo("Received message from peer {}: {}", addr, message)
         # Extract port number from message
         try:
             if message.startswith("REGISTER"):
-                peer_port = int(message.split()[1])
-                with open(self.output_file, "a") as file:
-                    file.write(f"{message}\n")
-
-                # Add peer port to the peers set
-                self.peers.add(peer_port)
-
-                # send a message to the peer of list of peers of seed
-                with open(self.peers_file, "r") as file:
-                    # send the list of peers to the peer
-                    peers = file.read().splitlines()
-                    message = "PEERS " + " ".join(peers)
-                    print(f"Sending list to peer {addr}: {message}")
-                    client_socket.send(message.encode())
-                    # Add peer port to the peers file
-                with open(self.peers_file, "a") as file:
-                    file.write(f"{peer_port}\n")
-                print(f"Added peer port {peer_port} to peers list")
+                # REGISTER <port> [<sample size>]
+                fields = message.split()
+                peer_port = int(fields[1])
+                peer = (addr[0], peer_port)
+                self.log.write(message)
+
+                # send a bounded sample of the peers registered before this one
+                count = self.bounded_count(fields[2] if len(fields) > 2 else None)
+                reply = "PEERS " + " ".join(self.peer_sample(count, peer))
+                self.log.echo("Sending list to peer {}: {}", addr, reply)
+
+                # Add peer to the registry, it is evidently alive
+                self.registry.add(*peer)
+                self.dead_votes.clear(peer)
+                if self.replication:
+                    self.replica.record(peer, True)
+                self.metrics.count("registrations")
+                self.log.echo("Added peer port {} to peers list", peer_port)
+                return reply, False
+            elif message.startswith("GET PEERS"):
+                # GET PEERS <cursor> <count>, pages through the registry in
+                # registration order, a next cursor of 0 means no more pages
+                _, _, cursor, count = message.split()
+                page, next_cursor = self.registry.page(int(cursor), self.bounded_count(count))
+                self.metrics.count("peer_pages")
+                reply = f"MORE PEERS {next_cursor} " + " ".join(str(port) for _, port in page)
+                return reply, False
+            elif message.startswith("SAMPLE PEERS"):
+                # SAMPLE PEERS <count> from another shard, answered with the
+                # size of this shard and a uniform sample of it
+                _, _, count = message.split()
+                sample = self.registry.sample(self.bounded_count(count))
+                reply = f"SHARD SAMPLE {len(self.registry)} " + " ".join(str(port) for _, port in sample)
+                return reply, False
+            elif message.startswith("SYNC ROOT"):
+                # SYNC ROOT <root hash> from another seed, answered with our
+                # leaf hashes unless the replicas already agree
+                _, _, root = message.split()
+                if root == self.replica.root():
+                    return "SYNC OK", False
+                return "SYNC LEAVES " + self.replica.leaf_digest(), False
+            elif message.startswith("SYNC ENTRIES"):
+                # SYNC ENTRIES <buckets> <entries>: merge them, answer with
+                # our entries of those buckets that the other seed lacks
+                _, _, buckets, *fields = message.split()
+                buckets = [int(bucket) for bucket in buckets.split(",")]
+                entries = parse_entries(fields)
+                self.replicated(addr, self.replica.merge(entries))
+                return "SYNC DELTA " + " ".join(self.replica.entries(buckets, entries)), False
+            elif message.startswith("Dead Nodes"):
+                # Dead Nodes:<timestamp>:<reporter ip>:<reporter port>:<ip>:<port>,...
+                _, timestamp, sender_ip, sender_port, entries = message.split(":", 4)
+                suspects = []
+                for entry in entries.split(","):
+                    dead_ip, dead_port = entry.rsplit(":", 1)
+                    suspects.append((dead_ip, int(dead_port)))
+                reporter = (sender_ip, int(sender_port))
+                self.dead_nodes_reported(reporter, suspects, timestamp, sender_ip)
+                return None, True
             else:
-                # print(f"Invalid message format received from peer {addr}")
-                _, seed_ip, dead_port, timestamp, sender_ip = message.split(":")
-                dead_port = int(dead_port)
-                # print(dead_port)
-                if dead_port in self.peers:
-                    self.peers.remove(dead_port)
-                    print(f"Removed dead peer port {dead_port} from peers list")
-                    with open(self.output_file, "a") as file:
-                        file.write(f"{message}\n")
-
-                    # Convert the set to a sorted list before writing it to the file
-                    peer_list = sorted(self.peers)
-
-                    with open(self.peers_file, "w") as file:
-                        file.write("\n".join(str(port) for port in peer_list))
-                # close the thread of the dead peer
-                client_socket.close()
+                _, dead_ip, dead_port, timestamp, sender_ip = message.split(":")
+                # a single report names only the reporter's ip, its
+                # connection tells reporters on the same host apart
+                self.dead_nodes_reported(addr, [(dead_ip, int(dead_port))], timestamp, sender_ip)
+                return None, True
 
         except (IndexError, ValueError):
-            print(f"Invalid message format received from peer {addr}")
-            return
-        finally:
-            client_socket.close()
+            self.metrics.count("invalid_messages")
+            self.log.echo("Invalid message format received from peer {}", addr)
+            return None, False
 
 
-if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python script_name.py <seed_port>")
-        sys.exit(1)
+def serve(seed_port, args):
+    # before any thread starts, so each one gets its own profiler
+    start_profiling(seed_port, args.profile_interval, args.profile, args.trace_alloc)
+    configure_writer(args.log_flush_interval, args.log_flush_size)
+    # with several shards each process serves its own metrics port
+    metrics_port = args.metrics_port
+    if metrics_port is not None:
+        metrics_port += seed_port - args.port
+    metrics_file = args.metrics_file
+    if metrics_file is not None and args.shards > 1:
+        metrics_file = f"{metrics_file}.{seed_port}"
+    start_exporter(metrics_port, metrics_file, args.metrics_interval)
+
+    def configure(seed):
+        if args.log_format == "binary":
+            seed.output_file = f"output_{seed.port}.bin"
+        seed.log = OutputLog(seed.output_file, args.log_format, args.quiet)
+        seed.registry.flush_interval = args.flush_interval
+        seed.sample_size = args.sample_size
+        seed.sampling = args.sampling
+        seed.sharded = args.sharded or args.shards > 1
+        seed.cross_shard_interval = args.cross_shard_interval
+        seed.dead_votes = DeadNodeVotes(args.dead_quorum, args.dead_window)
+        seed.replication = args.replicate
+        seed.sync_interval = args.sync_interval
+        seed.replica = RegistryReplica(tombstone_ttl=args.tombstone_ttl)
+        if args.replica_snapshot:
+            seed.replica_path = f"replica_{seed.port}.bin"
+            seed.replica_interval = args.replica_snapshot_interval
+            # a clean shutdown leaves the freshest replica behind
+            atexit.register(seed.save_replica)
+        seed.backlog = args.backlog
+        seed.reuse_address = args.reuse_addr
+        seed.inbound_idle_timeout = args.idle_timeout
+        seed.inbound = WorkerPool(
+            args.workers, args.queue_size, args.overload_policy, name="inbound", on_error=seed.task_failed
+        )
+        default_exporter.register(f"seed-{seed.port}", seed.metrics)
+
+    if args.runtime == "asyncio":
+        from async_node import run_seed
 
-    try:
-        seed_port = int(sys.argv[1])
-    except ValueError:
-        print("Invalid port number. Please provide a valid integer.")
-        sys.exit(1)
+        run_seed("127.0.0.1", seed_port, configure)
+    else:
+        seed = SeedNode("127.0.0.1", seed_port)
+        configure(seed)
+        threading.Thread(target=seed.start).start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a seed node.")
+    parser.add_argument("port", type=int, help="port to listen on")
+    parser.add_argument(
+        "--runtime",
+        choices=["threads", "asyncio"],
+        default="threads",
+        help="thread per connection or a single asyncio event loop",
+    )
+    parser.add_argument(
+        "--flush-interval",
+        type=float,
+        default=1.0,
+        help="seconds between snapshots of the peers file",
+    )
+    parser.add_argument(
+        "--sample-size",
+        type=int,
+        default=32,
+        help="most peers returned by one REGISTER or GET PEERS request",
+    )
+    parser.add_argument(
+        "--sampling",
+        choices=["uniform", "preferential"],
+        default="uniform",
+        help="uniform random or degree aware (preferential attachment) samples",
+    )
+    parser.add_argument(
+        "--sharded",
+        action="store_true",
+        help="hold only the peers that hash to this seed, sample other shards",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="run this many sharded seed processes on consecutive ports",
+    )
+    parser.add_argument(
+        "--cross-shard-interval",
+        type=float,
+        default=2.0,
+        help="seconds between refreshes of the samples taken from other shards",
+    )
+    parser.add_argument(
+        "--replicate",
+        action="store_true",
+        help="keep a full copy of the registry in sync with the other seeds",
+    )
+    parser.add_argument(
+        "--sync-interval",
+        type=float,
+        default=1.0,
+        help="seconds between anti-entropy rounds with another seed",
+    )
+    parser.add_argument(
+        "--tombstone-ttl",
+        type=float,
+        default=60.0,
+        help="seconds a replicated removal is remembered",
+    )
+    parser.add_argument(
+        "--replica-snapshot",
+        action="store_true",
+        help="save the replica to replica_<port>.bin and resume from it on restart",
+    )
+    parser.add_argument(
+        "--replica-snapshot-interval",
+        type=float,
+        default=10.0,
+        help="seconds between replica snapshots",
+    )
+    parser.add_argument(
+        "--dead-quorum",
+        type=int,
+        default=2,
+        help="distinct peers that must report a peer dead before it is removed",
+    )
+    parser.add_argument(
+        "--dead-window",
+        type=float,
+        default=30.0,
+        help="seconds a dead node report counts towards the quorum",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=256,
+        help="most inbound connections served at once",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=1024,
+        help="accepted connections waiting for a worker before load is shed",
+    )
+    parser.add_argument(
+        "--overload-policy",
+        choices=POLICIES,
+        default="reject",
+        help="on a full queue close the new connection, the oldest waiting one, or stop accepting",
+    )
+    parser.add_argument(
+        "--backlog",
+        type=int,
+        default=128,
+        help="listen backlog of the server socket",
+    )
+    parser.add_argument(
+        "--reuse-addr",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="set SO_REUSEADDR on the server socket",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=60.0,
+        help="seconds an idle inbound stream holds its worker before it is closed",
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="skip console output, events still go to the output file",
+    )
+    parser.add_argument(
+        "--log-format",
+        choices=["line", "binary"],
+        default="line",
+        help="text lines or compact binary records in the output file",
+    )
+    parser.add_argument(
+        "--log-flush-interval",
+        type=float,
+        default=0.5,
+        help="longest a logged event waits before it is written",
+    )
+    parser.add_argument(
+        "--log-flush-size",
+        type=int,
+        default=1024,
+        help="events written together in one batch",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="serve metrics over HTTP on this port, consecutive ports with --shards",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        default=None,
+        help="file a JSON snapshot of the metrics is written to",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=5.0,
+        help="seconds between metrics snapshots written to the file",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="profile every thread, dumps profile_<port>[.<component>].pstats",
+    )
+    parser.add_argument(
+        "--trace-alloc",
+        action="store_true",
+        help="trace allocations, dumps alloc_<port>.snapshot and alloc_<port>.txt",
+    )
+    parser.add_argument(
+        "--profile-interval",
+        type=float,
+        default=30.0,
+        help="seconds between profile dumps, SIGUSR1 dumps at once",
+    )
+    args = parser.parse_args()
+    if args.replicate and (args.sharded or args.shards > 1):
+        parser.error("--replicate keeps full registries, it cannot be combined with shards")
+    seed_ports = [args.port + shard for shard in range(args.shards)]
 
     with open("config.txt", "a") as seeds_file:
-        seeds_file.write(f"{seed_port}\n")
+        for seed_port in seed_ports:
+            seeds_file.write(f"{seed_port}\n")
 
-    seed = SeedNode("127.0.0.1", seed_port)
-    threading.Thread(target=seed.start).start()
+    if args.shards == 1:
+        serve(args.port, args)
+    else:
+        # one process per shard, so registrations use every core
+        for seed_port in seed_ports:
+            multiprocessing.Process(target=serve, args=(seed_port, args)).start()
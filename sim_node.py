@@ -0,0 +1,231 @@
+import random
+
+from dead_reports import DeadNodeVotes
+from gossip_cache import SeenCache
+from liveness import LivenessMonitor
+from peer import PeerNode
+from registry import PeerRegistry
+from replication import RegistryReplica
+from scheduler import ScopedScheduler
+from seed import SeedNode
+from udp_probe import ProbeChannel
+
+
+class SimNetwork:
+    # Links between simulated nodes on one VirtualScheduler. A message is
+    # delivered after latency +- jitter seconds of virtual time, or lost with
+    # probability loss. Sending to a port nobody is attached to fails at
+    # once, as a refused TCP connection does.
+    def __init__(self, scheduler, latency=0.01, jitter=0.005, loss=0.0, rng=None):
+        self.scheduler = scheduler
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = rng or random.Random()
+        self.nodes = {}  # port -> node
+        self.seeds = []
+        self.stats = {"sent": 0, "delivered": 0, "lost": 0, "refused": 0}
+
+    def attach(self, port, node, seed=False):
+        self.nodes[port] = node
+        if seed:
+            self.seeds.append(port)
+
+    def detach(self, port):
+        self.nodes.pop(port, None)
+
+    def delay(self):
+        return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    def send(self, source, port, *messages):
+        # messages sent together travel and get lost together
+        port = int(port)
+        if port not in self.nodes:
+            self.stats["refused"] += 1
+            raise ConnectionRefusedError(f"nothing listens on port {port}")
+        self.stats["sent"] += 1
+        if self.loss and self.rng.random() < self.loss:
+            self.stats["lost"] += 1
+            return
+        self.scheduler.call_later(self.delay(), self.deliver, source, port, messages)
+
+    def deliver(self, source, port, messages):
+        node = self.nodes.get(port)
+        if node is None:
+            # the receiver went away while the message was in flight
+            self.stats["lost"] += 1
+            return
+        self.stats["delivered"] += 1
+        for message in messages:
+            node.receive(source, message)
+
+
+class SimPeerNode(PeerNode):
+    # Same protocol and message handling as PeerNode, but sends are delivery
+    # events on a SimNetwork and tasks run inline, so a whole overlay runs
+    # deterministically on one thread in virtual time
+    def __init__(self, host, port, network):
+        super().__init__(host, port)
+        self.network = network
+        self.scheduler = ScopedScheduler(network.scheduler)
+        self.clock = self.scheduler.now
+        self.liveness = LivenessMonitor(self, rng=self.rng)
+        self.seen_messages = SeenCache(clock=self.scheduler.now)
+
+    def start(self):
+        self.network.attach(self.port, self)
+        self.listening_ready.set()
+        self.use_seeds(list(self.network.seeds))
+        self.register_with_seeds()
+        self.start_probes()
+        self.liveness.start()
+        self.start_dissemination()
+        self.start_membership()
+        self.topology.start()
+        self.start_snapshots()
+
+    def stop(self):
+        self.stopped.set()
+        self.scheduler.stop()
+        self.network.detach(self.port)
+
+    def run_task(self, target, *args, on_drop=None):
+        target(*args)
+
+    def start_probes(self):
+        # every simulated peer is a host of its own, no probe groups
+        if self.liveness_transport == "udp":
+            self.probe_channel = ProbeChannel(self)
+            self.metrics.gauge("probes", lambda: self.probe_channel.metrics())
+
+    def send_datagram(self, port, datagram):
+        try:
+            self.network.send(self.port, port, datagram)
+        except OSError:
+            pass
+
+    def receive(self, source, message):
+        if isinstance(message, bytes):
+            # a liveness datagram
+            reply = self.probe_channel.received(message) if self.probe_channel else None
+            if reply is not None:
+                self.send_datagram(source, reply)
+            return
+        # seed replies arrive as separate messages instead of on the
+        # request's connection
+        if message.startswith("PEERS"):
+            self.process_seed_message(message)
+            self.bootstrap.succeeded(source)
+        elif message.startswith("MORE PEERS"):
+            self.process_more_peers([message])
+        else:
+            self.handle_message(message)
+
+    def send_to_node(self, node_port, message, *extra):
+        if self.stopped.is_set():
+            raise ConnectionAbortedError("node is stopped")
+        self.network.send(self.port, node_port, message, *extra)
+
+    def connect_to_seednode(self, node_port, attempt):
+        try:
+            self.send_to_node(node_port, self.register_message())
+        except OSError:
+            self.log.echo("Failed to connect to seednode on port: {}", node_port)
+            self.bootstrap.failed(node_port, attempt)
+            return
+        self.log.echo("Connected to seednode on port: {}", node_port)
+
+    def start_gossip(self):
+        self.gossip_message_generation()
+
+    def request_more_peers(self, seed_port, cursor=0, count=32):
+        # the MORE PEERS page comes back later through receive()
+        try:
+            self.send_to_node(seed_port, f"GET PEERS {cursor} {count}")
+        except OSError:
+            self.log.echo("Failed to request peers from seednode on port: {}", seed_port)
+
+    def gossip_message_generation(self):
+        if self.workload is not None:
+            self.start_workload()
+            return
+        for i in range(self.gossip_count):
+            self.scheduler.call_later(i * self.gossip_interval, self.generate_gossip_message)
+
+
+class SimSeedNode(SeedNode):
+    def __init__(self, host, port, network, rng=None):
+        super().__init__(host, port)
+        self.network = network
+        # the registry is never flushed, a simulation keeps no peers file
+        self.registry = PeerRegistry(self.peers_file, rng=rng)
+        self.rng = rng or random.Random()
+        self.scheduler = ScopedScheduler(network.scheduler)
+        self.dead_votes = DeadNodeVotes(clock=self.scheduler.now)
+        self.replica = RegistryReplica(clock=self.scheduler.now)
+
+    def start(self):
+        self.network.attach(self.port, self, seed=True)
+        if self.sharded:
+            self.start_cross_shard()
+        if self.replication:
+            self.start_sync()
+
+    def stop(self):
+        self.stopped.set()
+        self.scheduler.stop()
+        self.network.detach(self.port)
+
+    def start_cross_shard(self):
+        def refresh():
+            self.refresh_remote_samples()
+            self.scheduler.call_later(self.cross_shard_interval, refresh)
+
+        self.scheduler.call_later(0, refresh)
+
+    def other_seeds(self):
+        return [port for port in self.network.seeds if port != self.port]
+
+    def refresh_remote_samples(self):
+        # the SHARD SAMPLE replies come back later through receive()
+        for seed_port in self.other_seeds():
+            try:
+                self.network.send(self.port, seed_port, f"SAMPLE PEERS {self.sample_size}")
+            except OSError:
+                self.remote_samples.pop(seed_port, None)
+
+    def start_sync(self):
+        def sync():
+            self.sync_round()
+            self.scheduler.call_later(self.sync_interval, sync)
+
+        self.scheduler.call_later(self.sync_interval, sync)
+
+    def sync_with(self, seed_port):
+        # the replies come back later through receive()
+        self.sync_send(seed_port, self.sync_request())
+
+    def sync_send(self, seed_port, message):
+        if message is None:
+            return
+        try:
+            self.network.send(self.port, seed_port, message)
+        except OSError:
+            self.metrics.count("sync_failures")
+
+    def receive(self, source, message):
+        if message.startswith("SHARD SAMPLE"):
+            self.remote_sample_received(source, message)
+            return
+        if message.startswith(("SYNC OK", "SYNC LEAVES", "SYNC DELTA")):
+            try:
+                self.sync_send(source, self.sync_reply_received(source, message))
+            except ValueError:
+                self.metrics.count("sync_failures")
+            return
+        reply, _ = self.handle_message((self.host, source), message)
+        if reply is not None:
+            try:
+                self.network.send(self.port, source, reply)
+            except OSError:
+                pass
@@ -0,0 +1,707 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+
+from async_node import AsyncPeerNode, AsyncSeedNode, raise_file_limit
+from bootstrap import SeedBootstrap
+from dissemination import STRATEGIES, make_strategy
+from gossip_cache import message_digest
+from liveness import LivenessMonitor
+from metrics import combined
+from node_log import OutputLog
+from peer import PeerNode
+from plumtree import BroadcastTree
+from scheduler import VirtualScheduler
+from topology import TopologyManager
+from seed import SeedNode
+from sim_node import SimNetwork, SimPeerNode, SimSeedNode
+from workload import ARRIVALS, GossipWorkload
+
+
+class EventCollector:
+    # Timestamps of the events every node in the simulated network writes to
+    # its output log, shared by all nodes of the process. The clock is
+    # time.monotonic, or the virtual clock of a discrete event run.
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.started = {}  # peer port -> start time
+        self.registered = {}  # peer port -> first PEERS reply
+        self.originated = {}  # gossip digest -> (origin port, time)
+        self.delivered = {}  # gossip digest -> {peer port: time}
+        self.killed = {}  # peer port -> time it was stopped
+        self.removed = {}  # dead peer port -> [time each seed removed it]
+
+    def peer_event(self, port, message):
+        now = self.clock()
+        with self.lock:
+            if message.startswith("PEERS"):
+                self.registered.setdefault(port, now)
+            elif message.startswith("Gossip Message"):
+                self.delivered.setdefault(message_digest(message), {}).setdefault(port, now)
+
+    def gossip_originated(self, port, message):
+        now = self.clock()
+        with self.lock:
+            self.originated[message_digest(message)] = (port, now)
+
+    def seed_event(self, message):
+        if not message.startswith("Dead Node"):
+            return
+        now = self.clock()
+        dead_port = int(message.split(":")[2])
+        with self.lock:
+            self.removed.setdefault(dead_port, []).append(now)
+
+
+class RecordingLog(OutputLog):
+    # Replaces a node's output log: events go to the collector instead of
+    # disk and nothing is printed, so the numbers measure the protocol
+    def __init__(self, collector, port, seed=False):
+        super().__init__(None, quiet=True)
+        self.collector = collector
+        self.port = port
+        self.seed = seed
+
+    def write(self, message):
+        if self.seed:
+            self.collector.seed_event(message)
+        else:
+            self.collector.peer_event(self.port, message)
+
+    def echo(self, template, *args):
+        if template.startswith("Generated message") and not self.seed:
+            self.collector.gossip_originated(self.port, args[0])
+
+    def flush(self):
+        pass
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def summary(values):
+    return {
+        "count": len(values),
+        "p50": percentile(values, 0.5),
+        "p95": percentile(values, 0.95),
+        "max": max(values) if values else None,
+    }
+
+
+def coverage_times(origin_time, receipts, receivers, fractions):
+    # seconds until each fraction of the receivers had the message, None if
+    # it never got there
+    times = sorted(receipts[port] - origin_time for port in receivers if port in receipts)
+    result = {}
+    for fraction in fractions:
+        needed = max(1, math.ceil(fraction * len(receivers)))
+        result[fraction] = times[needed - 1] if len(times) >= needed else None
+    return result
+
+
+def topology_summary(peers, live):
+    # neighbour graph of the live peers, links counted in both directions
+    graph = {port: set() for port in live}
+    for peer in peers:
+        if peer.port not in live:
+            continue
+        for neighbour in peer.peer_table.neighbours():
+            if int(neighbour) in graph:
+                graph[peer.port].add(int(neighbour))
+                graph[int(neighbour)].add(peer.port)
+    degrees = [len(links) for links in graph.values()]
+
+    def distances(start):
+        seen = {start: 0}
+        frontier = [start]
+        while frontier:
+            following = []
+            for port in frontier:
+                for neighbour in graph[port]:
+                    if neighbour not in seen:
+                        seen[neighbour] = seen[port] + 1
+                        following.append(neighbour)
+            frontier = following
+        return seen
+
+    components = 0
+    unvisited = set(graph)
+    while unvisited:
+        components += 1
+        unvisited -= set(distances(next(iter(unvisited))))
+    # eccentricity of a few peers bounds the diameter from below
+    diameter = max((max(distances(port).values()) for port in sorted(graph)[:8]), default=0)
+    return {
+        "min_degree": min(degrees, default=0),
+        "mean_degree": sum(degrees) / len(degrees) if degrees else 0,
+        "max_degree": max(degrees, default=0),
+        "components": components,
+        "diameter": diameter,
+    }
+
+
+def hot_path(nodes):
+    # the nodes' metrics together, without the raw buckets
+    merged = combined(node.metrics for node in nodes)
+    for histogram in merged["histograms"].values():
+        del histogram["buckets"]
+    return merged
+
+
+def report(collector, peers, seeds, args):
+    live = {peer.port for peer in peers} - set(collector.killed)
+    registration = [
+        collector.registered[port] - collector.started[port]
+        for port in collector.started
+        if port in collector.registered
+    ]
+    # from a peer's start to the first gossip it received
+    first_gossip = {}
+    for receipts in collector.delivered.values():
+        for port, when in receipts.items():
+            first_gossip[port] = min(when, first_gossip.get(port, when))
+    time_to_first_gossip = [
+        first_gossip[port] - collector.started[port]
+        for port in collector.started
+        if port in first_gossip
+    ]
+    bootstrap = {}
+    for peer in peers:
+        for name, value in peer.bootstrap.metrics().items():
+            if name in ("attempts", "answers", "failures", "timeouts", "retries"):
+                bootstrap[name] = bootstrap.get(name, 0) + value
+
+    fractions = (0.5, 0.95, 1.0)
+    coverage = {fraction: [] for fraction in fractions}
+    reached = {fraction: 0 for fraction in fractions}
+    for digest, (origin, origin_time) in collector.originated.items():
+        # peers that started after the message was sent cannot have it
+        receivers = {
+            port for port in live
+            if port != origin and port in collector.started and collector.started[port] <= origin_time
+        }
+        if not receivers:
+            continue
+        times = coverage_times(origin_time, collector.delivered.get(digest, {}), receivers, fractions)
+        for fraction, elapsed in times.items():
+            if elapsed is not None:
+                coverage[fraction].append(elapsed)
+                reached[fraction] += 1
+
+    totals = {}
+    for peer in peers:
+        for name, value in peer.dissemination_stats.metrics().items():
+            if isinstance(value, int):
+                totals[name] = totals.get(name, 0) + value
+    membership = {}
+    for peer in peers:
+        for name, value in peer.membership.metrics().items():
+            if name != "incarnation":
+                membership[name] = membership.get(name, 0) + value
+    tree = {}
+    if args.strategy == "plumtree":
+        for peer in peers:
+            for name, value in peer.broadcast_tree.metrics().items():
+                tree[name] = tree.get(name, 0) + value
+    originated = totals.get("originated", 0)
+    sent = totals.get("forwarded", 0) + totals.get("pull_replies", 0)
+
+    # from the first message originated to the last one delivered
+    origin_times = [origin_time for _, origin_time in collector.originated.values()]
+    delivery_times = [when for receipts in collector.delivered.values() for when in receipts.values()]
+    span = max(delivery_times) - min(origin_times) if origin_times and delivery_times else 0
+
+    first_removal = []
+    all_removed = []
+    for port, killed_at in collector.killed.items():
+        removals = collector.removed.get(port, [])
+        if removals:
+            first_removal.append(min(removals) - killed_at)
+        if len(removals) >= len(seeds):
+            all_removed.append(max(removals) - killed_at)
+
+    return {
+        "config": {
+            "runtime": args.runtime,
+            "seeds": len(seeds),
+            "sharded": args.sharded,
+            "replicate": args.replicate,
+            "peers": len(peers),
+            "strategy": args.strategy,
+            "fanout": args.fanout,
+            "liveness_transport": args.liveness_transport,
+            "gossip_rate": args.gossip_rate,
+            "batch_size": args.batch_size,
+            "churn": len(collector.killed),
+            "duration": args.duration,
+        },
+        "time_to_first_gossip": summary(time_to_first_gossip),
+        "registration_latency": summary(registration),
+        "bootstrap": bootstrap,
+        # registered peers per seed, even shards when sharded and full
+        # copies when replicating
+        "seed_registry_sizes": [len(seed.registry) for seed in seeds],
+        "replication": [seed.replica.metrics() for seed in seeds] if args.replicate else None,
+        "gossip": {
+            "messages": len(collector.originated),
+            "coverage": {
+                f"{int(fraction * 100)}%": dict(
+                    summary(coverage[fraction]), reached=reached[fraction]
+                )
+                for fraction in fractions
+            },
+            # gossip sends per originated message, and duplicates received
+            # per message that was new to its receiver
+            "amplification": sent / originated if originated else None,
+            "redundant_per_delivery": (
+                totals.get("redundant", 0) / totals["delivered"] if totals.get("delivered") else None
+            ),
+            "totals": totals,
+            "throughput": {
+                "seconds": span,
+                "originated_per_second": len(origin_times) / span if span else None,
+                "deliveries_per_second": len(delivery_times) / span if span else None,
+            },
+        },
+        "membership": membership,
+        "broadcast_tree": tree or None,
+        "topology": topology_summary(peers, live),
+        "dead_node_detection": {
+            "killed": len(collector.killed),
+            "first_seed": summary(first_removal),
+            "all_seeds": summary(all_removed),
+            "votes": [seed.dead_votes.metrics() for seed in seeds],
+        },
+        # processing times are wall clock even in discrete mode, the
+        # liveness round trips follow the runtime's clock
+        "hot_path": {"peers": hot_path(peers), "seeds": hot_path(seeds)},
+    }
+
+
+def configure_peer(peer, collector, args, rng, originators):
+    peer.seeds_file = "config.txt"
+    peer.log = RecordingLog(collector, peer.port)
+    # every peer draws from its own generator seeded from the run's seed
+    peer.rng = random.Random(rng.getrandbits(64))
+    peer.strategy = make_strategy(args.strategy, fanout=args.fanout, rng=peer.rng)
+    peer.liveness = LivenessMonitor(
+        peer, interval=args.liveness_interval, tick=args.liveness_tick, rng=peer.rng
+    )
+    peer.liveness_transport = args.liveness_transport
+    peer.wire_format = args.wire
+    peer.gossip_count = args.gossip_count if peer.port in originators else 0
+    peer.gossip_interval = args.gossip_interval
+    if args.gossip_rate and peer.port in originators:
+        peer.workload = GossipWorkload(
+            args.gossip_rate,
+            burst=args.gossip_burst,
+            arrivals=args.gossip_arrivals,
+            payload=args.payload_size,
+            max_rate=args.gossip_max_rate,
+            count=args.gossip_count,
+            rng=peer.rng,
+        )
+    peer.broadcast_tree = BroadcastTree(peer, ihave_timeout=args.ihave_timeout)
+    peer.gossip_batch_size = args.batch_size
+    peer.gossip_batch_delay = args.batch_delay
+    peer.sharded = args.sharded
+    peer.replicated_seeds = args.replicate
+    peer.bootstrap = SeedBootstrap(peer, timeout=args.seed_timeout)
+    peer.report_interval = args.report_interval
+    peer.suspect_timeout = args.suspect_timeout
+    peer.topology = TopologyManager(
+        peer,
+        target_degree=args.degree,
+        max_degree=args.max_degree,
+        shuffle_interval=args.shuffle_interval,
+    )
+
+
+def pick_originators(peers, args, rng):
+    # ports of the peers that originate gossip, all of them by default
+    if args.originators is None or args.originators >= len(peers):
+        return {peer.port for peer in peers}
+    return {peer.port for peer in rng.sample(peers, args.originators)}
+
+
+def configure_seed(seed, collector, args):
+    seed.log = RecordingLog(collector, seed.port, seed=True)
+    seed.sharded = args.sharded
+    seed.replication = args.replicate
+    seed.sync_interval = args.sync_interval
+    seed.dead_votes.quorum = args.dead_quorum
+    seed.dead_votes.window = args.dead_window
+
+
+def churn_victims(peers, args, rng):
+    return rng.sample(peers, min(args.churn, len(peers)))
+
+
+def run_threads(args, collector, rng):
+    seeds = [SeedNode(args.host, args.base_port + i) for i in range(args.seeds)]
+    for seed in seeds:
+        configure_seed(seed, collector, args)
+        threading.Thread(target=seed.start, daemon=True).start()
+    time.sleep(0.2)  # let the seeds bind before the first REGISTER
+
+    first_peer = args.base_port + args.seeds
+    peers = [PeerNode(args.host, port) for port in range(first_peer, first_peer + args.peers)]
+    originators = pick_originators(peers, args, rng)
+    began = time.monotonic()
+    for peer in peers:
+        configure_peer(peer, collector, args, rng, originators)
+        collector.started[peer.port] = time.monotonic()
+        peer.start()
+        time.sleep(args.stagger)
+
+    if args.churn:
+        time.sleep(max(0.0, began + args.churn_at - time.monotonic()))
+        for peer in churn_victims(peers, args, rng):
+            collector.killed[peer.port] = time.monotonic()
+            peer.stop()
+    time.sleep(max(0.0, began + args.duration - time.monotonic()))
+
+    result = report(collector, peers, seeds, args)
+    for peer in peers:
+        peer.stop()
+    for seed in seeds:
+        seed.stop()
+    return result
+
+
+def run_asyncio(args, collector, rng):
+    async def main():
+        raise_file_limit()
+        seeds = [AsyncSeedNode(args.host, args.base_port + i) for i in range(args.seeds)]
+        for seed in seeds:
+            configure_seed(seed, collector, args)
+            await seed.start()
+
+        first_peer = args.base_port + args.seeds
+        peers = [AsyncPeerNode(args.host, port) for port in range(first_peer, first_peer + args.peers)]
+        originators = pick_originators(peers, args, rng)
+        began = time.monotonic()
+        for peer in peers:
+            configure_peer(peer, collector, args, rng, originators)
+            collector.started[peer.port] = time.monotonic()
+            await peer.start()
+            await asyncio.sleep(args.stagger)
+
+        if args.churn:
+            await asyncio.sleep(max(0.0, began + args.churn_at - time.monotonic()))
+            for peer in churn_victims(peers, args, rng):
+                collector.killed[peer.port] = time.monotonic()
+                peer.stop()
+        await asyncio.sleep(max(0.0, began + args.duration - time.monotonic()))
+
+        result = report(collector, peers, seeds, args)
+        for peer in peers:
+            peer.stop()
+        for seed in seeds:
+            seed.stop()
+        # let connection handlers see their streams close before the loop ends
+        await asyncio.sleep(0.2)
+        return result
+
+    return asyncio.run(main())
+
+
+def run_discrete(args, collector, rng):
+    # Every node shares one VirtualScheduler on this thread; the run takes
+    # as long as processing its events, however much virtual time passes
+    scheduler = VirtualScheduler()
+    collector.clock = scheduler.now
+    network = SimNetwork(
+        scheduler, args.latency, args.latency_jitter, args.loss, random.Random(rng.getrandbits(64))
+    )
+    seeds = [
+        SimSeedNode(args.host, args.base_port + i, network, random.Random(rng.getrandbits(64)))
+        for i in range(args.seeds)
+    ]
+    for seed in seeds:
+        configure_seed(seed, collector, args)
+        seed.start()
+
+    first_peer = args.base_port + args.seeds
+    peers = [SimPeerNode(args.host, port, network) for port in range(first_peer, first_peer + args.peers)]
+    originators = pick_originators(peers, args, rng)
+
+    def start_peer(peer):
+        collector.started[peer.port] = scheduler.now()
+        peer.start()
+
+    for i, peer in enumerate(peers):
+        configure_peer(peer, collector, args, rng, originators)
+        scheduler.call_later(i * args.stagger, start_peer, peer)
+
+    def churn():
+        for peer in churn_victims(peers, args, rng):
+            collector.killed[peer.port] = scheduler.now()
+            peer.stop()
+
+    if args.churn:
+        scheduler.call_later(args.churn_at, churn)
+
+    began = time.perf_counter()
+    scheduler.run_until(args.duration)
+    result = report(collector, peers, seeds, args)
+    result["network"] = dict(
+        network.stats,
+        events=scheduler.events,
+        wall_seconds=time.perf_counter() - began,
+    )
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run seeds and peers in one process and report network metrics as JSON."
+    )
+    parser.add_argument("--seeds", type=int, default=2, help="number of seed nodes")
+    parser.add_argument("--peers", type=int, default=20, help="number of peer nodes")
+    parser.add_argument(
+        "--runtime",
+        choices=["threads", "asyncio", "discrete"],
+        default="threads",
+        help="thread per connection, a single asyncio event loop, or a "
+        "discrete event simulation in virtual time",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="address every node binds to")
+    parser.add_argument(
+        "--base-port",
+        type=int,
+        default=40000,
+        help="first seed port, peers follow the seeds",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=30.0,
+        help="seconds from the first peer start until metrics are taken "
+        "(virtual seconds in discrete mode)",
+    )
+    parser.add_argument(
+        "--stagger",
+        type=float,
+        default=0.05,
+        help="seconds between peer starts",
+    )
+    parser.add_argument("--churn", type=int, default=0, help="peers to kill during the run")
+    parser.add_argument(
+        "--churn-at",
+        type=float,
+        default=10.0,
+        help="seconds after the first peer start at which peers are killed",
+    )
+    parser.add_argument(
+        "--gossip-count",
+        type=int,
+        default=3,
+        help="gossip messages each peer originates",
+    )
+    parser.add_argument(
+        "--gossip-interval",
+        type=float,
+        default=2.0,
+        help="seconds between the messages of one peer, at least 1 so "
+        "timestamps stay distinct",
+    )
+    parser.add_argument(
+        "--gossip-rate",
+        type=float,
+        default=None,
+        help="gossip messages per second per originator, --gossip-count of them, replaces the fixed schedule",
+    )
+    parser.add_argument(
+        "--gossip-burst",
+        type=int,
+        default=1,
+        help="messages originated together, also the token bucket depth",
+    )
+    parser.add_argument(
+        "--gossip-arrivals",
+        choices=ARRIVALS,
+        default="fixed",
+        help="evenly spaced or Poisson distributed bursts",
+    )
+    parser.add_argument(
+        "--gossip-max-rate",
+        type=float,
+        default=None,
+        help="token bucket rate limit in messages per second, the gossip rate by default",
+    )
+    parser.add_argument(
+        "--payload-size",
+        default="0",
+        help="payload bytes: N, LOW-HIGH for uniform sizes or exp:MEAN",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="most forwarded gossip messages sent to a neighbour in one frame",
+    )
+    parser.add_argument(
+        "--batch-delay",
+        type=float,
+        default=0.005,
+        help="seconds forwarded gossip waits for more messages to the same neighbour",
+    )
+    parser.add_argument(
+        "--sharded",
+        action="store_true",
+        help="peers register only with the seeds of their shard",
+    )
+    parser.add_argument(
+        "--seed-timeout",
+        type=float,
+        default=3.0,
+        help="seconds a seed has to answer a registration before it is retried",
+    )
+    parser.add_argument(
+        "--replicate",
+        action="store_true",
+        help="seeds replicate their registries, peers register with one seed",
+    )
+    parser.add_argument(
+        "--sync-interval",
+        type=float,
+        default=1.0,
+        help="seconds between anti-entropy rounds of replicating seeds",
+    )
+    parser.add_argument(
+        "--originators",
+        type=int,
+        default=None,
+        help="peers that originate gossip, all of them by default",
+    )
+    parser.add_argument(
+        "--wire",
+        choices=["binary", "text"],
+        default="binary",
+        help="wire format of the simulated peers, all of them speak binary frames",
+    )
+    parser.add_argument(
+        "--strategy",
+        choices=sorted(STRATEGIES),
+        default="push-pull",
+        help="how gossip is disseminated",
+    )
+    parser.add_argument("--fanout", type=int, default=3, help="peers each push goes to")
+    parser.add_argument(
+        "--ihave-timeout",
+        type=float,
+        default=0.5,
+        help="plumtree: seconds to wait for a message announced by IHave before asking for it",
+    )
+    parser.add_argument(
+        "--liveness-transport",
+        choices=["tcp", "udp"],
+        default="tcp",
+        help="probe peers over the tcp streams or with udp ping/ack datagrams",
+    )
+    parser.add_argument(
+        "--liveness-interval",
+        type=float,
+        default=3.0,
+        help="seconds between liveness probes of one peer",
+    )
+    parser.add_argument(
+        "--liveness-tick",
+        type=float,
+        default=0.5,
+        help="seconds between liveness scheduler ticks",
+    )
+    parser.add_argument("--degree", type=int, default=4, help="neighbours each peer keeps")
+    parser.add_argument(
+        "--max-degree",
+        type=int,
+        default=8,
+        help="most neighbours a peer accepts",
+    )
+    parser.add_argument(
+        "--shuffle-interval",
+        type=float,
+        default=5.0,
+        help="seconds between known peer cache shuffles, 0 disables",
+    )
+    parser.add_argument(
+        "--report-interval",
+        type=float,
+        default=1.0,
+        help="seconds peers collect dead peers before reporting them",
+    )
+    parser.add_argument(
+        "--suspect-timeout",
+        type=float,
+        default=3.0,
+        help="seconds a suspected peer has to refute before it is declared dead",
+    )
+    parser.add_argument(
+        "--dead-quorum",
+        type=int,
+        default=2,
+        help="distinct reporters a seed needs before removing a peer",
+    )
+    parser.add_argument(
+        "--dead-window",
+        type=float,
+        default=30.0,
+        help="seconds a dead node report counts towards the quorum",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.01,
+        help="discrete mode: one way link latency in seconds",
+    )
+    parser.add_argument(
+        "--latency-jitter",
+        type=float,
+        default=0.005,
+        help="discrete mode: latency varies uniformly by this much",
+    )
+    parser.add_argument(
+        "--loss",
+        type=float,
+        default=0.0,
+        help="discrete mode: probability that a message is lost",
+    )
+    parser.add_argument("--seed", type=int, default=None, help="random seed, makes discrete runs reproducible")
+    parser.add_argument("--output", default=None, help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    # config.txt and the seeds' peers files go to a scratch directory
+    output = os.path.abspath(args.output) if args.output else None
+    workdir = tempfile.mkdtemp(prefix="gossip-sim-")
+    os.chdir(workdir)
+    with open("config.txt", "w") as seeds_file:
+        for i in range(args.seeds):
+            seeds_file.write(f"{args.base_port + i}\n")
+
+    collector = EventCollector()
+    rng = random.Random(args.seed)
+    if args.runtime == "discrete":
+        result = run_discrete(args, collector, rng)
+    elif args.runtime == "asyncio":
+        result = run_asyncio(args, collector, rng)
+    else:
+        result = run_threads(args, collector, rng)
+
+    text = json.dumps(result, indent=2)
+    if output:
+        with open(output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
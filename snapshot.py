@@ -0,0 +1,78 @@
+import mmap
+import os
+import struct
+
+MAGIC = b"PSNP"
+VERSION = 1
+# magic, version, port, time written, known peers, neighbours, failure
+# counters, seen digests; the port arrays and entries follow in that order
+HEADER = struct.Struct(">4sBHdIIII")
+FAILURE = struct.Struct(">HI")  # port, consecutive failures
+DIGEST = struct.Struct(">16sf")  # gossip digest, seconds it has left to live
+
+
+class PeerSnapshot:
+    # The state a restarted peer resumes from: known peers, neighbours,
+    # failure counters and the digests of recent gossip, so old messages
+    # are not delivered again. Written as one compact binary file.
+    def __init__(self, port, written_at, known=(), neighbours=(), failures=(), digests=()):
+        self.port = port
+        self.written_at = written_at
+        self.known = list(known)
+        self.neighbours = list(neighbours)
+        self.failures = list(failures)  # (port, count)
+        self.digests = list(digests)  # (digest, seconds left)
+
+    def encode(self):
+        parts = [
+            HEADER.pack(
+                MAGIC, VERSION, self.port, self.written_at, len(self.known),
+                len(self.neighbours), len(self.failures), len(self.digests),
+            ),
+            struct.pack(f">{len(self.known)}H", *map(int, self.known)),
+            struct.pack(f">{len(self.neighbours)}H", *map(int, self.neighbours)),
+        ]
+        parts.extend(FAILURE.pack(int(port), count) for port, count in self.failures)
+        parts.extend(DIGEST.pack(digest, remaining) for digest, remaining in self.digests)
+        return b"".join(parts)
+
+    def save(self, path):
+        # swap in a complete file, a crash never leaves half a snapshot
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(self.encode())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+
+
+def decode_snapshot(data):
+    magic, version, port, written_at, known, neighbours, failures, digests = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a peer snapshot")
+    offset = HEADER.size
+    known_ports = struct.unpack_from(f">{known}H", data, offset)
+    offset += 2 * known
+    neighbour_ports = struct.unpack_from(f">{neighbours}H", data, offset)
+    offset += 2 * neighbours
+    counters = [FAILURE.unpack_from(data, offset + i * FAILURE.size) for i in range(failures)]
+    offset += failures * FAILURE.size
+    seen = [DIGEST.unpack_from(data, offset + i * DIGEST.size) for i in range(digests)]
+    return PeerSnapshot(
+        port,
+        written_at,
+        [str(known_port) for known_port in known_ports],
+        [str(neighbour) for neighbour in neighbour_ports],
+        [(str(failure_port), count) for failure_port, count in counters],
+        seen,
+    )
+
+
+def load_snapshot(path):
+    # the file is mapped rather than read, None when it is missing or damaged
+    try:
+        with open(path, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return decode_snapshot(data)
+    except (OSError, ValueError, struct.error):
+        return None
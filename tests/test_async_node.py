@@ -0,0 +1,72 @@
+import asyncio
+import socket
+
+import pytest
+
+import framing
+from async_node import AsyncSeedNode
+from node_log import OutputLog
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+@pytest.fixture
+def seed(tmp_path, monkeypatch):
+    # the seed keeps its peers file in the working directory
+    monkeypatch.chdir(tmp_path)
+    node = AsyncSeedNode("127.0.0.1", free_port())
+    node.log = OutputLog(str(tmp_path / "output.txt"), quiet=True)
+    node.registry.flush_interval = 0.05
+    return node
+
+
+async def exchange(port, data):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(data)
+    await writer.drain()
+    frames = framing.FrameReader()
+    frames.feed(await asyncio.wait_for(reader.read(), 5))
+    writer.close()
+    replies = frames.messages()
+    rest = frames.finish()
+    return replies + [rest] if rest else replies
+
+
+def test_register_in_both_wire_formats(seed):
+    async def main():
+        await seed.start()
+        try:
+            first = await exchange(seed.port, framing.encode_text("REGISTER 40001"))
+            second = await exchange(seed.port, framing.encode_message("REGISTER 40002"))
+        finally:
+            seed.stop()
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first == ["PEERS "]
+    assert second == ["PEERS 40001"]
+    assert len(seed.registry) == 2
+
+
+def test_seed_request_gives_up_on_a_silent_seed(seed):
+    # accepts connections but never answers
+    silent = socket.socket()
+    silent.bind(("127.0.0.1", 0))
+    silent.listen(8)
+    seed.request_timeout = 0.2
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        with pytest.raises(asyncio.TimeoutError):
+            await seed.seed_request(silent.getsockname()[1], "SAMPLE PEERS 4")
+        return loop.time() - started
+
+    try:
+        assert asyncio.run(main()) < 2
+    finally:
+        silent.close()
@@ -0,0 +1,93 @@
+import random
+
+from bootstrap import SeedBootstrap
+from metrics import Metrics
+from scheduler import VirtualScheduler
+
+
+class FakeNode:
+    # records the registration attempts instead of connecting
+    def __init__(self):
+        self.scheduler = VirtualScheduler()
+        self.rng = random.Random(1)
+        self.metrics = Metrics()
+        self.requests = []
+        self.completed = 0
+
+    def run_task(self, target, *args, on_drop=None):
+        target(*args)
+
+    def connect_to_seednode(self, seed_port, attempt):
+        self.requests.append((seed_port, attempt))
+
+    def bootstrap_complete(self):
+        self.completed += 1
+
+
+def make_bootstrap(**options):
+    node = FakeNode()
+    bootstrap = SeedBootstrap(node, timeout=1.0, retry_delay=0.5, **options)
+    return node, bootstrap
+
+
+def test_quorum_of_answers_completes():
+    node, bootstrap = make_bootstrap()
+    bootstrap.start([24000, 24001, 24002])
+    assert node.requests == [(24000, 1), (24001, 1), (24002, 1)]
+    bootstrap.succeeded(24000)
+    assert node.completed == 0
+    bootstrap.succeeded(24002)
+    assert node.completed == 1
+    bootstrap.succeeded(24001)
+    assert node.completed == 1
+
+
+def test_failed_seed_is_retried_with_backoff():
+    node, bootstrap = make_bootstrap(max_attempts=3)
+    bootstrap.start([24000])
+    bootstrap.failed(24000, 1)
+    node.scheduler.run_until(100.0)
+    assert node.requests == [(24000, 1), (24000, 2), (24000, 3)]
+    stats = bootstrap.metrics()
+    assert stats["retries"] == 2
+    assert stats["timeouts"] == 2
+    # every seed failed once, the peer does not wait for the retries
+    assert node.completed == 1
+
+
+def test_timeout_counts_as_failure():
+    node, bootstrap = make_bootstrap()
+    bootstrap.start([24000, 24001])
+    bootstrap.succeeded(24000)
+    node.scheduler.run_until(1.0)
+    assert bootstrap.metrics()["timeouts"] == 1
+    assert node.completed == 1
+
+
+def test_late_failure_of_an_earlier_attempt_is_ignored():
+    node, bootstrap = make_bootstrap()
+    bootstrap.start([24000])
+    # the first attempt times out and the retry is sent
+    node.scheduler.run_until(2.0)
+    assert node.requests == [(24000, 1), (24000, 2)]
+    # then the first attempt's connection finally fails
+    bootstrap.failed(24000, 1)
+    stats = bootstrap.metrics()
+    assert stats["failures"] == 1
+    assert stats["in_flight"] == 1
+    bootstrap.succeeded(24000)
+    node.scheduler.run_until(100.0)
+    # no second retry chain was started
+    assert node.requests == [(24000, 1), (24000, 2)]
+
+
+def test_failover_asks_the_next_seed_and_stops_after_an_answer():
+    node, bootstrap = make_bootstrap()
+    bootstrap.start([24000, 24001, 24002], quorum=1, failover=True)
+    assert node.requests == [(24000, 1)]
+    bootstrap.failed(24000, 1)
+    assert node.requests[-1] == (24001, 1)
+    bootstrap.succeeded(24001)
+    node.scheduler.run_until(100.0)
+    assert [port for port, _ in node.requests] == [24000, 24001]
+    assert node.completed == 1
@@ -0,0 +1,112 @@
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from connection_pool import ConnectionPool
+
+
+@pytest.fixture
+def listener():
+    # accepts connections and keeps them, but never reads from them
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(8)
+    accepted = []
+
+    def accept():
+        while True:
+            try:
+                accepted.append(server.accept()[0])
+            except OSError:
+                return
+
+    threading.Thread(target=accept, daemon=True).start()
+    yield server.getsockname()[1]
+    server.close()
+    for conn in accepted:
+        conn.close()
+
+
+def test_one_stream_for_many_sends(listener):
+    pool = ConnectionPool()
+    for _ in range(5):
+        pool.send("127.0.0.1", listener, b"x")
+    metrics = pool.metrics()
+    assert metrics["connects"] == 1
+    assert metrics["sends"] == 5
+    assert metrics["stale_streams"] == 0
+    pool.close()
+
+
+def test_refused_connects_back_off():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    pool = ConnectionPool(backoff_base=10.0)
+    with pytest.raises(OSError):
+        pool.send("127.0.0.1", port, b"x")
+    with pytest.raises(ConnectionRefusedError):
+        pool.send("127.0.0.1", port, b"x")
+    assert pool.metrics()["backoff_rejections"] == 1
+
+
+def test_send_to_a_peer_that_stopped_reading_times_out(listener):
+    pool = ConnectionPool(send_timeout=0.2)
+    chunk = b"x" * 65536
+    started = time.monotonic()
+    with pytest.raises(socket.timeout):
+        while time.monotonic() - started < 10:
+            pool.send("127.0.0.1", listener, chunk)
+    assert pool.metrics()["send_timeouts"] == 1
+    assert pool.metrics()["open_streams"] == 0
+
+
+def test_discard_does_not_wait_for_a_blocked_send(listener):
+    pool = ConnectionPool(send_timeout=30.0)
+    failed = threading.Event()
+
+    def flood():
+        try:
+            while True:
+                pool.send("127.0.0.1", listener, b"x" * 65536)
+        except OSError:
+            failed.set()
+
+    threading.Thread(target=flood, daemon=True).start()
+    # wait until the socket buffers are full and the sender is stuck
+    deadline = time.monotonic() + 5
+    sends = -1
+    while sends != pool.metrics()["sends"]:
+        assert time.monotonic() < deadline
+        sends = pool.metrics()["sends"]
+        time.sleep(0.2)
+    started = time.monotonic()
+    pool.discard("127.0.0.1", listener)
+    assert time.monotonic() - started < 1
+    assert failed.wait(1)
+
+
+def test_streams_past_fd_setsize_are_reused(listener):
+    # fill the descriptor table so the pooled socket lands beyond 1024
+    filler = []
+    try:
+        while len(filler) < 1100:
+            filler.append(os.open(os.devnull, os.O_RDONLY))
+    except OSError:
+        pytest.skip("not enough file descriptors")
+    pool = ConnectionPool()
+    try:
+        for _ in range(5):
+            pool.send("127.0.0.1", listener, b"x")
+        conn = pool.get_connection(("127.0.0.1", listener))
+        assert conn.sock.fileno() >= 1024
+        metrics = pool.metrics()
+        assert metrics["connects"] == 1
+        assert metrics["stale_streams"] == 0
+    finally:
+        pool.close()
+        for fd in filler:
+            os.close(fd)
@@ -0,0 +1,48 @@
+from dead_reports import DeadNodeVotes
+
+
+class Clock:
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+def test_quorum_of_distinct_reporters_confirms():
+    votes = DeadNodeVotes(quorum=2, window=30.0, clock=Clock())
+    assert not votes.report("127.0.0.1:30001", "127.0.0.1:30002")
+    assert not votes.report("127.0.0.1:30001", "127.0.0.1:30002")
+    assert votes.report("127.0.0.1:30001", "127.0.0.1:30003")
+    stats = votes.metrics()
+    assert stats["duplicates"] == 1
+    assert stats["confirmed"] == 1
+    assert stats["suspects"] == 0
+
+
+def test_votes_older_than_the_window_do_not_count():
+    clock = Clock()
+    votes = DeadNodeVotes(quorum=2, window=30.0, clock=clock)
+    votes.report("127.0.0.1:30001", "127.0.0.1:30002")
+    clock.time = 31.0
+    assert not votes.report("127.0.0.1:30001", "127.0.0.1:30003")
+    clock.time = 40.0
+    assert votes.report("127.0.0.1:30001", "127.0.0.1:30004")
+
+
+def test_clear_forgets_the_votes():
+    votes = DeadNodeVotes(quorum=2, clock=Clock())
+    votes.report("127.0.0.1:30001", "127.0.0.1:30002")
+    votes.clear("127.0.0.1:30001")
+    assert not votes.report("127.0.0.1:30001", "127.0.0.1:30003")
+
+
+def test_stale_suspects_are_swept():
+    clock = Clock()
+    votes = DeadNodeVotes(quorum=3, window=10.0, clock=clock)
+    votes.report("127.0.0.1:30001", "127.0.0.1:30002")
+    clock.time = 11.0
+    votes.report("127.0.0.1:30005", "127.0.0.1:30002")
+    stats = votes.metrics()
+    assert stats["expired"] == 1
+    assert stats["suspects"] == 1
@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+from dissemination import FloodStrategy, PushStrategy, make_strategy
+from gossip_cache import message_digest
+from node_log import OutputLog
+from scheduler import VirtualScheduler
+from sim_node import SimNetwork, SimPeerNode
+
+
+class QuietLog(OutputLog):
+    def __init__(self):
+        super().__init__(None, quiet=True)
+
+    def write(self, message):
+        pass
+
+
+def gossip(index):
+    return f"Gossip Message:{1000 + index}:127.0.0.1:24009"
+
+
+@pytest.fixture
+def network():
+    return SimNetwork(VirtualScheduler(), rng=random.Random(1))
+
+
+def sim_peer(network, port, neighbours):
+    peer = SimPeerNode("127.0.0.1", port, network)
+    peer.log = QuietLog()
+    peer.strategy = make_strategy("push-pull", rng=peer.rng)
+    for neighbour in neighbours:
+        peer.peer_table.add_neighbour(str(neighbour))
+    network.attach(port, peer)
+    return peer
+
+
+def remember(peer, messages):
+    for message in messages:
+        peer.seen_messages.check_and_add(message_digest(message), message)
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        make_strategy("broadcast")
+
+
+def test_push_targets_respect_fanout_and_exclusions():
+    strategy = PushStrategy(fanout=2, rng=random.Random(1))
+    targets = strategy.push_targets(["1", "2", "3", "4"], exclude=("1",))
+    assert len(targets) == 2
+    assert "1" not in targets
+    assert FloodStrategy().push_targets(["1", "2", "3"], exclude=("2",)) == ["1", "3"]
+
+
+def test_pull_ships_only_the_missing_message(network):
+    # both peers saw far more messages than one pull request lists, in a
+    # different order, and only the responder has the last one
+    requester = sim_peer(network, 24001, [24002])
+    responder = sim_peer(network, 24002, [24001])
+    messages = [gossip(index) for index in range(300)]
+    remember(requester, messages)
+    remember(responder, list(reversed(messages)) + [gossip(300)])
+
+    requester.pull_round()
+    network.scheduler.run_until(1.0)
+
+    assert responder.dissemination_stats.metrics()["pull_replies"] == 1
+    assert requester.dissemination_stats.metrics()["pull_wants"] == 1
+    assert message_digest(gossip(300)) in requester.seen_messages
+    assert requester.dissemination_stats.metrics()["delivered"] == 1
+
+
+def test_pull_between_equal_caches_sends_no_bodies(network):
+    requester = sim_peer(network, 24001, [24002])
+    responder = sim_peer(network, 24002, [24001])
+    messages = [gossip(index) for index in range(50)]
+    remember(requester, messages)
+    remember(responder, messages)
+
+    requester.pull_round()
+    network.scheduler.run_until(1.0)
+
+    assert responder.dissemination_stats.metrics()["pull_offers"] == 0
+    assert responder.dissemination_stats.metrics()["pull_replies"] == 0
@@ -0,0 +1,109 @@
+import pytest
+
+import framing
+from framing import FrameReader, decode_body, encode_message, encode_text
+
+MESSAGES = [
+    "REGISTER 24001",
+    "PEERS 24001 24002 24003",
+    "PEERS",
+    "MORE PEERS 32 24005 24006",
+    "Gossip Message:1700000000:127.0.0.1:24001",
+    "Gossip Message:1700000000:127.0.0.1:24001:4",
+    "Gossip Message:1700000000:127.0.0.1:24001:4:payload with: colons",
+    "Liveness Request:1700000000:24001",
+    "Liveness Reply:1700000000:24002",
+    "Dead Node:127.0.0.1:24003:1700000000:127.0.0.1",
+    "Dead Nodes:1700000000:127.0.0.1:24001:127.0.0.1:24003,127.0.0.1:24004",
+    "Membership:24001:alive:3,24002:dead:7",
+    "Neighbour Request:24001",
+]
+
+
+def read_all(data, chunk=None):
+    reader = FrameReader(size=16)
+    messages = []
+    step = chunk or len(data)
+    for start in range(0, len(data), step):
+        reader.feed(data[start:start + step])
+        messages.extend(reader.messages())
+    return messages
+
+
+@pytest.mark.parametrize("message", MESSAGES)
+def test_binary_round_trip(message):
+    assert read_all(encode_message(message)) == [message]
+
+
+def test_compact_types_are_packed():
+    data = encode_message("Liveness Request:1700000000:24001")
+    assert data[0] == framing.MAGIC
+    assert data[1] == framing.LIVENESS_REQUEST
+    assert encode_message("Neighbour Request:24001")[1] == framing.TEXT
+
+
+def test_batch_round_trip():
+    items = MESSAGES[4:7]
+    message = framing.gossip_batch(items)
+    assert read_all(encode_message(message)) == [message]
+    assert framing.split_batch(message) == items
+
+
+def test_frames_split_across_reads():
+    data = b"".join(encode_message(message) for message in MESSAGES)
+    assert read_all(data, chunk=3) == MESSAGES
+
+
+def test_text_lines_and_unterminated_tail():
+    reader = FrameReader()
+    reader.feed(encode_text("REGISTER 24001") + b"PEERS 24002")
+    assert reader.messages() == ["REGISTER 24001"]
+    assert reader.finish() == "PEERS 24002"
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "PEERS 24001 24002 24003",
+        "MORE PEERS 32 24005 24006",
+        "Gossip Message:1700000000:127.0.0.1:24001",
+        "Liveness Reply:1700000000:24002",
+        "Dead Nodes:1700000000:127.0.0.1:24001:127.0.0.1:24003,127.0.0.1:24004",
+        "Membership:24001:alive:3,24002:dead:7",
+    ],
+)
+def test_truncated_body_raises_value_error(message):
+    data = encode_message(message)
+    body = data[framing.HEADER.size:]
+    with pytest.raises(ValueError):
+        decode_body(data[1], memoryview(body)[:-1])
+
+
+def test_unknown_member_status_raises_value_error():
+    body = framing.COUNT.pack(1) + framing.MEMBER_ENTRY.pack(24001, 9, 1)
+    with pytest.raises(ValueError):
+        decode_body(framing.MEMBERSHIP, body)
+
+
+def test_corrupt_header_raises_value_error():
+    reader = FrameReader()
+    reader.feed(bytes([framing.MAGIC, framing.TEXT, 0, 0, 0, 1, 65]) + bytes([0x00] * 6))
+    with pytest.raises(ValueError):
+        reader.messages()
+
+
+def test_unknown_type_is_skipped():
+    data = framing.frame(200, b"from a newer node") + encode_message("REGISTER 24001")
+    assert read_all(data) == ["REGISTER 24001"]
+
+
+def test_buffer_starts_small_and_shrinks_after_a_large_frame():
+    reader = FrameReader()
+    assert len(reader.buffer) <= 4096
+    message = "Gossip Message:1700000000:127.0.0.1:24001:4:" + "x" * 100000
+    data = encode_message(message)
+    reader.feed(data[:50000])
+    assert reader.messages() == []
+    reader.feed(data[50000:])
+    assert reader.messages() == [message]
+    assert len(reader.buffer) <= 4096
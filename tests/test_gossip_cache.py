@@ -0,0 +1,86 @@
+from gossip_cache import SeenCache, message_digest
+
+
+class FakeClock:
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+def test_first_sighting_only():
+    cache = SeenCache(capacity=4, ttl=10.0, clock=FakeClock())
+    assert cache.check_and_add(b"a")
+    assert not cache.check_and_add(b"a")
+    assert cache.metrics()["hits"] == 1
+    assert cache.metrics()["misses"] == 1
+
+
+def test_capacity_evicts_least_recently_seen():
+    cache = SeenCache(capacity=3, ttl=10.0, clock=FakeClock())
+    for key in (b"a", b"b", b"c"):
+        cache.check_and_add(key)
+    # touching a makes b the least recently seen
+    cache.check_and_add(b"a")
+    cache.check_and_add(b"d")
+    assert len(cache) == 3
+    assert b"b" not in cache
+    assert b"a" in cache and b"c" in cache and b"d" in cache
+    assert cache.metrics()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = SeenCache(capacity=8, ttl=10.0, clock=clock)
+    cache.check_and_add(b"a")
+    clock.time = 5.0
+    cache.check_and_add(b"b")
+    clock.time = 10.0
+    assert b"a" not in cache
+    assert b"b" in cache
+    # an expired key counts as new again
+    assert cache.check_and_add(b"a")
+    assert cache.metrics()["expirations"] == 1
+
+
+def test_a_repeat_sighting_extends_the_ttl():
+    clock = FakeClock()
+    cache = SeenCache(capacity=8, ttl=10.0, clock=clock)
+    cache.check_and_add(b"a")
+    clock.time = 8.0
+    cache.check_and_add(b"a")
+    clock.time = 15.0
+    assert b"a" in cache
+
+
+def test_recent_returns_stored_messages_newest_first():
+    cache = SeenCache(capacity=8, ttl=10.0, clock=FakeClock())
+    cache.check_and_add(b"a", "first")
+    cache.check_and_add(b"b")
+    cache.check_and_add(b"c", "third")
+    assert cache.recent(8) == [(b"c", "third"), (b"a", "first")]
+    assert cache.recent(1) == [(b"c", "third")]
+
+
+def test_digests_restore_into_a_new_cache():
+    clock = FakeClock()
+    cache = SeenCache(capacity=8, ttl=10.0, clock=clock)
+    cache.check_and_add(b"a", "first")
+    clock.time = 4.0
+    cache.check_and_add(b"b", "second")
+    digests = cache.digests(8)
+    assert digests == [(b"a", 6.0), (b"b", 10.0)]
+    restored = SeenCache(capacity=8, ttl=10.0, clock=clock)
+    restored.restore(digests)
+    assert not restored.check_and_add(b"b")
+    clock.time = 10.0
+    assert b"a" not in restored
+    assert b"b" in restored
+
+
+def test_digest_ignores_the_hop_count():
+    plain = "Gossip Message:1700000000:127.0.0.1:24001"
+    assert message_digest(plain) == message_digest(f"{plain}:3")
+    assert message_digest(f"{plain}:3:x") == message_digest(f"{plain}:1:x")
+    assert message_digest(f"{plain}:3:x") != message_digest(f"{plain}:3:y")
@@ -0,0 +1,55 @@
+import pytest
+
+from hash_ring import HashRing, quorum_size
+
+
+@pytest.mark.parametrize(
+    "nodes, quorum",
+    [(0, 0), (1, 1), (2, 2), (3, 3), (4, 3), (5, 4), (6, 4), (7, 5)],
+)
+def test_quorum_size(nodes, quorum):
+    assert quorum_size(nodes) == quorum
+
+
+def test_responsible_nodes_are_distinct_and_bounded():
+    ring = HashRing([24000, 24001, 24002])
+    for key in range(100):
+        owners = ring.responsible(f"127.0.0.1:{key}", 2)
+        assert len(owners) == 2
+        assert len(set(owners)) == 2
+    assert sorted(ring.responsible("127.0.0.1:1", 10)) == [24000, 24001, 24002]
+
+
+def test_responsible_is_a_prefix_of_the_successor_list():
+    ring = HashRing([24000, 24001, 24002, 24003])
+    for key in range(50):
+        everyone = ring.responsible(key, len(ring))
+        assert ring.responsible(key, 1) == everyone[:1]
+        assert ring.responsible(key, 3) == everyone[:3]
+
+
+def test_same_ring_on_every_node():
+    first = HashRing([24000, 24001, 24002])
+    second = HashRing([24002, 24000, 24001])
+    assert all(first.responsible(key, 2) == second.responsible(key, 2) for key in range(100))
+
+
+def test_removing_a_node_only_moves_its_keys():
+    ring = HashRing([24000, 24001, 24002, 24003])
+    before = {key: ring.responsible(key, 1)[0] for key in range(500)}
+    ring.remove(24003)
+    for key, owner in before.items():
+        if owner != 24003:
+            assert ring.responsible(key, 1) == [owner]
+    assert 24003 not in {ring.responsible(key, 1)[0] for key in range(500)}
+
+
+def test_keys_spread_over_every_node():
+    ring = HashRing([24000, 24001, 24002, 24003])
+    owners = [ring.responsible(f"127.0.0.1:{port}", 1)[0] for port in range(25000, 27000)]
+    for node in ring.nodes:
+        assert owners.count(node) > 2000 / 4 / 2
+
+
+def test_empty_ring():
+    assert HashRing().responsible("127.0.0.1:24001", 2) == []
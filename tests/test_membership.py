@@ -0,0 +1,118 @@
+import random
+
+import pytest
+
+from membership import ALIVE, DEAD, SUSPECT, MembershipUpdates, membership_message, parse_membership
+from node_log import OutputLog
+from scheduler import VirtualScheduler
+from sim_node import SimNetwork, SimPeerNode
+
+
+class QuietLog(OutputLog):
+    def __init__(self):
+        super().__init__(None, quiet=True)
+
+    def write(self, message):
+        pass
+
+
+def test_message_round_trip():
+    updates = [("24001", ALIVE, 3), ("24002", SUSPECT, 5), ("24003", DEAD, 7)]
+    assert parse_membership(membership_message(updates)) == updates
+
+
+def test_unknown_status_is_rejected():
+    with pytest.raises(ValueError):
+        parse_membership("Membership:24001:zombie:3")
+
+
+@pytest.mark.parametrize(
+    "current, update, news",
+    [
+        ((ALIVE, 5), (ALIVE, 5), False),
+        ((ALIVE, 5), (ALIVE, 6), True),
+        ((ALIVE, 5), (SUSPECT, 5), True),
+        ((ALIVE, 5), (SUSPECT, 4), False),
+        ((SUSPECT, 5), (ALIVE, 5), False),
+        ((SUSPECT, 5), (ALIVE, 6), True),
+        ((SUSPECT, 5), (DEAD, 5), True),
+        ((DEAD, 5), (SUSPECT, 5), False),
+        ((DEAD, 5), (DEAD, 5), False),
+        ((DEAD, 5), (ALIVE, 6), True),
+    ],
+)
+def test_precedence(current, update, news):
+    members = MembershipUpdates(24000)
+    members.record("24001", *current, 10)
+    assert members.record("24001", *update, 10) is news
+    assert members.state_of("24001") == (update if news else current)
+
+
+@pytest.mark.parametrize("status", [SUSPECT, DEAD])
+def test_a_peer_refutes_its_suspicion_or_death(status):
+    members = MembershipUpdates(24001, incarnation=5)
+    assert members.received([("24001", status, 5)], 10) == []
+    assert members.incarnation == 6
+    assert members.piggyback() == "Membership:24001:alive:6"
+    assert members.metrics()["refuted"] == 1
+
+
+def test_updates_are_retransmitted_a_bounded_number_of_times():
+    members = MembershipUpdates(24000, retransmit_factor=2)
+    members.record("24001", ALIVE, 1, 3)
+    sent = 0
+    while members.piggyback() is not None:
+        sent += 1
+    assert sent == members.retransmit_limit(3) == 4
+
+
+@pytest.fixture
+def network():
+    return SimNetwork(VirtualScheduler(), rng=random.Random(1))
+
+
+def sim_peer(network, port):
+    peer = SimPeerNode("127.0.0.1", port, network)
+    peer.log = QuietLog()
+    network.attach(port, peer)
+    return peer
+
+
+def fail_probes(peer, port):
+    peer.liveness.track(port)
+    for _ in range(3):
+        peer.record_liveness_failure(port)
+
+
+def test_suspected_peer_that_answers_stays_alive(network):
+    prober = sim_peer(network, 24001)
+    suspect = sim_peer(network, 24002)
+    prober.liveness.start()
+    fail_probes(prober, "24002")
+    assert prober.membership.state_of("24002")[0] == SUSPECT
+    network.scheduler.run_until(prober.suspect_timeout + 1)
+    assert not prober.peer_table.is_dead("24002")
+    assert prober.metrics.snapshot()["counters"]["suspicions_refuted"] == 1
+    # the probe carried the suspicion, the suspect refuted it as well
+    assert suspect.membership.metrics()["refuted"] == 1
+
+
+def test_suspected_peer_that_refutes_stays_alive(network):
+    prober = sim_peer(network, 24001)
+    prober.liveness.start()
+    fail_probes(prober, "24002")
+    # the suspect's newer alive update arrives before the verdict
+    prober.process_membership("Membership:24002:alive:1")
+    network.scheduler.run_until(prober.suspect_timeout + 1)
+    assert not prober.peer_table.is_dead("24002")
+
+
+def test_silent_suspect_is_declared_dead(network):
+    prober = sim_peer(network, 24001)
+    prober.liveness.start()
+    fail_probes(prober, "24002")
+    network.scheduler.run_until(prober.suspect_timeout / 2)
+    assert not prober.peer_table.is_dead("24002")
+    network.scheduler.run_until(prober.suspect_timeout + 1)
+    assert prober.peer_table.is_dead("24002")
+    assert prober.membership.state_of("24002")[0] == DEAD
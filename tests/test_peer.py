@@ -0,0 +1,73 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from node_log import OutputLog
+from peer import PeerNode
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def wait_until(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def peer(tmp_path):
+    node = PeerNode("127.0.0.1", free_port())
+    node.log = OutputLog(str(tmp_path / "output.txt"), quiet=True)
+    yield node
+    node.stop()
+
+
+@pytest.fixture
+def legacy_peer():
+    # reads like the peers from before the frames: one recv per message
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(8)
+    received = []
+
+    def serve():
+        while True:
+            try:
+                client, _ = server.accept()
+            except OSError:
+                return
+            with client:
+                while True:
+                    message = client.recv(1024).decode()
+                    if not message:
+                        break
+                    received.append(message)
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield server.getsockname()[1], received
+    server.close()
+
+
+def test_binary_is_the_default_wire_format(peer):
+    assert peer.wire_format == "binary"
+
+
+def test_text_mode_sends_one_message_per_connection(peer, legacy_peer):
+    port, received = legacy_peer
+    peer.wire_format = "text"
+    messages = [f"Gossip Message:{1700000000 + index}:127.0.0.1:24001" for index in range(3)]
+    for message in messages:
+        peer.send_to_node(port, message, "Membership:24001:alive:3")
+    wait_until(lambda: len(received) == 6)
+    assert received == [item for message in messages for item in (message, "Membership:24001:alive:3")]
+    # what the legacy gossip handler does with each of them
+    for message in received[::2]:
+        _, timestamp, _, _ = message.split(":")
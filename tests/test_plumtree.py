@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+from dissemination import make_strategy
+from node_log import OutputLog
+from scheduler import VirtualScheduler
+from sim_node import SimNetwork, SimPeerNode
+
+
+class QuietLog(OutputLog):
+    def __init__(self):
+        super().__init__(None, quiet=True)
+
+    def write(self, message):
+        pass
+
+
+@pytest.fixture
+def peers():
+    # a ring with chords, every peer has four neighbours
+    network = SimNetwork(VirtualScheduler(), rng=random.Random(1))
+    count = 16
+    peers = []
+    for i in range(count):
+        port = 24001 + i
+        peer = SimPeerNode("127.0.0.1", port, network)
+        peer.log = QuietLog()
+        peer.rng = random.Random(i)
+        peer.strategy = make_strategy("plumtree", rng=peer.rng)
+        for step in (1, -1, 4, -4):
+            peer.peer_table.add_neighbour(str(24001 + (i + step) % count))
+        network.attach(port, peer)
+        peers.append(peer)
+    return peers
+
+
+def broadcast(peers, origin, index):
+    scheduler = peers[0].network.scheduler
+    origin.generate_gossip_message(f"message {index}")
+    scheduler.run_until(scheduler.now() + 5.0)
+
+
+def delivered(peers):
+    return sum(peer.dissemination_stats.metrics()["delivered"] for peer in peers)
+
+
+def redundant(peers):
+    return sum(peer.dissemination_stats.metrics()["redundant"] for peer in peers)
+
+
+def test_every_peer_gets_every_message(peers):
+    for index in range(5):
+        broadcast(peers, peers[index], index)
+    assert delivered(peers) == 5 * (len(peers) - 1)
+
+
+def test_duplicates_prune_the_links_into_a_tree(peers):
+    broadcast(peers, peers[0], 0)
+    assert redundant(peers) > 0
+    assert sum(peer.broadcast_tree.stats["prunes_sent"] for peer in peers) > 0
+    before = redundant(peers)
+    broadcast(peers, peers[0], 1)
+    # the second message follows the spanning tree, one copy per peer
+    assert delivered(peers) == 2 * (len(peers) - 1)
+    assert redundant(peers) == before
+    assert sum(len(peer.broadcast_tree.lazy_peers()) for peer in peers) > 0
+
+
+def test_lazy_links_repair_a_broken_tree(peers):
+    broadcast(peers, peers[0], 0)
+    broadcast(peers, peers[0], 1)
+    # a peer on the tree leaves without its neighbours noticing
+    gone = max(peers[1:], key=lambda peer: len(peer.broadcast_tree.eager_peers()))
+    gone.network.detach(gone.port)
+    live = [peer for peer in peers if peer is not gone]
+    before = delivered(live)
+    broadcast(peers, peers[0], 2)
+    assert delivered(live) - before == len(live) - 1
+    assert sum(peer.broadcast_tree.stats["grafts"] for peer in live) > 0
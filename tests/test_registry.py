@@ -0,0 +1,100 @@
+import random
+
+from registry import PeerRegistry
+
+
+def make_registry(tmp_path, count=0):
+    registry = PeerRegistry(str(tmp_path / "peers.txt"), rng=random.Random(1))
+    for port in range(count):
+        registry.add("127.0.0.1", 30000 + port)
+    return registry
+
+
+def test_add_is_idempotent(tmp_path):
+    registry = make_registry(tmp_path)
+    assert registry.add("127.0.0.1", 30000)
+    assert not registry.add("127.0.0.1", 30000)
+    assert len(registry) == 1
+    assert ("127.0.0.1", 30000) in registry
+
+
+def test_remove_keeps_the_index_dense(tmp_path):
+    registry = make_registry(tmp_path, 10)
+    assert registry.remove("127.0.0.1", 30003)
+    assert not registry.remove("127.0.0.1", 30003)
+    assert registry.remove_many([("127.0.0.1", 30000), ("127.0.0.1", 39999)]) == [("127.0.0.1", 30000)]
+    peers = registry.snapshot()
+    assert len(peers) == 8
+    for position, key in enumerate(peers):
+        assert registry.index[key] == position
+
+
+def test_flush_writes_peers_in_registration_order(tmp_path):
+    registry = make_registry(tmp_path, 5)
+    registry.remove("127.0.0.1", 30001)
+    registry.flush()
+    lines = (tmp_path / "peers.txt").read_text().split()
+    assert lines == ["30000", "30002", "30003", "30004"]
+
+
+def test_flush_skips_an_unchanged_registry(tmp_path):
+    registry = make_registry(tmp_path, 3)
+    registry.flush()
+    path = tmp_path / "peers.txt"
+    path.write_text("untouched")
+    registry.flush()
+    assert path.read_text() == "untouched"
+    registry.add("127.0.0.1", 30010)
+    registry.flush()
+    assert path.read_text().split() == ["30000", "30001", "30002", "30010"]
+
+
+def test_uniform_sample_is_bounded_and_excludes(tmp_path):
+    registry = make_registry(tmp_path, 100)
+    exclude = {("127.0.0.1", 30000 + port) for port in range(10)}
+    for _ in range(50):
+        sample = registry.sample(8, exclude=exclude)
+        assert len(sample) == 8
+        assert len(set(sample)) == 8
+        assert not exclude & set(sample)
+    assert len(make_registry(tmp_path, 3).sample(8)) == 3
+
+
+def test_preferential_sample_favours_handed_out_peers(tmp_path):
+    registry = make_registry(tmp_path, 50)
+    popular = ("127.0.0.1", 30000)
+    others = set(registry.snapshot()) - {popular}
+    # every sample that hands a peer out raises its degree
+    for _ in range(500):
+        assert registry.sample(1, exclude=others) == [popular]
+    hits = sum(popular in registry.sample(4, mode="preferential") for _ in range(100))
+    assert hits > 50
+    sample = registry.sample(60, exclude={popular}, mode="preferential")
+    assert len(sample) == 49
+    assert popular not in sample
+
+
+def test_pages_walk_the_registry_in_order(tmp_path):
+    registry = make_registry(tmp_path, 25)
+    ports = []
+    cursor = 0
+    while True:
+        page, cursor = registry.page(cursor, 10)
+        assert len(page) <= 10
+        ports.extend(port for _, port in page)
+        if cursor == 0:
+            break
+    assert ports == [30000 + port for port in range(25)]
+
+
+def test_paging_survives_changes_between_pages(tmp_path):
+    registry = make_registry(tmp_path, 20)
+    page, cursor = registry.page(0, 10)
+    # a peer from the first page leaves and rejoins, one from the next leaves
+    registry.remove("127.0.0.1", 30002)
+    registry.add("127.0.0.1", 30002)
+    registry.remove("127.0.0.1", 30015)
+    rest, cursor = registry.page(cursor, 100)
+    assert cursor == 0
+    ports = [port for _, port in rest]
+    assert ports == [30000 + port for port in range(10, 20) if port != 15] + [30002]
@@ -0,0 +1,206 @@
+import random
+
+import pytest
+
+from node_log import OutputLog
+from replication import RegistryReplica, entry_text, parse_entries
+from scheduler import VirtualScheduler
+from sim_node import SimNetwork, SimPeerNode, SimSeedNode
+
+
+class FakeClock:
+    def __init__(self, time=1000.0):
+        self.time = time
+
+    def __call__(self):
+        return self.time
+
+
+def peer(port):
+    return ("127.0.0.1", port)
+
+
+def sync(local, remote):
+    # one anti-entropy round as the seeds run it, returns the entries shipped
+    if local.root() == remote.root():
+        return 0
+    buckets = local.differing(remote.leaf_digest().split())
+    sent = parse_entries(local.entries(buckets))
+    remote.merge(sent)
+    back = parse_entries(remote.entries(buckets, sent))
+    local.merge(back)
+    return len(sent) + len(back)
+
+
+def test_entry_text_round_trip():
+    entries = [(peer(24001), 5, True), (peer(24002), 7, False)]
+    assert parse_entries([entry_text(key, version, alive) for key, version, alive in entries]) == entries
+
+
+def test_equal_registries_have_equal_roots():
+    clock = FakeClock()
+    first = RegistryReplica(clock=clock)
+    second = RegistryReplica(clock=clock)
+    for port in range(24001, 24050):
+        first.record(peer(port), True)
+    second.merge(parse_entries(first.entries(range(len(first.buckets)))))
+    assert first.root() == second.root()
+    assert first.differing(second.leaf_digest().split()) == []
+
+
+def test_only_changed_buckets_differ():
+    clock = FakeClock()
+    first = RegistryReplica(clock=clock)
+    second = RegistryReplica(clock=clock)
+    for port in range(24001, 24200):
+        first.record(peer(port), True)
+    sync(first, second)
+    first.record(peer(24300), True)
+    first.record(peer(24010), False)
+    differing = first.differing(second.leaf_digest().split())
+    assert sorted(differing) == sorted({first.bucket(peer(24300)), first.bucket(peer(24010))})
+    # whole buckets travel, not the rest of the registry
+    assert sync(first, second) == sum(len(first.buckets[index]) for index in differing)
+    assert first.root() == second.root()
+
+
+def test_newer_version_wins_both_ways():
+    clock = FakeClock()
+    first = RegistryReplica(clock=clock)
+    second = RegistryReplica(clock=clock)
+    first.record(peer(24001), True)
+    sync(first, second)
+    clock.time += 1
+    second.record(peer(24001), False)
+    first.record(peer(24002), True)
+    sync(first, second)
+    assert first.root() == second.root()
+    assert first.merge([(peer(24001), 1, True)]) == []
+    assert first.metrics()["tombstones"] == 1
+    assert first.metrics()["entries"] == 2
+
+
+def test_registration_beats_removal_at_equal_versions():
+    replica = RegistryReplica(clock=FakeClock())
+    replica.merge([(peer(24001), 5, False)])
+    assert replica.merge([(peer(24001), 5, True)]) == [(peer(24001), True)]
+    assert replica.merge([(peer(24001), 5, False)]) == []
+
+
+def test_tombstones_expire_everywhere_at_once():
+    clock = FakeClock()
+    replica = RegistryReplica(tombstone_ttl=60.0, clock=clock)
+    replica.record(peer(24001), False)
+    clock.time += 59
+    replica.expire()
+    assert replica.metrics()["tombstones"] == 1
+    clock.time += 2
+    replica.expire()
+    assert replica.metrics()["tombstones"] == 0
+    assert replica.metrics()["entries"] == 0
+    # a late copy of the expired tombstone is not taken back
+    assert replica.merge([(peer(24001), int((clock.time - 61) * 1000), False)]) == []
+    assert replica.metrics()["entries"] == 0
+
+
+def test_wrong_leaf_count_is_rejected():
+    replica = RegistryReplica(clock=FakeClock())
+    with pytest.raises(ValueError):
+        replica.differing(["0"] * 3)
+
+
+def test_restart_from_a_saved_replica_ships_only_the_changes(tmp_path):
+    clock = FakeClock()
+    path = tmp_path / "replica.bin"
+    running = RegistryReplica(clock=clock)
+    restarted = RegistryReplica(clock=clock)
+    for port in range(24001, 24500):
+        running.record(peer(port), True)
+    sync(running, restarted)
+    restarted.save(path)
+    # the seed is down while two peers change
+    clock.time += 5
+    running.record(peer(24600), True)
+    running.record(peer(24001), False)
+
+    fresh = RegistryReplica(clock=clock)
+    registered = fresh.load(path)
+    assert len(registered) == 499
+    assert fresh.root() == restarted.root()
+    changed = {running.bucket(peer(24600)), running.bucket(peer(24001))}
+    assert sync(running, fresh) == sum(len(running.buckets[index]) for index in changed)
+    assert fresh.root() == running.root()
+    # an empty replica needs the whole registry
+    assert sync(running, RegistryReplica(clock=clock)) == 500
+
+
+def test_stale_or_damaged_replica_is_ignored(tmp_path):
+    clock = FakeClock()
+    path = tmp_path / "replica.bin"
+    replica = RegistryReplica(tombstone_ttl=60.0, clock=clock)
+    replica.record(peer(24001), True)
+    replica.save(path)
+    clock.time += 31
+    assert RegistryReplica(tombstone_ttl=60.0, clock=clock).load(path) is None
+    path.write_bytes(b"not a replica")
+    assert RegistryReplica(clock=clock).load(path) is None
+    assert RegistryReplica(clock=clock).load(tmp_path / "missing.bin") is None
+
+
+class QuietLog(OutputLog):
+    def __init__(self):
+        super().__init__(None, quiet=True)
+
+    def write(self, message):
+        pass
+
+
+def replicated_network(seed_count):
+    network = SimNetwork(VirtualScheduler(), rng=random.Random(1))
+    seeds = []
+    for i in range(seed_count):
+        seed = SimSeedNode("127.0.0.1", 24000 + i, network, random.Random(i))
+        seed.log = QuietLog()
+        seed.replication = True
+        seed.start()
+        seeds.append(seed)
+    return network, seeds
+
+
+def replicated_peer(network, port):
+    peer = SimPeerNode("127.0.0.1", port, network)
+    peer.log = QuietLog()
+    peer.rng = random.Random(port)
+    peer.gossip_count = 0
+    peer.replicated_seeds = True
+    peer.start()
+    return peer
+
+
+def test_every_seed_learns_every_registration():
+    network, seeds = replicated_network(3)
+    for port in range(24100, 24110):
+        replicated_peer(network, port)
+    network.scheduler.run_until(20.0)
+    everyone = {peer(port) for port in range(24100, 24110)}
+    for seed in seeds:
+        assert set(seed.registry.snapshot()) == everyone
+    # each peer registered with one seed only
+    assert sum(seed.metrics.snapshot()["counters"].get("registrations", 0) for seed in seeds) == 10
+
+
+def test_registration_fails_over_to_the_next_seed():
+    network, seeds = replicated_network(3)
+    down = seeds[0]
+    down.stop()
+    peers = [replicated_peer(network, port) for port in range(24100, 24110)]
+    network.scheduler.run_until(20.0)
+    for node in peers:
+        assert node.bootstrapped.is_set()
+        assert node.bootstrap.metrics()["answered"] == 1
+    failed_over = [node for node in peers if node.seeds_for(node.port)[0] == down.port]
+    assert failed_over
+    for node in failed_over:
+        assert node.bootstrap.metrics()["failures"] >= 1
+    for seed in seeds[1:]:
+        assert len(seed.registry) == 10
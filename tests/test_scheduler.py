@@ -0,0 +1,49 @@
+import threading
+
+from scheduler import TimerScheduler, VirtualScheduler
+
+
+def test_virtual_timers_run_in_deadline_order():
+    scheduler = VirtualScheduler()
+    ran = []
+    scheduler.call_later(2.0, ran.append, "late")
+    scheduler.call_later(1.0, ran.append, "early")
+    scheduler.call_later(3.0, ran.append, "after")
+    scheduler.call_later(1.5, ran.append, "cancelled").cancel()
+    scheduler.run_until(2.5)
+    assert ran == ["early", "late"]
+    assert scheduler.now() == 2.5
+
+
+def test_failing_callback_goes_to_the_error_hook(capsys):
+    errors = []
+    done = threading.Event()
+
+    def fail():
+        raise ValueError("boom")
+
+    scheduler = TimerScheduler(on_error=lambda callback, error: errors.append((callback, error)))
+    scheduler.start()
+    try:
+        scheduler.call_later(0.0, fail)
+        scheduler.call_later(0.01, done.set)
+        assert done.wait(5)
+    finally:
+        scheduler.stop()
+    assert [(callback, type(error)) for callback, error in errors] == [(fail, ValueError)]
+    assert scheduler.failures == 1
+    assert capsys.readouterr() == ("", "")
+
+
+def test_failing_callback_without_a_hook_prints_nothing(capsys):
+    done = threading.Event()
+    scheduler = TimerScheduler()
+    scheduler.start()
+    try:
+        scheduler.call_later(0.0, int, "not a number")
+        scheduler.call_later(0.01, done.set)
+        assert done.wait(5)
+    finally:
+        scheduler.stop()
+    assert scheduler.failures == 1
+    assert capsys.readouterr() == ("", "")
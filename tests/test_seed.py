@@ -0,0 +1,82 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import framing
+from connection_pool import ConnectionPool
+from node_log import OutputLog
+from seed import SeedNode
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+@pytest.fixture
+def seed(tmp_path, monkeypatch):
+    # the seed keeps its peers file in the working directory
+    monkeypatch.chdir(tmp_path)
+    node = SeedNode("127.0.0.1", free_port())
+    node.log = OutputLog(str(tmp_path / "output.txt"), quiet=True)
+    node.registry.flush_interval = 0.05
+    thread = threading.Thread(target=node.start, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while node.server_socket is None:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    yield node
+    node.stop()
+
+
+def register(seed, port):
+    with socket.create_connection(("127.0.0.1", seed.port), timeout=5) as sock:
+        sock.sendall(framing.encode_message(f"REGISTER {port}"))
+        frames = framing.FrameReader()
+        while frames.recv_into(sock):
+            pass
+        return frames.messages()
+
+
+def wait_until(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_register_answers_with_earlier_peers(seed):
+    assert register(seed, 40001) == ["PEERS "]
+    assert register(seed, 40002) == ["PEERS 40001"]
+    assert len(seed.registry) == 2
+
+
+def test_pooled_reports_do_not_hold_a_worker(seed):
+    for port in (40001, 40002, 40003):
+        register(seed, port)
+    pool = ConnectionPool()
+    for reporter in (40002, 40003):
+        report = f"Dead Nodes:{int(time.time())}:127.0.0.1:{reporter}:127.0.0.1:40001"
+        pool.send("127.0.0.1", seed.port, framing.encode_message(report))
+        # the seed closes the stream once the report is handled, the pool
+        # reconnects for the next one
+        wait_until(lambda: seed.inbound.metrics()["busy"] == 0)
+        wait_until(lambda: pool.is_stale(pool.get_connection(("127.0.0.1", seed.port))))
+    wait_until(lambda: len(seed.registry) == 2)
+    assert pool.metrics()["connects"] == 2
+    pool.close()
+
+
+def test_one_reporter_cannot_remove_a_peer(seed):
+    for port in (40001, 40002):
+        register(seed, port)
+    report = f"Dead Nodes:{int(time.time())}:127.0.0.1:40002:127.0.0.1:40001"
+    for _ in range(3):
+        with socket.create_connection(("127.0.0.1", seed.port), timeout=5) as sock:
+            sock.sendall(framing.encode_message(report))
+    wait_until(lambda: seed.dead_votes.metrics()["duplicates"] == 2)
+    assert ("127.0.0.1", 40001) in seed.registry
@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+from gossip_cache import message_digest
+from node_log import OutputLog
+from scheduler import VirtualScheduler
+from sim_node import SimNetwork, SimPeerNode
+from snapshot import PeerSnapshot, decode_snapshot, load_snapshot
+
+DIGEST = message_digest("Gossip Message:1700000000:127.0.0.1:24009")
+
+
+class QuietLog(OutputLog):
+    def __init__(self):
+        super().__init__(None, quiet=True)
+
+    def write(self, message):
+        pass
+
+
+def test_round_trip():
+    snapshot = PeerSnapshot(24001, 12.5, ["24002", "24003"], ["24002"], [("24003", 2)], [(DIGEST, 30.0)])
+    decoded = decode_snapshot(snapshot.encode())
+    assert decoded.port == 24001
+    assert decoded.written_at == 12.5
+    assert decoded.known == ["24002", "24003"]
+    assert decoded.neighbours == ["24002"]
+    assert decoded.failures == [("24003", 2)]
+    assert decoded.digests == [(DIGEST, 30.0)]
+
+
+@pytest.mark.parametrize("damage", [lambda data: b"", lambda data: data[:-3], lambda data: b"XXXX" + data[4:]])
+def test_missing_or_damaged_snapshot_loads_as_none(tmp_path, damage):
+    path = tmp_path / "peer.snapshot"
+    assert load_snapshot(str(path)) is None
+    data = PeerSnapshot(24001, 0.0, ["24002"], [], [], [(DIGEST, 30.0)]).encode()
+    path.write_bytes(damage(data))
+    assert load_snapshot(str(path)) is None
+
+
+def sim_peer(network, port, path):
+    peer = SimPeerNode("127.0.0.1", port, network)
+    peer.log = QuietLog()
+    peer.snapshot_path = path
+    network.attach(port, peer)
+    return peer
+
+
+@pytest.fixture
+def network():
+    return SimNetwork(VirtualScheduler(), rng=random.Random(1))
+
+
+def test_restart_resumes_from_the_snapshot(network, tmp_path):
+    path = str(tmp_path / "peer.snapshot")
+    first = sim_peer(network, 24001, path)
+    neighbour = sim_peer(network, 24002, None)
+    first.topology.admit(["24002", "24003"])
+    first.peer_table.add_neighbour("24002")
+    first.seen_messages.check_and_add(DIGEST)
+    first.save_snapshot()
+    first.stop()
+
+    network.scheduler.run_until(60.0)
+    restarted = sim_peer(network, 24001, path)
+    assert restarted.restore_snapshot()
+    assert sorted(restarted.peer_table.known_peers()) == ["24002", "24003"]
+    assert DIGEST in restarted.seen_messages
+    network.scheduler.run_until(61.0)
+    # the old neighbour is asked first and accepts
+    assert "24001" in neighbour.peer_table.neighbours()
+
+
+def test_stale_or_foreign_snapshot_is_ignored(network, tmp_path):
+    path = str(tmp_path / "peer.snapshot")
+    PeerSnapshot(24009, 0.0, ["24002"]).save(path)
+    assert not sim_peer(network, 24001, path).restore_snapshot()
+    PeerSnapshot(24001, 0.0, ["24002"]).save(path)
+    network.scheduler.run_until(301.0)
+    peer = sim_peer(network, 24001, path)
+    assert not peer.restore_snapshot()
+    assert not peer.peer_table.known_peers()
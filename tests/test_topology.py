@@ -0,0 +1,96 @@
+import random
+
+import pytest
+
+from node_log import OutputLog
+from scheduler import VirtualScheduler
+from sim_node import SimNetwork, SimPeerNode, SimSeedNode
+from topology import TopologyManager
+
+
+class QuietLog(OutputLog):
+    def __init__(self):
+        super().__init__(None, quiet=True)
+
+    def write(self, message):
+        pass
+
+
+def overlay(count, **topology):
+    network = SimNetwork(VirtualScheduler(), rng=random.Random(1))
+    seed = SimSeedNode("127.0.0.1", 24000, network, random.Random(2))
+    seed.log = QuietLog()
+    seed.start()
+    peers = []
+    for i in range(count):
+        peer = SimPeerNode("127.0.0.1", 24001 + i, network)
+        peer.log = QuietLog()
+        peer.rng = random.Random(i)
+        peer.gossip_count = 0
+        peer.topology = TopologyManager(peer, **topology)
+        network.scheduler.call_later(i * 0.1, peer.start)
+        peers.append(peer)
+    return network, peers
+
+
+def components(peers):
+    graph = {str(peer.port): set() for peer in peers}
+    for peer in peers:
+        for neighbour in peer.peer_table.neighbours():
+            if neighbour in graph:
+                graph[str(peer.port)].add(neighbour)
+                graph[neighbour].add(str(peer.port))
+    count = 0
+    unvisited = set(graph)
+    while unvisited:
+        count += 1
+        frontier = [unvisited.pop()]
+        while frontier:
+            port = frontier.pop()
+            for neighbour in graph[port] & unvisited:
+                unvisited.discard(neighbour)
+                frontier.append(neighbour)
+    return count
+
+
+def test_overlay_is_connected_with_bounded_degree():
+    network, peers = overlay(30, target_degree=4, max_degree=8)
+    network.scheduler.run_until(60.0)
+    for peer in peers:
+        assert 1 <= len(peer.peer_table.neighbours()) <= 8
+    assert components(peers) == 1
+
+
+@pytest.mark.parametrize("cache_size", [4, 8])
+def test_known_peers_stay_within_the_cache(cache_size):
+    network, peers = overlay(30, target_degree=3, max_degree=6, cache_size=cache_size)
+    network.scheduler.run_until(60.0)
+    for peer in peers:
+        assert len(peer.peer_table.known_peers()) <= cache_size
+    assert sum(peer.topology.stats["evicted"] for peer in peers) > 0
+
+
+def test_full_peer_rejects_new_neighbours():
+    network, peers = overlay(3, target_degree=1, max_degree=1, shuffle_interval=0)
+    network.scheduler.run_until(10.0)
+    first = peers[0]
+    neighbours = first.peer_table.neighbours()
+    assert len(neighbours) == 1
+    outsider = next(str(peer.port) for peer in peers[1:] if str(peer.port) not in neighbours)
+    first.topology.request_received(outsider)
+    assert first.peer_table.neighbours() == neighbours
+    assert first.topology.stats["rejected"] >= 1
+
+
+def test_dead_neighbours_are_replaced():
+    network, peers = overlay(20, target_degree=4, max_degree=8)
+    network.scheduler.run_until(30.0)
+    victim = peers[5]
+    linked = [peer for peer in peers if str(victim.port) in peer.peer_table.neighbours()]
+    assert linked
+    victim.stop()
+    network.scheduler.run_until(120.0)
+    for peer in linked:
+        assert str(victim.port) not in peer.peer_table.neighbours()
+        assert len(peer.peer_table.neighbours()) >= 1
+    assert components([peer for peer in peers if peer is not victim]) == 1
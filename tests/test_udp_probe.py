@@ -0,0 +1,108 @@
+import socket
+import threading
+
+from node_log import OutputLog
+from peer import PeerNode
+from udp_probe import ACK, PING, ProbeChannel, ProbeGroup, decode_datagram, encode_datagram
+
+
+class FakeNode:
+    def __init__(self, port):
+        self.port = port
+        self.stopped = threading.Event()
+        self.acknowledged = []
+        self.handled = []
+
+    def probe_acknowledged(self, port):
+        self.acknowledged.append(port)
+
+    def handle_message(self, message):
+        # parses like the peer does, "Liveness Request:bad" has a field too few
+        _, _, port = message.split(":")
+        self.handled.append(port)
+
+
+def round_trip(prober, target, ports, extra=""):
+    (endpoint, ping), = prober.pings(ports, extra)
+    assert endpoint == target.port
+    ack = target.received(ping)
+    if ack is not None:
+        prober.received(ack)
+    return ack
+
+
+def test_datagram_round_trip():
+    entries = [(24001, 24002, 7), (24001, 24003, 8)]
+    data = encode_datagram(PING, 24001, entries, "Membership:x")
+    assert decode_datagram(data) == (PING, 24001, entries, "Membership:x")
+
+
+def test_ack_of_the_latest_ping_counts():
+    prober = ProbeChannel(FakeNode(24001))
+    target = ProbeChannel(FakeNode(24002))
+    stale, = prober.pings([24002])
+    round_trip(prober, target, [24002])
+    assert prober.node.acknowledged == [24002]
+    # the ack to the earlier ping arrives late
+    prober.received(target.received(stale[1]))
+    assert prober.node.acknowledged == [24002]
+    assert prober.metrics()["stale_acks"] == 1
+
+
+def test_group_answers_for_every_member():
+    group = ProbeGroup()
+    first = ProbeChannel(FakeNode(24002), group)
+    second = ProbeChannel(FakeNode(24003), group)
+    first.start()
+    second.start()
+    prober = ProbeChannel(FakeNode(24001))
+    # both probes go to the peers themselves first, the acks name the home
+    for port, target in ((24002, first), (24003, second)):
+        round_trip(prober, target, [port])
+    datagrams = prober.pings([24002, 24003])
+    assert [endpoint for endpoint, _ in datagrams] == [24002]
+    second.node.stopped.set()
+    kind, _, entries, _ = decode_datagram(first.received(datagrams[0][1]))
+    assert kind == ACK
+    assert [entry[1] for entry in entries] == [24002]
+
+
+def test_garbage_is_counted_not_raised():
+    channel = ProbeChannel(FakeNode(24002))
+    assert channel.received(b"\x00\x01") is None
+    assert channel.received(b"GET / HTTP/1.0\r\n") is None
+    assert channel.metrics()["invalid"] == 2
+
+
+def test_malformed_piggyback_still_gets_an_ack():
+    prober = ProbeChannel(FakeNode(24001))
+    target = ProbeChannel(FakeNode(24002))
+    assert round_trip(prober, target, [24002], "Liveness Request:bad") is not None
+    assert prober.node.acknowledged == [24002]
+    assert target.metrics()["invalid_extra"] == 1
+    round_trip(prober, target, [24002], "Liveness Request:1:24001")
+    assert target.node.handled == ["24001"]
+
+
+def test_peer_keeps_answering_after_a_bad_datagram(tmp_path):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    node = PeerNode("127.0.0.1", port)
+    node.log = OutputLog(str(tmp_path / "output.txt"), quiet=True)
+    node.liveness_transport = "udp"
+    node.start_probes()
+    prober = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    prober.bind(("127.0.0.1", 0))
+    prober.settimeout(5)
+    me = prober.getsockname()[1]
+    try:
+        for sequence, extra in ((1, "Liveness Request:bad"), (2, "")):
+            prober.sendto(encode_datagram(PING, me, [(me, port, sequence)], extra), ("127.0.0.1", port))
+            kind, _, entries, _ = decode_datagram(prober.recv(65535))
+            assert kind == ACK
+            assert entries == [(me, port, sequence)]
+    finally:
+        prober.close()
+        node.stopped.set()
+        node.stop_probes()
@@ -0,0 +1,208 @@
+import threading
+import time
+
+import pytest
+
+from liveness import LivenessMonitor
+from metrics import Metrics
+from scheduler import VirtualScheduler
+from worker_pool import WorkerPool
+
+
+def blocked_pool(policy, queue_size=1):
+    # one worker held busy until the returned event is set
+    pool = WorkerPool(max_workers=1, queue_size=queue_size, policy=policy, name=f"{policy}-pool")
+    release = threading.Event()
+    running = threading.Event()
+
+    def block():
+        running.set()
+        release.wait(5)
+
+    pool.submit(block)
+    assert running.wait(5)
+    return pool, release
+
+
+def drain(pool, count):
+    # wait until count tasks have completed
+    deadline = time.monotonic() + 5
+    while pool.metrics()["completed"] < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        WorkerPool(policy="lifo")
+
+
+def test_runs_submitted_tasks():
+    pool = WorkerPool(max_workers=4, queue_size=8, policy="delay")
+    results = []
+    lock = threading.Lock()
+
+    def task(value):
+        with lock:
+            results.append(value)
+
+    for value in range(20):
+        assert pool.submit(task, value)
+    drain(pool, 20)
+    assert sorted(results) == list(range(20))
+    assert pool.metrics()["peak_workers"] <= 4
+
+
+def test_reject_sheds_the_new_task():
+    pool, release = blocked_pool("reject")
+    dropped = []
+    assert pool.submit(dropped.append, "queued", on_drop=lambda: dropped.append("first"))
+    assert not pool.submit(dropped.append, "late", on_drop=lambda: dropped.append("second"))
+    assert dropped == ["second"]
+    release.set()
+    drain(pool, 2)
+    assert dropped == ["second", "queued"]
+    assert pool.metrics()["rejected"] == 1
+
+
+def test_drop_oldest_sheds_the_waiting_task():
+    pool, release = blocked_pool("drop-oldest")
+    ran = []
+    dropped = []
+    pool.submit(ran.append, "old", on_drop=lambda: dropped.append("old"))
+    assert pool.submit(ran.append, "new", on_drop=lambda: dropped.append("new"))
+    assert dropped == ["old"]
+    release.set()
+    drain(pool, 2)
+    assert ran == ["new"]
+    assert pool.metrics()["dropped"] == 1
+
+
+def test_delay_waits_for_room():
+    pool, release = blocked_pool("delay")
+    ran = []
+    pool.submit(ran.append, 1)
+    submitted = threading.Event()
+
+    def submit_late():
+        pool.submit(ran.append, 2)
+        submitted.set()
+
+    threading.Thread(target=submit_late).start()
+    assert not submitted.wait(0.2)
+    release.set()
+    assert submitted.wait(5)
+    drain(pool, 3)
+    assert ran == [1, 2]
+    assert pool.metrics()["delayed"] == 1
+
+
+def test_delay_runs_a_worker_submission_in_place():
+    pool = WorkerPool(max_workers=1, queue_size=0, policy="delay")
+    ran = []
+    done = threading.Event()
+
+    def parent():
+        # the only worker is busy with us, waiting for room would deadlock
+        pool.submit(ran.append, "child")
+        done.set()
+
+    pool.submit(parent)
+    assert done.wait(5)
+    assert ran == ["child"]
+    assert pool.metrics()["caller_runs"] == 1
+
+
+def test_failing_task_goes_to_the_error_hook(capsys):
+    errors = []
+    pool = WorkerPool(max_workers=1, queue_size=4, name="failing",
+                      on_error=lambda target, error: errors.append((target, type(error))))
+    pool.submit(int, "not a number")
+    pool.submit(int, "7")
+    drain(pool, 2)
+    assert errors == [(int, ValueError)]
+    assert pool.metrics()["failed"] == 1
+    assert capsys.readouterr() == ("", "")
+
+
+def test_stop_drops_queued_tasks():
+    pool, release = blocked_pool("reject", queue_size=4)
+    dropped = []
+    pool.submit(print, on_drop=lambda: dropped.append(1))
+    pool.stop()
+    assert dropped == [1]
+    assert not pool.submit(print, on_drop=lambda: dropped.append(2))
+    assert dropped == [1, 2]
+    release.set()
+
+
+def test_worker_threads_are_numbered():
+    pool = WorkerPool(max_workers=3, queue_size=0, name="numbered")
+    release = threading.Event()
+    for _ in range(3):
+        pool.submit(release.wait, 5)
+    names = [thread.name for thread in threading.enumerate() if thread.name.startswith("numbered")]
+    assert sorted(names) == ["numbered-1", "numbered-2", "numbered-3"]
+    release.set()
+
+
+class SheddingNode:
+    # a node whose task pool sheds every liveness batch
+    def __init__(self):
+        self.scheduler = VirtualScheduler()
+        self.log = None
+        self.failures = []
+
+    def send_liveness_batch(self, ports):
+        raise AssertionError("shed batches are not sent")
+
+    def run_task(self, target, *args, on_drop=None):
+        on_drop()
+
+    def record_liveness_failure(self, port):
+        self.failures.append(port)
+
+
+def test_shed_liveness_batch_is_no_failure():
+    node = SheddingNode()
+    liveness = LivenessMonitor(node, interval=1.0, tick=0.1, initial_timeout=0.5)
+    liveness.track(24001)
+    liveness.start()
+    node.scheduler.run_until(10.0)
+    assert node.failures == []
+    metrics = liveness.metrics()
+    assert metrics["shed"] > 0
+    assert metrics["probes"] == 0
+    assert metrics["timeouts"] == 0
+
+
+class ProbingNode(SheddingNode):
+    # answers every probe right away
+    def __init__(self):
+        super().__init__()
+        self.probed = []
+        self.liveness = None
+        self.metrics = Metrics()
+
+    def run_task(self, target, *args, on_drop=None):
+        target(*args)
+
+    def send_liveness_batch(self, ports):
+        self.probed.append(self.scheduler.now())
+        for port in ports:
+            self.scheduler.call_later(0.01, self.liveness.reply_received, port)
+
+
+def test_probe_soon_adds_one_probe_without_doubling_the_schedule():
+    node = ProbingNode()
+    node.liveness = LivenessMonitor(node, interval=10.0, jitter=0.0, tick=0.1)
+    node.liveness.track(24001)
+    node.liveness.start()
+    node.scheduler.run_until(20.0)
+    probed = len(node.probed)
+    node.liveness.probe_soon(24001)
+    node.scheduler.run_until(100.0)
+    # the extra probe, then one per interval from there on
+    assert node.probed[probed] < 20.2
+    assert len(node.probed) - probed == 8
+    assert node.failures == []
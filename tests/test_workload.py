@@ -0,0 +1,108 @@
+import random
+
+import pytest
+
+from dissemination import make_strategy
+from node_log import OutputLog
+from scheduler import VirtualScheduler
+from sim_node import SimNetwork, SimPeerNode
+from workload import GossipWorkload, TokenBucket, parse_payload_sizes
+
+
+class FakeClock:
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+class QuietLog(OutputLog):
+    def __init__(self):
+        super().__init__(None, quiet=True)
+
+    def write(self, message):
+        pass
+
+
+def test_token_bucket_delays_takes_beyond_the_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10.0, capacity=2.0, clock=clock)
+    assert bucket.take(2) == 0.0
+    assert bucket.take(1) == pytest.approx(0.1)
+    clock.time = 10.0
+    # saved up tokens are capped at the capacity
+    assert bucket.take(2) == 0.0
+    assert bucket.take(1) == pytest.approx(0.1)
+
+
+@pytest.mark.parametrize(
+    "spec, parsed",
+    [("256", ("fixed", 256, None)), ("64-1024", ("uniform", 64, 1024)), ("exp:256", ("exp", 256.0, None))],
+)
+def test_payload_specs(spec, parsed):
+    assert parse_payload_sizes(spec) == parsed
+
+
+def test_payloads_are_distinct_and_sized():
+    workload = GossipWorkload(payload="100-200", rng=random.Random(1))
+    payloads = [workload.payload() for _ in range(50)]
+    assert len(set(payloads)) == 50
+    assert all(100 <= len(payload) <= 200 for payload in payloads)
+
+
+def test_unknown_arrival_process():
+    with pytest.raises(ValueError):
+        GossipWorkload(arrivals="bursty")
+
+
+def test_poisson_gaps_average_to_the_rate():
+    workload = GossipWorkload(rate=20.0, burst=2, arrivals="poisson", rng=random.Random(1))
+    gaps = [workload.next_gap() for _ in range(5000)]
+    assert sum(gaps) / len(gaps) == pytest.approx(0.1, rel=0.05)
+
+
+def test_workload_stops_after_count_or_duration():
+    clock = FakeClock()
+    workload = GossipWorkload(burst=3, count=7)
+    workload.start(clock)
+    sizes = []
+    while workload.next_burst(clock()):
+        sizes.append(workload.next_burst(clock()))
+        for _ in range(sizes[-1]):
+            workload.payload()
+    assert sizes == [3, 3, 1]
+    timed = GossipWorkload(duration=5.0)
+    timed.start(clock)
+    assert timed.next_burst(4.9) == 1
+    assert timed.next_burst(5.0) == 0
+
+
+def sim_pair(batch_size):
+    network = SimNetwork(VirtualScheduler(), rng=random.Random(1))
+    sender, receiver = (SimPeerNode("127.0.0.1", port, network) for port in (24001, 24002))
+    for peer, neighbour in ((sender, "24002"), (receiver, "24001")):
+        peer.log = QuietLog()
+        peer.strategy = make_strategy("push", rng=peer.rng)
+        peer.gossip_batch_size = batch_size
+        peer.peer_table.add_neighbour(neighbour)
+        network.attach(peer.port, peer)
+    return network, sender, receiver
+
+
+def test_max_rate_caps_origination():
+    network, sender, _ = sim_pair(1)
+    sender.workload = GossipWorkload(rate=100.0, max_rate=10.0, count=1000)
+    sender.start_workload()
+    network.scheduler.run_until(10.0)
+    originated = sender.dissemination_stats.metrics()["originated"]
+    assert 95 <= originated <= 102
+
+
+def test_forwarding_batches_messages():
+    network, sender, receiver = sim_pair(16)
+    sender.workload = GossipWorkload(rate=1000.0, burst=10, count=100)
+    sender.start_workload()
+    network.scheduler.run_until(5.0)
+    assert receiver.dissemination_stats.metrics()["delivered"] == 100
+    assert sender.metrics.snapshot()["counters"]["gossip_batches"] < 20
@@ -0,0 +1,200 @@
+import threading
+
+
+class TopologyManager:
+    # Keeps the neighbour set of one peer close to target_degree. Links are
+    # symmetric: a Neighbour Request makes both ends neighbours, unless the
+    # other end is already at max_degree and answers Neighbour Reject. The
+    # known peers are a bounded cache of candidates kept fresh by a Cyclon
+    # style shuffle with a random neighbour, and a background repair round
+    # replaces neighbours that died, asking a seed for more peers when no
+    # candidate is left. The result is a connected random overlay with
+    # bounded degree, so gossip reaches N peers in O(log N) hops.
+    def __init__(self, node, target_degree=4, max_degree=8, cache_size=64,
+                 shuffle_interval=5.0, shuffle_length=4, repair_interval=2.0):
+        self.node = node
+        self.target_degree = target_degree
+        self.max_degree = max_degree
+        self.cache_size = cache_size
+        self.shuffle_interval = shuffle_interval
+        self.shuffle_length = shuffle_length
+        self.repair_interval = repair_interval
+        self.pending = set()  # neighbour requests in flight
+        self.offered = {}  # neighbour port -> entries sent in our shuffle request
+        self.seed_cursor = 0
+        self.lock = threading.Lock()
+        self.stats = {
+            "requests": 0, "accepted": 0, "rejected": 0, "repairs": 0,
+            "shuffles": 0, "rotations": 0, "evicted": 0, "seed_refills": 0,
+        }
+
+    def start(self):
+        self.node.run_periodic(self.repair_interval, self.repair)
+        if self.shuffle_interval:
+            self.node.run_periodic(self.shuffle_interval, self.shuffle)
+
+    def candidates(self):
+        # known peers that are no neighbours yet, then peers the membership
+        # updates reported alive, which join the cache and its liveness
+        # probes first like any other entry
+        table = self.node.peer_table
+        taken = set(table.neighbours()) | self.pending
+        candidates = [port for port in table.known_peers() if port not in taken]
+        if not candidates:
+            candidates = self.admit(
+                port for port in self.node.membership.alive_peers() if port not in taken
+            )
+        return candidates
+
+    def admit(self, ports):
+        # Adds peers to the cache of known peers and tracks their liveness,
+        # returns the ones added. The cache holds at most cache_size peers: a
+        # full cache drops its oldest entries that are no neighbours, and
+        # what still does not fit is left out.
+        table = self.node.peer_table
+        new = []
+        for port in map(str, ports):
+            if port == str(self.node.port) or port in new:
+                continue
+            if not table.is_known(port) and not table.is_dead(port):
+                new.append(port)
+        known = table.known_peers()
+        excess = len(known) + len(new) - self.cache_size
+        if excess > 0:
+            keep = set(table.neighbours()) | self.pending
+            evict = [port for port in known if port not in keep][:excess]
+            for port in table.remove_known(evict):
+                self.node.liveness.untrack(port)
+            self.stats["evicted"] += len(evict)
+            new = new[:max(self.cache_size - len(known) + len(evict), 0)]
+        added = table.add_known(new)
+        for port in added:
+            self.node.liveness.track(port)
+        return added
+
+    def fill(self):
+        # request neighbours until the target degree, returns how many are
+        # still missing for lack of candidates
+        with self.lock:
+            missing = self.target_degree - len(self.node.peer_table.neighbours()) - len(self.pending)
+            if missing <= 0:
+                return 0
+            candidates = self.candidates()
+            chosen = self.node.rng.sample(candidates, min(missing, len(candidates)))
+            self.pending.update(chosen)
+            self.stats["requests"] += len(chosen)
+        for port in chosen:
+            self.node.run_task(self.node.connect_to_peernode, int(port))
+        return missing - len(chosen)
+
+    def rejoin(self, ports):
+        # neighbours from before a restart are asked first
+        with self.lock:
+            taken = set(self.node.peer_table.neighbours()) | self.pending
+            chosen = [port for port in ports if port not in taken][:self.target_degree]
+            self.pending.update(chosen)
+            self.stats["requests"] += len(chosen)
+        for port in chosen:
+            self.node.run_task(self.node.connect_to_peernode, int(port))
+
+    def connected(self, port):
+        with self.lock:
+            self.pending.discard(str(port))
+
+    def connect_failed(self, port):
+        with self.lock:
+            self.pending.discard(str(port))
+
+    def request_received(self, port):
+        # another peer asks to become our neighbour
+        table = self.node.peer_table
+        if table.is_dead(port):
+            return
+        self.admit([port])
+        if port not in table.neighbours() and len(table.neighbours()) >= self.max_degree:
+            self.stats["rejected"] += 1
+            self.node.run_task(self.node.send_peer_message, port, f"Neighbour Reject:{self.node.port}")
+            return
+        self.stats["accepted"] += 1
+        table.reset_failures(port)
+        table.add_neighbour(port)
+        # probed even when a full cache left it out
+        self.node.liveness.track(port)
+
+    def rejected(self, port):
+        self.node.peer_table.remove_neighbour(port)
+        self.fill()
+
+    def repair(self):
+        if self.fill() > 0 and self.node.seeds_list:
+            self.stats["seed_refills"] += 1
+            seed_port = self.node.rng.choice(self.node.seeds_list)
+            self.node.run_task(self.node.request_more_peers, seed_port, self.seed_cursor, self.cache_size)
+        else:
+            self.stats["repairs"] += 1
+
+    def shuffle(self):
+        # Cyclon: offer ourselves and a few cached peers to a random
+        # neighbour, it answers with as many of its own
+        neighbours = self.node.peer_table.neighbours()
+        if not neighbours:
+            return
+        target = self.node.rng.choice(neighbours)
+        known = [port for port in self.node.peer_table.known_peers() if port != target]
+        sent = self.node.rng.sample(known, min(self.shuffle_length - 1, len(known)))
+        with self.lock:
+            self.offered[target] = sent
+        self.stats["shuffles"] += 1
+        offer = ",".join([str(self.node.port)] + sent)
+        self.node.run_task(self.node.send_peer_message, target, f"Shuffle Request:{self.node.port}:{offer}")
+        # Rotate one link to a peer from the shuffled cache. Without it the
+        # first peers fill up and later ones only link to recent joiners,
+        # which stretches the overlay into a long chain.
+        if len(neighbours) >= self.target_degree:
+            old = self.node.rng.choice(neighbours)
+            self.node.peer_table.remove_neighbour(old)
+            self.stats["rotations"] += 1
+            self.node.run_task(self.node.send_peer_message, old, f"Neighbour Reject:{self.node.port}")
+            self.fill()
+
+    def shuffle_received(self, message):
+        # Shuffle Request:<port>:<ports> or Shuffle Reply:<port>:<ports>
+        kind, port, entries = message.split(":", 2)
+        received = [entry for entry in entries.split(",") if entry]
+        if kind == "Shuffle Request":
+            known = [
+                entry for entry in self.node.peer_table.known_peers()
+                if entry != port and entry not in received
+            ]
+            sent = self.node.rng.sample(known, min(self.shuffle_length, len(known)))
+            reply = f"Shuffle Reply:{self.node.port}:{','.join(sent)}"
+            self.node.run_task(self.node.send_peer_message, port, reply)
+        else:
+            with self.lock:
+                sent = self.offered.pop(port, [])
+        self.merge(received, sent)
+
+    def merge(self, received, sent):
+        # Add the received entries. A full cache makes room by dropping the
+        # entries we handed out (never neighbours), as Cyclon swaps them.
+        table = self.node.peer_table
+        new = [
+            port for port in received
+            if port != str(self.node.port) and not table.is_known(port) and not table.is_dead(port)
+        ]
+        room = self.cache_size - len(table.known_peers())
+        if len(new) > room:
+            neighbours = set(table.neighbours())
+            evict = [port for port in sent if port not in neighbours][:len(new) - room]
+            for port in table.remove_known(evict):
+                self.node.liveness.untrack(port)
+            self.stats["evicted"] += len(evict)
+            new = new[:max(room, 0) + len(evict)]
+        self.admit(new)
+
+    def metrics(self):
+        return dict(
+            self.stats,
+            degree=len(self.node.peer_table.neighbours()),
+            known=len(self.node.peer_table.known_peers()),
+        )
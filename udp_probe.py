@@ -0,0 +1,189 @@
+import struct
+import threading
+
+MAGIC = 0xB9
+PING = 1
+ACK = 2
+HEADER = struct.Struct(">BBHH")  # magic, kind, home port of the sender's group, entries
+ENTRY = struct.Struct(">HHI")  # prober port, probed port, sequence number
+# a full ping plus a piggybacked membership update stays below the MTU
+MAX_ENTRIES = 128
+
+
+def encode_datagram(kind, home, entries, extra=""):
+    # extra is a piggybacked text message, such as a membership update
+    return (
+        HEADER.pack(MAGIC, kind, home, len(entries))
+        + b"".join(ENTRY.pack(*entry) for entry in entries)
+        + extra.encode()
+    )
+
+
+def decode_datagram(data):
+    magic, kind, home, count = HEADER.unpack_from(data)
+    if magic != MAGIC or kind not in (PING, ACK):
+        raise ValueError("not a liveness datagram")
+    offset = HEADER.size
+    entries = [ENTRY.unpack_from(data, offset + i * ENTRY.size) for i in range(count)]
+    extra = bytes(data[offset + count * ENTRY.size:]).decode()
+    return kind, home, entries, extra
+
+
+class ProbeGroup:
+    # The probe channels of the nodes in one process on one host. A ping
+    # reaching any member is answered for every probed member that is still
+    # running, so probes for nodes sharing a process travel in one datagram.
+    # Acks advertise the group's home, its lowest port, and probers send
+    # their next pings for the whole group there.
+    def __init__(self):
+        self.members = {}  # port -> ProbeChannel
+        self.lock = threading.Lock()
+
+    def join(self, channel):
+        with self.lock:
+            self.members[channel.port] = channel
+
+    def leave(self, port):
+        with self.lock:
+            self.members.pop(port, None)
+
+    def member(self, port):
+        return self.members.get(port)
+
+    def home(self, default):
+        with self.lock:
+            return min(self.members, default=default)
+
+
+groups = {}  # host -> ProbeGroup of this process
+groups_lock = threading.Lock()
+
+
+def process_group(host):
+    with groups_lock:
+        return groups.setdefault(host, ProbeGroup())
+
+
+class ProbeChannel:
+    # Sequence numbered ping/ack liveness probes over UDP: one round trip
+    # per probe instead of a connection each way, and a peer that stops
+    # answering is caught by the liveness timeout even while its ports
+    # stay open. Only the ack to a peer's latest ping counts, late acks of
+    # earlier pings are ignored. The node's transport (a socket thread, an
+    # asyncio endpoint or the simulated network) hands datagrams to
+    # received() and sends what pings() and received() return.
+    def __init__(self, node, group=None):
+        self.node = node
+        self.port = node.port
+        self.group = group
+        self.sequence = 0
+        self.outstanding = {}  # probed port -> sequence number of its latest ping
+        self.via = {}  # probed port -> endpoint port that answers for it
+        self.lock = threading.Lock()
+        self.stats = {
+            "pings": 0, "datagrams_sent": 0, "acks": 0, "stale_acks": 0,
+            "answered": 0, "datagrams_received": 0, "invalid": 0, "invalid_extra": 0,
+        }
+
+    def start(self):
+        if self.group is not None:
+            self.group.join(self)
+
+    def stop(self):
+        if self.group is not None:
+            self.group.leave(self.port)
+
+    def home(self):
+        if self.group is None:
+            return self.port
+        return self.group.home(self.port)
+
+    def pings(self, ports, extra=""):
+        # (endpoint port, datagram) pairs, one datagram per endpoint holds
+        # the pings of every probed peer it answers for
+        by_endpoint = {}
+        with self.lock:
+            for port in ports:
+                port = int(port)
+                self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+                self.outstanding[port] = self.sequence
+                entry = (self.port, port, self.sequence)
+                by_endpoint.setdefault(self.via.get(port, port), []).append(entry)
+        home = self.home()
+        datagrams = []
+        for endpoint, entries in by_endpoint.items():
+            for start in range(0, len(entries), MAX_ENTRIES):
+                chunk = entries[start:start + MAX_ENTRIES]
+                datagrams.append((endpoint, encode_datagram(PING, home, chunk, extra)))
+        with self.lock:
+            self.stats["pings"] += len(ports)
+            self.stats["datagrams_sent"] += len(datagrams)
+        return datagrams
+
+    def received(self, data):
+        # returns the ack to send back to the sender, if any
+        try:
+            kind, home, entries, extra = decode_datagram(data)
+        except (ValueError, struct.error):
+            with self.lock:
+                self.stats["invalid"] += 1
+            return None
+        with self.lock:
+            self.stats["datagrams_received"] += 1
+        if kind == PING:
+            return self.answer(entries, extra)
+        self.acknowledged(home, entries)
+        return None
+
+    def answer(self, entries, extra):
+        answered = []
+        reached = {}
+        for entry in entries:
+            probed = entry[1]
+            channel = self if probed == self.port else None
+            if channel is None and self.group is not None:
+                channel = self.group.member(probed)
+            if channel is None or channel.node.stopped.is_set():
+                continue
+            answered.append(entry)
+            reached[probed] = channel
+        for channel in reached.values():
+            if not extra:
+                continue
+            try:
+                channel.node.handle_message(extra)
+            except ValueError:
+                # a malformed piggybacked message does not cost the ack
+                with self.lock:
+                    self.stats["invalid_extra"] += 1
+        with self.lock:
+            self.stats["answered"] += len(answered)
+        if not answered:
+            return None
+        return encode_datagram(ACK, self.home(), answered)
+
+    def acknowledged(self, home, entries):
+        acked = []
+        with self.lock:
+            for prober, probed, sequence in entries:
+                if prober != self.port or self.outstanding.get(probed) != sequence:
+                    self.stats["stale_acks"] += 1
+                    continue
+                del self.outstanding[probed]
+                self.via[probed] = home
+                acked.append(probed)
+            self.stats["acks"] += len(acked)
+        for probed in acked:
+            self.node.probe_acknowledged(probed)
+
+    def unreachable(self, port):
+        # a ping went unanswered, possibly because the endpoint answering
+        # for the peer went away, so the next one goes to the peer itself
+        with self.lock:
+            self.via.pop(int(port), None)
+            self.outstanding.pop(int(port), None)
+
+    def metrics(self):
+        with self.lock:
+            routed = sum(1 for port, endpoint in self.via.items() if port != endpoint)
+            return dict(self.stats, outstanding=len(self.outstanding), routed=routed)
@@ -0,0 +1,154 @@
+import collections
+import socket
+import threading
+import time
+
+POLICIES = ("reject", "drop-oldest", "delay")
+# the task pool is fed by the timer thread and inbound workers, which must
+# never wait for room
+TASK_POLICIES = ("reject", "drop-oldest")
+
+
+def open_listener(host, port, backlog=128, reuse_address=True):
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if reuse_address:
+        # rebind right away after a restart, while old streams sit in TIME_WAIT
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind((host, port))
+    server_socket.listen(backlog)
+    return server_socket
+
+
+class WorkerPool:
+    # Runs tasks on at most max_workers threads with up to queue_size more
+    # waiting. Workers start on demand and exit after idle_timeout seconds
+    # without work. When the queue is full the policy sheds load: "reject"
+    # drops the new task, "drop-oldest" the one waiting longest, and "delay"
+    # makes the submitter wait for room, which leaves new connections in the
+    # listen backlog. A worker submitting to its own full pool under "delay"
+    # runs the task itself, so tasks that start tasks cannot deadlock.
+    # A dropped task's on_drop is called instead, e.g. to close its socket.
+    # A task that raises is counted as failed and reported to
+    # on_error(target, error), the node's log.
+    def __init__(self, max_workers=64, queue_size=1024, policy="reject",
+                 idle_timeout=5.0, name="worker", on_error=None):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown overload policy {policy!r}")
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.policy = policy
+        self.idle_timeout = idle_timeout
+        self.name = name
+        self.on_error = on_error
+        self.queue = collections.deque()  # (target, args, on_drop)
+        self.lock = threading.Lock()
+        self.work = threading.Condition(self.lock)
+        self.room = threading.Condition(self.lock)
+        self.workers = 0
+        self.idle = 0
+        self.started = 0  # workers started so far, numbers their threads
+        self.stopped = False
+        self.local = threading.local()
+        self.stats = {
+            "submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "dropped": 0,
+            "delayed": 0, "caller_runs": 0, "peak_queue": 0, "peak_workers": 0,
+        }
+
+    def full(self):
+        # every worker busy and queue_size tasks waiting for one
+        return self.workers >= self.max_workers and len(self.queue) - self.idle >= self.queue_size
+
+    def submit(self, target, *args, on_drop=None):
+        # False when the task was shed
+        accepted = True
+        shed = None
+        with self.lock:
+            self.stats["submitted"] += 1
+            if self.stopped:
+                self.stats["rejected"] += 1
+                accepted, shed = False, on_drop
+            elif self.full():
+                if self.policy == "reject":
+                    self.stats["rejected"] += 1
+                    accepted, shed = False, on_drop
+                elif self.policy == "drop-oldest":
+                    self.stats["dropped"] += 1
+                    shed = self.queue.popleft()[2]
+                elif getattr(self.local, "worker", False):
+                    self.stats["caller_runs"] += 1
+                    accepted = None
+                else:
+                    self.stats["delayed"] += 1
+                    while self.full() and not self.stopped:
+                        self.room.wait()
+                    if self.stopped:
+                        self.stats["rejected"] += 1
+                        accepted, shed = False, on_drop
+            if accepted:
+                self.queue.append((target, args, on_drop))
+                self.stats["peak_queue"] = max(self.stats["peak_queue"], len(self.queue))
+                if len(self.queue) > self.idle and self.workers < self.max_workers:
+                    self.workers += 1
+                    self.stats["peak_workers"] = max(self.stats["peak_workers"], self.workers)
+                    self.started += 1
+                    threading.Thread(
+                        target=self.worker, name=f"{self.name}-{self.started}", daemon=True
+                    ).start()
+                else:
+                    self.work.notify()
+        if shed is not None:
+            shed()
+        if accepted is None:
+            self.run(target, args)
+        return accepted is not False
+
+    def worker(self):
+        self.local.worker = True
+        while True:
+            with self.lock:
+                self.idle += 1
+                deadline = time.monotonic() + self.idle_timeout
+                while not self.queue and not self.stopped:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.work.wait(remaining)
+                self.idle -= 1
+                if not self.queue or self.stopped:
+                    self.workers -= 1
+                    return
+                target, args, _ = self.queue.popleft()
+                self.room.notify()
+            self.run(target, args)
+
+    def run(self, target, args):
+        try:
+            target(*args)
+        except Exception as error:
+            with self.lock:
+                self.stats["failed"] += 1
+            if self.on_error is not None:
+                self.on_error(target, error)
+        with self.lock:
+            self.stats["completed"] += 1
+
+    def stop(self):
+        # queued tasks are dropped, running ones finish
+        with self.lock:
+            self.stopped = True
+            queued = list(self.queue)
+            self.queue.clear()
+            self.work.notify_all()
+            self.room.notify_all()
+        for _, _, on_drop in queued:
+            if on_drop is not None:
+                on_drop()
+
+    def metrics(self):
+        with self.lock:
+            return dict(
+                self.stats,
+                queued=len(self.queue),
+                workers=self.workers,
+                busy=self.workers - self.idle,
+            )
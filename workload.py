@@ -0,0 +1,91 @@
+import random
+import time
+
+ARRIVALS = ("fixed", "poisson")
+
+
+class TokenBucket:
+    # rate tokens per second, at most capacity of them saved up. take()
+    # reserves tokens and returns how long to wait before using them, so it
+    # works the same on wall clock and virtual time.
+    def __init__(self, rate, capacity=1.0, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def take(self, tokens=1):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= tokens
+        return max(0.0, -self.tokens / self.rate)
+
+
+def parse_payload_sizes(spec):
+    # "256" fixed, "64-1024" uniform, "exp:256" exponential with that mean
+    if spec.startswith("exp:"):
+        return "exp", float(spec[4:]), None
+    if "-" in spec:
+        low, high = spec.split("-", 1)
+        return "uniform", int(low), int(high)
+    return "fixed", int(spec), None
+
+
+class GossipWorkload:
+    # Originates gossip at rate messages per second on average, burst
+    # messages at a time. Arrivals are evenly spaced or a Poisson process,
+    # and a token bucket (max_rate, burst deep) caps the rate, so Poisson
+    # clumps are smoothed out. Each payload starts with a sequence number,
+    # which keeps messages of the same second distinct, followed by filler
+    # up to a size drawn from the payload distribution. Stops after count
+    # messages or duration seconds, whichever comes first.
+    def __init__(self, rate=10.0, burst=1, arrivals="fixed", payload="0", max_rate=None,
+                 count=None, duration=None, rng=None):
+        if arrivals not in ARRIVALS:
+            raise ValueError(f"unknown arrival process {arrivals!r}")
+        self.rate = rate
+        self.burst = burst
+        self.arrivals = arrivals
+        self.payload_sizes = parse_payload_sizes(payload)
+        self.max_rate = max_rate or rate
+        self.count = count
+        self.duration = duration
+        self.rng = rng or random.Random()
+        self.sequence = 0
+        self.bucket = None
+        self.deadline = None
+
+    def start(self, clock):
+        self.bucket = TokenBucket(self.max_rate, self.burst, clock)
+        if self.duration is not None:
+            self.deadline = clock() + self.duration
+
+    def next_gap(self):
+        # seconds until the next burst
+        mean = self.burst / self.rate
+        if self.arrivals == "poisson":
+            return self.rng.expovariate(1 / mean)
+        return mean
+
+    def next_burst(self, now):
+        # messages to originate now, 0 once the workload is done
+        if self.deadline is not None and now >= self.deadline:
+            return 0
+        if self.count is None:
+            return self.burst
+        return max(0, min(self.burst, self.count - self.sequence))
+
+    def payload_size(self):
+        kind, first, second = self.payload_sizes
+        if kind == "uniform":
+            return self.rng.randint(first, second)
+        if kind == "exp":
+            return int(self.rng.expovariate(1 / first)) if first else 0
+        return first
+
+    def payload(self):
+        self.sequence += 1
+        prefix = f"{self.sequence:x}."
+        return prefix + "x" * max(0, self.payload_size() - len(prefix))